@@ -0,0 +1,381 @@
+"""
+Pluggable analyzer backends for the chunk pipeline.
+
+A backend turns one SQL chunk into the 14-column lineage CSV produced by
+`dlineage.py /csv /traceView`:
+
+    backend = get_backend('subprocess', db_type='hive')
+    result = backend.analyze_file('chunks/p_load_1.sql')
+    result.csv_text, result.errors, result.timings
+
+SubprocessBackend is the production path (one dlineage.py process per chunk).
+JvmBackend keeps one JVM in this process and builds the lineage rows straight
+from the dataflow relationships (result.records), without the CSV round trip.
+StubBackend derives plausible lineage from the SQL text in pure Python, with
+deterministic ids, so the rest of the pipeline can be load-tested without a JVM
+or the 10,000 character limit.
+"""
+import csv
+import io
+import os
+import re
+import subprocess
+import sys
+import time
+import zlib
+
+from main_to_json import (_find_top_level_keyword, _parse_insert_with_columns, _split_by_top_level_commas,
+                          _split_insert_prefix, _split_select_clause, extract_table_name_from_create,
+                          extract_table_name_from_insert)
+
+SQLFLOW_ANALYZER_BACKEND = os.getenv("SQLFLOW_ANALYZER_BACKEND", "subprocess")
+STUB_ANALYZER_LATENCY_MS = float(os.getenv("STUB_ANALYZER_LATENCY_MS", "0"))
+SQLFLOW_ENV_FILE = os.getenv("SQLFLOW_ENV_FILE") or None
+SQLFLOW_NATIVE_LINEAGE = os.getenv("SQLFLOW_NATIVE_LINEAGE", "false").lower() in ('1', 'true', 'yes', 'y')
+
+LINEAGE_CSV_HEADER = [
+    'SOURCE_DB', 'SOURCE_SCHEMA', 'SOURCE_TABLE_ID', 'SOURCE_TABLE',
+    'SOURCE_COLUMN_ID', 'SOURCE_COLUMN', 'TARGET_DB', 'TARGET_SCHEMA',
+    'TARGET_TABLE_ID', 'TARGET_TABLE', 'TARGET_COLUMN_ID', 'TARGET_COLUMN',
+    'RELATION_TYPE', 'EFFECTTYPE'
+]
+ERROR_LOG_MARKER = 'Error log:'
+
+
+class AnalyzerResult:
+    """records 为已按 14 列组织好的元组时，csv_text 只在落盘等需要时才生成"""
+
+    __slots__ = ('ok', '_csv_text', 'errors', 'timings', 'records')
+
+    def __init__(self, ok: bool, csv_text: str = '', errors: str = '', timings: dict | None = None,
+                 records: list[tuple] | None = None):
+        self.ok = ok
+        self._csv_text = csv_text
+        self.errors = errors
+        self.timings = timings or {}
+        self.records = records
+
+    @property
+    def csv_text(self) -> str:
+        if not self._csv_text and self.records is not None:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator='\n')
+            writer.writerow(LINEAGE_CSV_HEADER)
+            writer.writerows(self.records)
+            self._csv_text = buffer.getvalue()
+        return self._csv_text
+
+
+def split_error_log(stdout: str) -> tuple[str, str]:
+    """dlineage 会在 CSV 结果后追加错误日志，拆成 (csv, 错误日志)"""
+    idx = stdout.find(ERROR_LOG_MARKER)
+    if idx == -1:
+        return stdout, ''
+    csv_text = stdout[:idx].rstrip('\r\n')
+    if csv_text:
+        csv_text += '\n'
+    return csv_text, stdout[idx + len(ERROR_LOG_MARKER):].strip()
+
+
+def parse_analyzer_timings(stderr: str) -> dict[str, float]:
+    """解析 dlineage.py 在 SQLFLOW_TIMING 开启时输出到 stderr 的耗时行"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith('SQLFLOW_TIMING '):
+            continue
+        for item in line.split()[1:]:
+            key, _, value = item.partition('=')
+            try:
+                timings[key] = float(value)
+            except ValueError:
+                continue
+    return timings
+
+
+class AnalyzerBackend:
+    name = 'base'
+    # 同一实例能否被多个线程同时调用（ChunkScheduler 据此决定并发数）
+    thread_safe = False
+
+    def __init__(self, db_type: str = 'mysql'):
+        self.db_type = db_type
+
+    def analyze_file(self, sql_file: str) -> AnalyzerResult:
+        with open(sql_file, 'r', encoding='utf-8') as f:
+            return self.analyze_text(f.read(), name=sql_file)
+
+    def analyze_text(self, sql_text: str, name: str | None = None) -> AnalyzerResult:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SubprocessBackend(AnalyzerBackend):
+    """每个 chunk 启动一次 dlineage.py（/csv /traceView）"""
+
+    name = 'subprocess'
+    thread_safe = True
+
+    def __init__(self, db_type: str = 'mysql', dlineage_script: str = 'dlineage.py',
+                 python: str = 'python3', timing: bool = False, native: bool = SQLFLOW_NATIVE_LINEAGE,
+                 env_file: str | None = SQLFLOW_ENV_FILE, timeout: float | None = None):
+        super().__init__(db_type)
+        self.dlineage_script = dlineage_script
+        # 超过 timeout 秒的 dlineage.py 进程会被终止
+        self.timeout = timeout
+        self.python = python
+        self.env = dict(os.environ, SQLFLOW_TIMING='1') if timing else None
+        # /native：CSV 由 Python 按关系遍历生成并正确转义，不再依赖列数纠正
+        self.output_args = ['/csv', '/traceView'] + (['/native'] if native else [])
+        if env_file:
+            # 每个子进程都要重新解析元数据；大元数据文件请用 JvmBackend
+            self.output_args += ['/env', env_file]
+
+    def command(self, sql_file: str) -> list[str]:
+        return [self.python, self.dlineage_script,
+                '/t', self.db_type,
+                '/f', sql_file] + self.output_args
+
+    def stdin_command(self) -> list[str]:
+        return [self.python, self.dlineage_script, '/t', self.db_type, '/stdin'] + self.output_args
+
+    def analyze_file(self, sql_file: str) -> AnalyzerResult:
+        return self._run(self.command(sql_file))
+
+    def analyze_text(self, sql_text: str, name: str | None = None) -> AnalyzerResult:
+        """通过 /stdin 把 SQL 直接交给 dlineage.py，不落临时文件"""
+        return self._run(self.stdin_command(), sql_text)
+
+    def _run(self, cmd: list[str], stdin_text: str | None = None) -> AnalyzerResult:
+        started = time.perf_counter()
+        try:
+            proc = subprocess.run(cmd, input=stdin_text, capture_output=True, text=True, env=self.env,
+                                  timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            # subprocess.run 超时会先 kill 子进程再抛出
+            return AnalyzerResult(False, errors=f"dlineage.py 超过 {self.timeout}s 未结束，已终止。",
+                                  timings={'wall': time.perf_counter() - started, 'timeout': self.timeout})
+        timings = parse_analyzer_timings(proc.stderr)
+        timings['wall'] = time.perf_counter() - started
+        if proc.returncode != 0:
+            return AnalyzerResult(False, errors=proc.stderr.strip(), timings=timings)
+        csv_text, errors = split_error_log(proc.stdout)
+        return AnalyzerResult(True, csv_text, errors, timings)
+
+
+class JvmBackend(AnalyzerBackend):
+    """在当前进程内启动一次 JVM，直接遍历 dataflow 关系得到血缘元组（不经 CSV）
+
+    env_file 为 /env 元数据 JSON；解析结果按 (路径, mtime, vendor) 缓存，各 chunk 只读共享。
+    """
+
+    name = 'jvm'
+
+    def __init__(self, db_type: str = 'mysql', env_file: str | None = SQLFLOW_ENV_FILE, env_cache: bool = True):
+        super().__init__(db_type)
+        import dlineage
+        self._dlineage = dlineage
+        started = time.perf_counter()
+        dlineage.start_jvm()
+        self.jvm_start = time.perf_counter() - started
+        self.env_file = env_file
+        self.env_cache = env_cache
+        self._vendor = None
+
+    def _sqlenv(self):
+        if not self.env_file:
+            return None
+        if self._vendor is None:
+            import jpype
+            self._vendor = jpype.JClass("gudusoft.gsqlparser.TGSqlParser").getDBVendorByName(self.db_type)
+        return self._dlineage.load_sqlenv(self.env_file, self._vendor, use_cache=self.env_cache)
+
+    def analyze_text(self, sql_text: str, name: str | None = None) -> AnalyzerResult:
+        started = time.perf_counter()
+        timings = {}
+        try:
+            sqlenv = self._sqlenv()
+            timings['env'] = time.perf_counter() - started
+            rows, errors = self._dlineage.analyze_sql_records(sql_text, self.db_type, sqlenv)
+        except Exception as e:
+            # JPype 会把 Java 异常包装成 Python 异常
+            timings['wall'] = time.perf_counter() - started
+            return AnalyzerResult(False, errors=str(e), timings=timings)
+        timings['wall'] = time.perf_counter() - started
+        timings['analyze'] = timings['wall'] - timings['env']
+        return AnalyzerResult(True, errors='\n'.join(errors), timings=timings, records=rows)
+
+    def close(self) -> None:
+        # JPype 不支持同一进程重启 JVM，进程退出时再关闭
+        pass
+
+
+# ---------- Stub：纯 Python 推导血缘 ----------
+_TABLE_REF_RE = re.compile(r'\b(?:FROM|JOIN)\s+([A-Za-z_][\w$#.]*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?',
+                           re.IGNORECASE)
+_IDENT_RE = re.compile(r'^(?:([A-Za-z_]\w*)\.)?([A-Za-z_][\w$#]*)$')
+_ALIAS_RE = re.compile(r'^(.*?)\s+(?:AS\s+)?([A-Za-z_][\w$#]*)$', re.IGNORECASE | re.DOTALL)
+_KEYWORDS = {'WHERE', 'GROUP', 'ORDER', 'LEFT', 'RIGHT', 'INNER', 'FULL', 'CROSS', 'JOIN', 'ON', 'UNION',
+             'HAVING', 'SELECT', 'OUTER'}
+# 与 dlineage 一致：DUAL 上的常量没有列级血缘
+_CONSTANT_TABLES = {'DUAL', 'SYS.DUAL'}
+
+
+def _stable_num(*parts: str) -> str:
+    return str(zlib.crc32('|'.join(parts).encode('utf-8')) % 100000)
+
+
+def _split_qualified(name: str) -> tuple[str, str]:
+    schema, _, table = name.rpartition('.')
+    return (schema or 'default'), name
+
+
+def _projection_parts(expr: str) -> tuple[str, str]:
+    """返回 (源表达式, 目标列名)"""
+    expr = expr.strip()
+    m = _ALIAS_RE.match(expr)
+    if m and m.group(2).upper() not in _KEYWORDS and not m.group(1).rstrip().endswith(('(', ',')):
+        return m.group(1).strip(), m.group(2)
+    ident = _IDENT_RE.match(expr)
+    return expr, ident.group(2) if ident else expr
+
+
+class StubBackend(AnalyzerBackend):
+    """确定性的桩分析器：同样输入永远得到同样的 14 列 CSV"""
+
+    name = 'stub'
+    thread_safe = True
+
+    def __init__(self, db_type: str = 'mysql', latency_ms: float = STUB_ANALYZER_LATENCY_MS,
+                 timeout: float | None = None):
+        super().__init__(db_type)
+        self.latency_ms = latency_ms
+        self.timeout = timeout
+
+    def _lineage_rows(self, sql_text: str) -> list[list[str]]:
+        stmt = sql_text.strip().rstrip(';').strip()
+        upper = stmt[:32].upper()
+        if upper.startswith('INSERT'):
+            target = extract_table_name_from_insert(stmt)
+            effect = 'insert'
+            parsed = _parse_insert_with_columns(stmt)
+            if parsed and parsed['type'] == 'values':
+                return []
+            if parsed:
+                pairs = [(proj, col) for proj, col in zip(parsed['projections'], parsed['columns'])]
+                tail = parsed['tail']
+            else:
+                _, rest = _split_insert_prefix(stmt)
+                pairs, tail = self._select_pairs(rest)
+        elif upper.startswith('CREATE'):
+            target = extract_table_name_from_create(stmt)
+            effect = 'create_table'
+            as_idx = _find_top_level_keyword(stmt, 'SELECT')
+            pairs, tail = self._select_pairs(stmt[as_idx:] if as_idx != -1 else '')
+        else:
+            return []
+        if not target or not pairs:
+            return []
+        sources = [(m.group(1), m.group(2)) for m in _TABLE_REF_RE.finditer(tail or '')
+                   if m.group(1).upper() not in _KEYWORDS and m.group(1).upper() not in _CONSTANT_TABLES
+                   and not m.group(1).startswith('(')]
+        if not sources:
+            return []
+        aliases = {(alias or name.rpartition('.')[2]).upper(): name for name, alias in sources}
+
+        tgt_schema, tgt_table = _split_qualified(target)
+        tgt_table_id = _stable_num('table', target)
+        rows = []
+        for idx, (expr, tgt_col) in enumerate(pairs):
+            src_expr, _ = _projection_parts(expr)
+            ident = _IDENT_RE.match(src_expr.strip())
+            if ident:
+                qualifier, src_col = ident.group(1), ident.group(2)
+                src_name = aliases.get((qualifier or '').upper(), sources[0][0])
+            else:
+                src_col = src_expr.strip()
+                src_name = sources[idx % len(sources)][0]
+            src_schema, src_table = _split_qualified(src_name)
+            tgt_col = tgt_col.strip().strip('"')
+            rows.append([
+                'default', src_schema, _stable_num('table', src_name), src_table,
+                _stable_num('column', src_name, src_col), src_col,
+                'default', tgt_schema, tgt_table_id, tgt_table,
+                _stable_num('column', target, tgt_col), tgt_col,
+                'direct', effect
+            ])
+        return rows
+
+    @staticmethod
+    def _select_pairs(select_sql: str) -> tuple[list[tuple[str, str]], str]:
+        select_sql = (select_sql or '').strip()
+        if select_sql.upper().startswith('WITH'):
+            idx = _find_top_level_keyword(select_sql, 'SELECT')
+            select_sql = select_sql[idx:] if idx != -1 else ''
+        projections, tail = _split_select_clause(select_sql)
+        if projections is None:
+            return [], ''
+        pairs = []
+        for expr in _split_by_top_level_commas(projections):
+            src_expr, tgt_col = _projection_parts(expr)
+            pairs.append((src_expr, tgt_col))
+        return pairs, tail
+
+    def analyze_text(self, sql_text: str, name: str | None = None) -> AnalyzerResult:
+        started = time.perf_counter()
+        rows = self._lineage_rows(sql_text)
+        if self.latency_ms:
+            # 模拟 JVM 分析耗时：按每千字符 latency_ms 计
+            latency = self.latency_ms * max(len(sql_text), 1) / 1000.0 / 1000.0
+            if self.timeout and latency > self.timeout:
+                time.sleep(self.timeout)
+                return AnalyzerResult(False, errors=f"stub 超过 {self.timeout}s 未结束，已终止。",
+                                      timings={'wall': time.perf_counter() - started, 'timeout': self.timeout})
+            time.sleep(latency)
+        lines = [','.join(LINEAGE_CSV_HEADER)]
+        for row in rows:
+            lines.append(','.join(_csv_cell(cell) for cell in row))
+        elapsed = time.perf_counter() - started
+        return AnalyzerResult(True, '\n'.join(lines) + '\n', '', {'analyze': elapsed, 'wall': elapsed})
+
+
+def _csv_cell(value: str) -> str:
+    if any(ch in value for ch in ',"\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+_BACKENDS = {
+    SubprocessBackend.name: SubprocessBackend,
+    JvmBackend.name: JvmBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def register_backend(cls) -> None:
+    _BACKENDS[cls.name] = cls
+
+
+def get_backend(name: str = SQLFLOW_ANALYZER_BACKEND, **kwargs) -> AnalyzerBackend:
+    try:
+        cls = _BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"unknown analyzer backend {name!r}, available: {', '.join(sorted(_BACKENDS))}")
+    return cls(**kwargs)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run one analyzer backend on a SQL file and print the CSV')
+    parser.add_argument('sql_file')
+    parser.add_argument('-b', '--backend', default=SQLFLOW_ANALYZER_BACKEND, choices=sorted(_BACKENDS))
+    parser.add_argument('-t', '--db-type', default='hive')
+    args = parser.parse_args()
+
+    backend = get_backend(args.backend, db_type=args.db_type)
+    result = backend.analyze_file(args.sql_file)
+    sys.stdout.write(result.csv_text)
+    if result.errors:
+        sys.stderr.write(f"{ERROR_LOG_MARKER}\n{result.errors}\n")
+    sys.exit(0 if result.ok else 1)
@@ -0,0 +1,279 @@
+"""
+Asyncio driver for concurrent dlineage.py subprocesses.
+
+    python3 async_analyzer.py chunks -t oracle -c 8            # like generate_chunk_csvs
+    python3 async_analyzer.py --sql-dir sql -t oracle -c 8     # in-memory, straight to the sinks
+
+The analyzer invocation contract is unchanged: the same dlineage.py command
+line as SubprocessBackend (/f or /stdin, /csv /traceView, /native, /env).
+Up to `concurrency` processes run at once via asyncio.create_subprocess_exec.
+Their stdout is read line by line and assembled into CSV records as it
+arrives (quoted fields may span lines); the "Error log:" line switches the
+rest of the stream to the error text, as split_error_log does.
+
+In the sink flow, finished chunks go through a bounded queue in input order
+and are consumed by the sinks in a worker thread. When the sinks fall behind
+the queue fills, no further analyzers are started, and running ones block
+on their stdout pipe.
+"""
+import asyncio
+import csv
+import glob
+import io
+import logging
+import os
+import time
+
+from analyzer_backend import ERROR_LOG_MARKER, SubprocessBackend, parse_analyzer_timings
+from lineage_sinks import DecodedChunk, LineageRecord, default_sinks
+from main_to_json import DATAHUB_OUTPUT, SPLIT_WORKERS, _normalize_lineage_row, pending_chunk_files
+from pipeline_metrics import PipelineMetrics
+
+ASYNC_ANALYZER_CONCURRENCY = int(os.getenv("ASYNC_ANALYZER_CONCURRENCY", str(os.cpu_count() or 1)))
+ASYNC_SINK_QUEUE = int(os.getenv("ASYNC_SINK_QUEUE", "16"))
+
+
+class StreamingCsvDecoder:
+    """逐行喂入分析器 stdout，增量解析为 LineageRecord；与 split_error_log + decode_lineage_csv 结果一致"""
+
+    def __init__(self):
+        self.header: list[str] = []
+        self.records: list[LineageRecord] = []
+        self.rejected = 0
+        self.error_lines: list[str] | None = None
+        self._pending: list[str] = []
+        self._quotes = 0
+
+    @property
+    def errors(self) -> str:
+        return ''.join(self.error_lines or []).strip()
+
+    def feed(self, line: str) -> bool:
+        """返回该行是否属于 CSV 部分（错误日志之前）"""
+        if self.error_lines is not None:
+            self.error_lines.append(line)
+            return False
+        if not self._pending and line.startswith(ERROR_LOG_MARKER):
+            self.error_lines = [line[len(ERROR_LOG_MARKER):]]
+            return False
+        self._pending.append(line)
+        self._quotes += line.count('"')
+        if self._quotes % 2 == 0:
+            # 引号成对，说明一条记录已经完整
+            self._emit(''.join(self._pending))
+            self._pending = []
+            self._quotes = 0
+        return True
+
+    def close(self) -> None:
+        if self._pending:
+            self._emit(''.join(self._pending))
+            self._pending = []
+
+    def _emit(self, text: str) -> None:
+        for row in csv.reader(io.StringIO(text)):
+            if not self.header:
+                self.header = row
+                continue
+            if not row or all(cell.strip() == '' for cell in row):
+                continue
+            normalized_row = _normalize_lineage_row(row)
+            if normalized_row is None:
+                self.rejected += 1
+                continue
+            self.records.append(LineageRecord._make(normalized_row))
+
+
+class AsyncAnalyzerDriver:
+    def __init__(self, backend: SubprocessBackend, concurrency: int = ASYNC_ANALYZER_CONCURRENCY,
+                 metrics=None, journal=None):
+        self.backend = backend
+        self.concurrency = max(1, concurrency)
+        self.metrics = metrics or PipelineMetrics()
+        self.journal = journal
+        self._slots: asyncio.Semaphore | None = None
+
+    async def _communicate(self, proc, stdin_text: str | None, decoder: StreamingCsvDecoder, raw_out=None) -> str:
+        async def write_stdin():
+            if stdin_text is not None:
+                proc.stdin.write(stdin_text.encode('utf-8'))
+                await proc.stdin.drain()
+                proc.stdin.close()
+
+        async def read_stderr():
+            return (await proc.stderr.read()).decode('utf-8', errors='replace')
+
+        writer = asyncio.create_task(write_stdin())
+        stderr = asyncio.create_task(read_stderr())
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            text = line.decode('utf-8', errors='replace')
+            if decoder.feed(text) and raw_out is not None:
+                raw_out.write(text)
+        decoder.close()
+        await writer
+        await proc.wait()
+        return await stderr
+
+    async def analyze(self, cmd: list[str], stdin_text: str | None = None, raw_out=None):
+        """运行一个 dlineage.py，返回 (ok, decoder, stderr, timings)"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            started = time.perf_counter()
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdin=asyncio.subprocess.PIPE if stdin_text is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=self.backend.env)
+            decoder = StreamingCsvDecoder()
+            try:
+                stderr = await asyncio.wait_for(self._communicate(proc, stdin_text, decoder, raw_out),
+                                                self.backend.timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                timings = {'wall': time.perf_counter() - started, 'timeout': self.backend.timeout}
+                return False, decoder, f"dlineage.py 超过 {self.backend.timeout}s 未结束，已终止。", timings
+            timings = parse_analyzer_timings(stderr)
+            timings['wall'] = time.perf_counter() - started
+            self.metrics.histogram('analyzer.wall_seconds').record(timings['wall'])
+            return proc.returncode == 0, decoder, stderr.strip(), timings
+
+    async def analyze_chunk(self, name: str, source: str, index: int, sql: str) -> DecodedChunk:
+        ok, decoder, stderr, _ = await self.analyze(self.backend.stdin_command(), sql)
+        if not ok:
+            logging.error(f"dlineage 失败 ({name})，stderr: {stderr}")
+            return DecodedChunk(name, source, index, sql, [], [], 0)
+        if decoder.rejected:
+            logging.warning(f"{name} 有 {decoder.rejected} 行无法纠正列数，已跳过。")
+        return DecodedChunk(name, source, index, sql, decoder.header, decoder.records, decoder.rejected)
+
+    async def analyze_file_to_csv(self, sql_file: str) -> bool:
+        """与 generate_chunk_csvs 相同：chunks/x.sql → chunks/x.csv（错误日志之前的 stdout 原样写入）"""
+        out_csv = os.path.splitext(sql_file)[0] + '.csv'
+        tmp_csv = out_csv + '.tmp'
+        with open(tmp_csv, 'w', encoding='utf-8') as raw_out:
+            ok, decoder, stderr, _ = await self.analyze(self.backend.command(sql_file), raw_out=raw_out)
+        if not ok:
+            os.remove(tmp_csv)
+            logging.error(f"dlineage 失败 ({sql_file})，stderr: {stderr}")
+            return False
+        os.replace(tmp_csv, out_csv)
+        if self.journal is not None:
+            self.journal.analyzed(os.path.basename(os.path.splitext(sql_file)[0]))
+        logging.info(f"已生成 CSV：{out_csv}")
+        return True
+
+    async def run_chunk_dir(self, sql_files: list[str]) -> int:
+        """concurrency 个协程共同取文件，同时打开的输出文件不超过并发数"""
+        files = iter(sql_files)
+        written = 0
+
+        async def worker():
+            nonlocal written
+            for path in files:
+                ok = await self.analyze_file_to_csv(path)
+                written += ok
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return written
+
+    async def run_sinks(self, chunks, sinks: list, queue_size: int = ASYNC_SINK_QUEUE) -> int:
+        """按输入顺序把分析结果交给 sink；队列满时暂停启动新的分析器"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+
+        async def produce():
+            source = iter(chunks)
+            while True:
+                # 拆分在线程中进行，不阻塞事件循环读取各分析器的输出
+                item = await asyncio.to_thread(next, source, None)
+                if item is None:
+                    break
+                await queue.put(asyncio.create_task(self.analyze_chunk(*item)))
+            await queue.put(None)
+
+        def consume(chunk: DecodedChunk) -> None:
+            with self.metrics.stage('sinks') as st:
+                for sink in sinks:
+                    sink.consume(chunk)
+                st.add(rows_in=len(chunk.records))
+
+        for sink in sinks:
+            sink.open()
+        producer = asyncio.create_task(produce())
+        count = 0
+        try:
+            while True:
+                task = await queue.get()
+                if task is None:
+                    break
+                chunk = await task
+                await asyncio.to_thread(consume, chunk)
+                count += 1
+            await producer
+        finally:
+            producer.cancel()
+            for sink in sinks:
+                sink.close()
+        return count
+
+
+def generate_chunk_csvs_async(chunk_dir: str, db_type: str = 'mysql', dlineage_script: str = 'dlineage.py',
+                              concurrency: int = ASYNC_ANALYZER_CONCURRENCY, timeout: float | None = None,
+                              metrics=None, journal=None) -> int:
+    """generate_chunk_csvs 的 asyncio 版本：最多 concurrency 个 dlineage.py 同时运行"""
+    sql_files = sorted(glob.glob(os.path.join(chunk_dir, '*.sql')))
+    if not sql_files:
+        logging.warning(f"{chunk_dir} 下未找到任何 .sql 文件。")
+        return 0
+    if journal is not None:
+        sql_files = pending_chunk_files(sql_files, journal)
+    backend = SubprocessBackend(db_type, dlineage_script, timing=metrics is not None, timeout=timeout)
+    driver = AsyncAnalyzerDriver(backend, concurrency, metrics, journal)
+    return asyncio.run(driver.run_chunk_dir(sql_files))
+
+
+def run_async_pipeline(sql_files: list[str], db_type: str = 'hive', dlineage_script: str = 'dlineage.py',
+                       concurrency: int = ASYNC_ANALYZER_CONCURRENCY, timeout: float | None = None,
+                       result_dir: str | None = 'result', datahub_output: str | None = DATAHUB_OUTPUT,
+                       merged_csv: str | None = None, mysql: bool = False, metrics=None,
+                       queue_size: int = ASYNC_SINK_QUEUE, workers: int = SPLIT_WORKERS,
+                       table_csv: str | None = None) -> int:
+    """内存流水线的 asyncio 版本：chunk 经 /stdin 交给并发的 dlineage.py，结果按顺序写入各 sink"""
+    from lineage_pipeline import iter_source_chunks
+    metrics = metrics or PipelineMetrics()
+    backend = SubprocessBackend(db_type, dlineage_script, timing=True, timeout=timeout)
+    driver = AsyncAnalyzerDriver(backend, concurrency, metrics)
+    sinks = default_sinks(result_dir, datahub_output, merged_csv, None, mysql, table_csv)
+    count = asyncio.run(driver.run_sinks(iter_source_chunks(sql_files, metrics, workers), sinks, queue_size))
+    logging.info(f"异步流水线完成：{count} 个 chunk，{driver.concurrency} 路并发。")
+    return count
+
+
+if __name__ == '__main__':
+    import argparse
+    from pipeline_metrics import PIPELINE_METRICS_REPORT
+    parser = argparse.ArgumentParser(description='Run dlineage.py analyzers concurrently with asyncio')
+    parser.add_argument('chunk_dir', nargs='?', default='chunks', help='Analyse chunk_dir/*.sql into *.csv')
+    parser.add_argument('--sql-dir', help='Split these source files in memory and feed the sinks instead')
+    parser.add_argument('-t', '--db-type', default='hive')
+    parser.add_argument('-c', '--concurrency', type=int, default=ASYNC_ANALYZER_CONCURRENCY)
+    parser.add_argument('--timeout', type=float, default=None, help='Kill analyzers running longer than this')
+    parser.add_argument('--queue', type=int, default=ASYNC_SINK_QUEUE, help='Analysed chunks waiting for the sinks')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    metrics = PipelineMetrics()
+    started = time.perf_counter()
+    if args.sql_dir:
+        run_async_pipeline(sorted(glob.glob(os.path.join(args.sql_dir, '*.sql'))), db_type=args.db_type,
+                           concurrency=args.concurrency, timeout=args.timeout, metrics=metrics,
+                           queue_size=args.queue)
+    else:
+        with metrics.stage('generate_chunk_csvs') as st:
+            st.add(files_out=generate_chunk_csvs_async(args.chunk_dir, args.db_type, concurrency=args.concurrency,
+                                                       timeout=args.timeout, metrics=metrics))
+    logging.info(f"耗时 {time.perf_counter() - started:.2f}s")
+    metrics.write_report(PIPELINE_METRICS_REPORT)
@@ -0,0 +1,78 @@
+"""
+Per-chunk cost of /env metadata with and without the parsed-sqlenv cache.
+
+Runs the same chunks through the in-process JvmBackend twice, once parsing
+the metadata json for every chunk (env_cache=False, what every dlineage.py
+subprocess does) and once through the (path, mtime, vendor) cache:
+
+    python benchmarks/bench_env_cache.py --env metadata.json -t oracle --chunks 200
+
+Chunks come from --sql-dir (split like main_to_json.py) or are synthetic
+INSERT ... SELECT statements. Needs the JVM and the jars under jar/.
+"""
+import glob
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from analyzer_backend import JvmBackend
+from bench_pipeline import synthetic_statements
+from main_to_json import read_sql_file, split_source_sql, split_sql_chunks
+from pipeline_metrics import Histogram
+
+
+def load_chunks(sql_dir: str | None, count: int) -> list[str]:
+    if sql_dir:
+        chunks = []
+        for path in sorted(glob.glob(os.path.join(sql_dir, '*.sql'))):
+            chunks.extend(split_source_sql(read_sql_file(path), src_sql=path))
+        return chunks[:count]
+    return split_sql_chunks(synthetic_statements(random.Random(11), count))
+
+
+def run(backend: JvmBackend, chunks: list[str]) -> dict:
+    env = Histogram()
+    wall = Histogram()
+    started = time.perf_counter()
+    for chunk in chunks:
+        result = backend.analyze_text(chunk)
+        env.record(result.timings.get('env', 0.0))
+        wall.record(result.timings.get('wall', 0.0))
+    return {'seconds': time.perf_counter() - started, 'env': env.to_dict(), 'wall': wall.to_dict()}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark /env metadata parsing with and without the cache')
+    parser.add_argument('--env', required=True, help='Metadata json passed to /env')
+    parser.add_argument('-t', '--db-type', default='oracle')
+    parser.add_argument('--chunks', type=int, default=200, help='Number of chunks to analyse per run')
+    parser.add_argument('--sql-dir', help='Split these SQL files instead of synthetic statements')
+    parser.add_argument('--json', help='Write the results to this json file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    chunks = load_chunks(args.sql_dir, args.chunks)
+    print(f"{len(chunks)} chunks, metadata {os.path.getsize(args.env) / (1024 * 1024):.1f} MB", file=sys.stderr)
+
+    results = {}
+    for label, cached in (('no_cache', False), ('cache', True)):
+        backend = JvmBackend(args.db_type, env_file=args.env, env_cache=cached)
+        results[label] = run(backend, chunks)
+
+    print(f"{'mode':<10}{'total s':>10}{'env ms/chunk':>14}{'env p90 ms':>12}{'wall ms/chunk':>15}")
+    for label, r in results.items():
+        print(f"{label:<10}{r['seconds']:>10.2f}{r['env']['mean'] * 1000:>14.2f}"
+              f"{(r['env']['p90'] or 0) * 1000:>12.2f}{r['wall']['mean'] * 1000:>15.2f}")
+    if results['cache']['seconds']:
+        print(f"speedup {results['no_cache']['seconds'] / results['cache']['seconds']:.2f}x")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
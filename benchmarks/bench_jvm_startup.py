@@ -0,0 +1,102 @@
+"""
+Time to first lineage of one dlineage.py process under different JVM startups.
+
+    python benchmarks/bench_jvm_startup.py -f samples/oracle.sql -t oracle --runs 10
+
+Every configuration runs `dlineage.py /t <db> /f <file> /csv /traceView` as a
+fresh process (what SubprocessBackend does per chunk) and measures the wall
+time until it exits with the lineage printed, plus the jvm_start / analyze
+split reported through SQLFLOW_TIMING:
+
+    baseline   the previous startup: -ea, no tuning flags, no CDS archive
+    tuned      no assertions, SQLFLOW_CLI_JVM_OPTS (serial GC, C1 only)
+    tuned_cds  tuned plus an AppCDS archive dumped by one training run
+
+The archive is written to --archive (default a temporary file, so jar/ is
+left alone); dumping needs JDK 13 or later. Needs the JVM and the jars under
+jar/.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from analyzer_backend import parse_analyzer_timings
+from pipeline_metrics import Histogram
+
+CONFIGS = {
+    'baseline': {'SQLFLOW_JVM_ASSERTIONS': '1', 'SQLFLOW_CLI_JVM_OPTS': '', 'SQLFLOW_CDS': 'off'},
+    'tuned': {'SQLFLOW_CDS': 'off'},
+    'tuned_cds': {'SQLFLOW_CDS': 'auto'},
+}
+
+
+def run_once(sql_file: str, db_type: str, env: dict) -> dict[str, float]:
+    cmd = [sys.executable, os.path.join(ROOT, 'dlineage.py'), '/t', db_type, '/f', sql_file, '/csv', '/traceView']
+    started = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=env, cwd=ROOT)
+    timings = parse_analyzer_timings(proc.stderr)
+    timings['wall'] = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"dlineage.py failed: {proc.stderr.strip()[-500:]}")
+    return timings
+
+
+def dump_archive(sql_file: str, db_type: str, archive: str) -> float:
+    if os.path.exists(archive):
+        os.remove(archive)
+    env = dict(os.environ, SQLFLOW_TIMING='1', SQLFLOW_CDS='dump', SQLFLOW_CDS_ARCHIVE=archive)
+    started = time.perf_counter()
+    run_once(sql_file, db_type, env)
+    if not os.path.exists(archive):
+        raise RuntimeError(f"no archive written to {archive}; -XX:ArchiveClassesAtExit needs JDK 13+")
+    return time.perf_counter() - started
+
+
+def bench(sql_file: str, db_type: str, runs: int, archive: str) -> dict:
+    results = {}
+    for label, overrides in CONFIGS.items():
+        env = dict(os.environ, SQLFLOW_TIMING='1', SQLFLOW_CDS_ARCHIVE=archive, **overrides)
+        run_once(sql_file, db_type, env)  # 预热文件系统缓存
+        histograms = {key: Histogram() for key in ('wall', 'jvm_start', 'analyze')}
+        for _ in range(runs):
+            timings = run_once(sql_file, db_type, env)
+            for key, histogram in histograms.items():
+                histogram.record(timings.get(key, 0.0))
+        results[label] = {key: histogram.to_dict() for key, histogram in histograms.items()}
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark dlineage.py JVM startup with and without AppCDS')
+    parser.add_argument('-f', '--sql-file', default=os.path.join(ROOT, 'samples', 'oracle.sql'))
+    parser.add_argument('-t', '--db-type', default='oracle')
+    parser.add_argument('--runs', type=int, default=10, help='Processes per configuration')
+    parser.add_argument('--archive', help='CDS archive to dump and use (default a temporary file)')
+    parser.add_argument('--json', help='Write the results to this json file')
+    args = parser.parse_args()
+
+    archive = args.archive or os.path.join(tempfile.mkdtemp(prefix='dlineage_cds_'), 'dlineage.jsa')
+    sql_file = os.path.abspath(args.sql_file)
+    dump_seconds = dump_archive(sql_file, args.db_type, archive)
+    print(f"archive {archive}: {os.path.getsize(archive) / (1024 * 1024):.1f} MB, dumped in {dump_seconds:.2f}s",
+          file=sys.stderr)
+    results = bench(sql_file, args.db_type, args.runs, archive)
+
+    print(f"{'config':<12}{'wall ms':>10}{'wall p90':>10}{'jvm_start ms':>14}{'analyze ms':>12}")
+    for label, r in results.items():
+        print(f"{label:<12}{r['wall']['mean'] * 1000:>10.0f}{(r['wall']['p90'] or 0) * 1000:>10.0f}"
+              f"{r['jvm_start']['mean'] * 1000:>14.0f}{r['analyze']['mean'] * 1000:>12.0f}")
+    baseline, tuned_cds = results['baseline']['wall']['mean'], results['tuned_cds']['wall']['mean']
+    if tuned_cds:
+        print(f"time to first lineage: {baseline / tuned_cds:.2f}x faster than baseline")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,120 @@
+"""
+End-to-end throughput benchmark of the chunk pipeline with the stub analyzer.
+
+For each size N (default 1k, 10k, 100k chunks; pass --sizes 1000,...,1000000
+for the full curve) a seeded set of small INSERT ... SELECT statements spread
+over N/--chunks-per-file procedures is pushed through:
+
+    split -> write chunks -> analyze (StubBackend)
+          -> one decode pass fanned out to result/, global csv and DataHub json
+
+Every stage is timed and the scaling curve is printed as seconds and chunks/s,
+so a stage that grows faster than linear stands out. No JVM is needed.
+"""
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from analyzer_backend import StubBackend
+from chunk_scheduler import AnalyzerHistory
+from lineage_sinks import DataHubSink, MergedCsvSink, ResultCsvSink, fan_out_chunk_dir
+from main_to_json import generate_chunk_csvs, split_sql_chunks
+
+
+def synthetic_statements(rng: random.Random, count: int) -> list[dict]:
+    statements = []
+    for i in range(count):
+        width = rng.randrange(3, 12)
+        cols = ', '.join(f"C{j}" for j in range(width))
+        exprs = ', '.join(rng.choice([f"A.S{j}", f"B.S{j}", f"NVL(A.S{j}, B.S{j})"]) for j in range(width))
+        sql = (f"INSERT INTO DM.T_{rng.randrange(500)} ({cols}) SELECT {exprs} "
+               f"FROM ODS.A_{rng.randrange(200)} A JOIN ODS.B_{rng.randrange(200)} B ON A.ID = B.ID "
+               f"WHERE A.DT = '2024{rng.randrange(1, 13):02d}01';")
+        statements.append({'table_name': f"DM.T_{i}", 'sql': sql, 'line_number': i + 1,
+                           'statement_type': 'insert'})
+    return statements
+
+
+def run_size(size: int, chunks_per_file: int, work_dir: str, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    chunk_dir = os.path.join(work_dir, 'chunks')
+    result_dir = os.path.join(work_dir, 'result')
+    os.makedirs(chunk_dir)
+    timings = {}
+
+    started = time.perf_counter()
+    per_file = []
+    remaining = size
+    while remaining > 0:
+        count = min(chunks_per_file, remaining)
+        per_file.append(split_sql_chunks(synthetic_statements(rng, count)))
+        remaining -= count
+    timings['split'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for file_idx, chunks in enumerate(per_file):
+        for idx, seg in enumerate(chunks, start=1):
+            with open(os.path.join(chunk_dir, f"proc{file_idx:05d}_{idx}.sql"), 'w', encoding='utf-8') as f:
+                f.write(seg)
+    timings['write_chunks'] = time.perf_counter() - started
+
+    stages = (
+        ('analyze', lambda: generate_chunk_csvs(chunk_dir, backend=StubBackend('hive'),
+                                                   history=AnalyzerHistory(None))),
+        ('fan_out_sinks', lambda: fan_out_chunk_dir(chunk_dir, [
+            ResultCsvSink(result_dir),
+            MergedCsvSink(os.path.join(work_dir, 'global_lineage.csv')),
+            DataHubSink(os.path.join(work_dir, 'dh.json')),
+        ])),
+    )
+    for name, fn in stages:
+        started = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - started
+    timings['total'] = sum(timings.values())
+    return timings
+
+
+def print_curve(results: dict[int, dict]) -> None:
+    stages = list(next(iter(results.values())).keys())
+    print(f"{'chunks':>9} " + ''.join(f"{name[:14]:>15}" for name in stages) + f"{'chunks/s':>11}")
+    for size, timings in results.items():
+        print(f"{size:>9} " + ''.join(f"{timings[name]:>14.2f}s" for name in stages)
+              + f"{size / timings['total']:>11.0f}")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='End-to-end pipeline benchmark with the stub analyzer')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated chunk counts')
+    parser.add_argument('--chunks-per-file', type=int, default=200, help='Chunks per synthetic procedure')
+    parser.add_argument('--work-dir', help='Keep outputs here instead of a temp dir')
+    parser.add_argument('--json', help='Write the timings to this json file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = {}
+    for size in (int(item) for item in args.sizes.split(',') if item):
+        base_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_pipeline_')
+        work_dir = os.path.join(base_dir, str(size))
+        if os.path.exists(work_dir):
+            shutil.rmtree(work_dir)
+        try:
+            results[size] = run_size(size, args.chunks_per_file, work_dir)
+        finally:
+            if not args.work_dir:
+                shutil.rmtree(base_dir, ignore_errors=True)
+        print(f"{size} chunks: {results[size]['total']:.2f}s", file=sys.stderr)
+    print_curve(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
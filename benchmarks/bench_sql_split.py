@@ -0,0 +1,234 @@
+"""
+Benchmark the SQL preprocessing / extraction / splitting hot paths of main_to_json.py.
+
+Synthetic workloads (deterministic, seeded):
+  wide_insert_select   INSERT INTO t (c1..cN) SELECT <expr>, ... FROM ... JOIN ...
+  multirow_values      INSERT INTO t VALUES (...), (...), ... with thousands of rows
+  union_all_chain      INSERT INTO t SELECT ... UNION ALL SELECT ... (hundreds of branches)
+  comment_heavy_proc   procedure body with block / line comments and quoted '--' text
+plus the samples/*.sql corpus.
+
+For every workload and stage (preprocess, extract, split, total) the best of
+--repeat runs is reported as MB/s and statements/s; peak Python memory of a
+full pass is measured with tracemalloc. Results can be stored as a baseline
+and later runs compared against it:
+
+    python benchmarks/bench_sql_split.py --save-baseline
+    python benchmarks/bench_sql_split.py --fail-on-regression
+"""
+import glob
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from main_to_json import (SQLFLOW_CHAR_LIMIT, extract_create_table_as_statements, extract_insert_statements,
+                          preprocess_sql, split_sql_chunks)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_sql_split.json')
+
+
+# ---------- 合成 SQL 生成器 ----------
+def gen_wide_insert_select(rng: random.Random, columns: int = 600, statements: int = 5) -> str:
+    parts = []
+    for s in range(statements):
+        cols = [f"COL_{i}" for i in range(columns)]
+        exprs = []
+        for i in range(columns):
+            kind = rng.randrange(4)
+            if kind == 0:
+                exprs.append(f"A.SRC_{i}")
+            elif kind == 1:
+                exprs.append(f"NVL(B.SRC_{i}, 0)")
+            elif kind == 2:
+                exprs.append(f"CASE WHEN A.FLAG_{i} = 'Y' THEN B.AMT_{i} ELSE 0 END")
+            else:
+                exprs.append(f"SUM(A.AMT_{i} * B.RATE)")
+        parts.append(
+            f"INSERT INTO DM.WIDE_TARGET_{s} ({', '.join(cols)})\n"
+            f"SELECT {', '.join(exprs)}\n"
+            f"FROM ODS.SRC_A A LEFT JOIN ODS.SRC_B B ON A.ID = B.ID\n"
+            f"WHERE A.DATA_DATE = '20240101' GROUP BY A.ID;\n"
+        )
+    return ''.join(parts)
+
+
+def gen_multirow_values(rng: random.Random, rows: int = 5000, statements: int = 2) -> str:
+    parts = []
+    for s in range(statements):
+        values = []
+        for r in range(rows):
+            values.append(f"({r}, '{rng.choice(['A01', 'B02', 'C03'])}', "
+                          f"'{2000 + rng.randrange(25)}-{rng.randrange(1, 13):02d}-01', {rng.random():.6f})")
+        parts.append(f"INSERT INTO DM.CODE_TABLE_{s} VALUES {', '.join(values)};\n")
+    return ''.join(parts)
+
+
+def gen_union_all_chain(rng: random.Random, branches: int = 400, statements: int = 3) -> str:
+    parts = []
+    for s in range(statements):
+        selects = []
+        for b in range(branches):
+            selects.append(f"SELECT T{b}.ORG_ID, T{b}.ACCT_NO, T{b}.BAL * {rng.randrange(1, 9)} AS BAL "
+                           f"FROM ODS.ACCT_{b % 37} T{b} WHERE T{b}.ORG_ID = '{rng.randrange(1000)}'")
+        parts.append(f"INSERT INTO DM.UNION_TARGET_{s} (ORG_ID, ACCT_NO, BAL)\n"
+                     + "\nUNION ALL\n".join(selects) + ";\n")
+    return ''.join(parts)
+
+
+def gen_comment_heavy_proc(rng: random.Random, statements: int = 400) -> str:
+    lines = ["CREATE OR REPLACE PROCEDURE ETL.P_LOAD(I_DATE IN VARCHAR2) IS", "BEGIN"]
+    for s in range(statements):
+        lines.append("/* ----------------------------------------------------------")
+        lines.append(f"   step {s}: load target, owner etl, see ticket {rng.randrange(10 ** 6)} */")
+        lines.append(f"  -- truncate partition for step {s}")
+        lines.append(f"  DELETE FROM DM.T_{s} WHERE DATA_DATE = I_DATE; -- idempotent")
+        lines.append(f"  INSERT INTO DM.T_{s} (ID, NAME, REMARK) -- target columns")
+        lines.append(f"  SELECT A.ID, A.NAME, '--not a comment /* nor this */' -- trailing")
+        lines.append(f"    FROM ODS.S_{s} A /* inline */ WHERE A.DT = I_DATE；")
+        lines.append("  COMMIT;")
+    lines.append("END;")
+    return '\n'.join(lines) + '\n'
+
+
+def load_samples_corpus() -> str:
+    texts = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'samples', '*.sql'))):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            texts.append(f.read())
+    return '\n'.join(texts)
+
+
+def build_workloads(scale: float = 1.0) -> dict[str, str]:
+    rng = random.Random(20240101)
+    return {
+        'wide_insert_select': gen_wide_insert_select(rng, columns=max(10, int(600 * scale))),
+        'multirow_values': gen_multirow_values(rng, rows=max(10, int(5000 * scale))),
+        'union_all_chain': gen_union_all_chain(rng, branches=max(5, int(400 * scale))),
+        'comment_heavy_proc': gen_comment_heavy_proc(rng, statements=max(5, int(400 * scale))),
+        'samples_corpus': load_samples_corpus(),
+    }
+
+
+# ---------- 计时 ----------
+def _extract(cleaned: str) -> list[dict]:
+    return sorted(extract_insert_statements(cleaned) + extract_create_table_as_statements(cleaned),
+                  key=lambda item: item.get('line_number', 0))
+
+
+def _best_of(repeat: int, fn, *args):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_workload(text: str, repeat: int, max_len: int) -> dict:
+    size_mb = len(text.encode('utf-8')) / (1024 * 1024)
+    t_pre, cleaned = _best_of(repeat, preprocess_sql, text)
+    t_ext, statements = _best_of(repeat, _extract, cleaned)
+    t_split, chunks = _best_of(repeat, split_sql_chunks, statements, max_len)
+
+    tracemalloc.start()
+    split_sql_chunks(_extract(preprocess_sql(text)), max_len)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = t_pre + t_ext + t_split
+    return {
+        'input_mb': round(size_mb, 4),
+        'statements': len(statements),
+        'chunks': len(chunks),
+        'seconds': {'preprocess': t_pre, 'extract': t_ext, 'split': t_split, 'total': total},
+        'mb_per_s': {
+            'preprocess': size_mb / t_pre if t_pre else None,
+            'extract': size_mb / t_ext if t_ext else None,
+            'total': size_mb / total if total else None,
+        },
+        'statements_per_s': {
+            'extract': len(statements) / t_ext if t_ext else None,
+            'split': len(statements) / t_split if t_split else None,
+        },
+        'peak_memory_mb': round(peak / (1024 * 1024), 3),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """总耗时或峰值内存比基线差 tolerance 以上即视为回退"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for label, now, before in (
+                ('total seconds', current['seconds']['total'], base['seconds']['total']),
+                ('peak memory MB', current['peak_memory_mb'], base['peak_memory_mb'])):
+            if before and now > before * (1 + tolerance):
+                regressions.append(f"{name}: {label} {before:.4g} -> {now:.4g} (+{(now / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_table(results: dict, baseline: dict | None) -> None:
+    header = f"{'workload':<22}{'MB':>8}{'stmts':>8}{'chunks':>8}{'pre MB/s':>10}{'tot MB/s':>10}" \
+             f"{'stmt/s':>10}{'peak MB':>9}{'vs base':>9}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        delta = ''
+        if baseline and name in baseline and baseline[name]['seconds']['total']:
+            delta = f"{r['seconds']['total'] / baseline[name]['seconds']['total']:.2f}x"
+        print(f"{name:<22}{r['input_mb']:>8.2f}{r['statements']:>8}{r['chunks']:>8}"
+              f"{(r['mb_per_s']['preprocess'] or 0):>10.2f}{(r['mb_per_s']['total'] or 0):>10.2f}"
+              f"{(r['statements_per_s']['split'] or 0):>10.1f}{r['peak_memory_mb']:>9.2f}{delta:>9}")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark preprocess / extract / split of main_to_json.py')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage, best time is kept')
+    parser.add_argument('--scale', type=float, default=1.0, help='Scale factor of the synthetic workloads')
+    parser.add_argument('--max-len', type=int, default=SQLFLOW_CHAR_LIMIT, help='Chunk size limit')
+    parser.add_argument('--only', nargs='*', help='Run only these workloads')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline json path')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown before flagging')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 when a regression is found')
+    parser.add_argument('--json', help='Also write the results to this json file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    workloads = build_workloads(args.scale)
+    if args.only:
+        workloads = {name: text for name, text in workloads.items() if name in args.only}
+    results = {name: run_workload(text, args.repeat, args.max_len) for name, text in workloads.items()}
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+    print_table(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'results': results}, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'scale': args.scale, 'results': results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
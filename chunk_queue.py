@@ -0,0 +1,431 @@
+"""
+Shared-directory work queue for analysing chunks on several nodes.
+
+    python3 main_to_json.py -t oracle --queue /nfs/lineage_queue              # coordinator
+    python3 chunk_queue.py worker /nfs/lineage_queue -b subprocess -n 16      # on every analyzer node
+    python3 main_to_json.py -t oracle --queue /tmp/q --local-workers 4        # single host, for testing
+
+The coordinator splits as usual, publishes chunks/*.sql into the queue
+directory and waits; the merge stage (result/, DataHub JSON, MySQL) runs on
+the coordinator once every chunk has a result. Layout of the queue directory:
+
+    manifest.json        run id, db type and claim order (largest predicted chunk first)
+    stop                 run id of the finished run; workers waiting for the next run ignore it
+    tasks/x.sql          published chunks
+    leases/x.lease       claimed by a worker; its mtime is the heartbeat
+    attempts/x           one line per claim
+    results/x.csv        analyser output, renamed into place when complete
+    failed/x.json        analyser error, or lease lost WORK_QUEUE_MAX_ATTEMPTS times
+
+A chunk is claimed by creating its lease file with O_EXCL, so the directory
+must be shared with atomic exclusive create and rename (local disk, NFSv3+)
+and the node clocks must roughly agree. Workers refresh their lease every
+WORK_QUEUE_HEARTBEAT_SECONDS; any worker or the coordinator removes leases
+not refreshed for WORK_QUEUE_LEASE_SECONDS, which puts the chunk back in the
+queue. Delivery is at least once: a worker that lost its lease still writes
+its result, and since the same chunk always gives the same CSV whichever copy
+lands last is fine.
+"""
+import glob
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from pipeline_metrics import PipelineMetrics
+
+WORK_QUEUE_LEASE_SECONDS = float(os.getenv("WORK_QUEUE_LEASE_SECONDS", "60"))
+WORK_QUEUE_HEARTBEAT_SECONDS = float(os.getenv("WORK_QUEUE_HEARTBEAT_SECONDS",
+                                               str(WORK_QUEUE_LEASE_SECONDS / 4)))
+WORK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "3"))
+WORK_QUEUE_POLL_SECONDS = float(os.getenv("WORK_QUEUE_POLL_SECONDS", "0.5"))
+
+_SUBDIRS = ('tasks', 'leases', 'attempts', 'results', 'failed')
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class ChunkQueue:
+    def __init__(self, queue_dir: str, lease_seconds: float = WORK_QUEUE_LEASE_SECONDS,
+                 max_attempts: int = WORK_QUEUE_MAX_ATTEMPTS):
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._manifest: dict | None = None
+
+    def _path(self, kind: str, name: str, suffix: str = '') -> str:
+        return os.path.join(self.queue_dir, kind, name + suffix)
+
+    def task_path(self, name: str) -> str:
+        return self._path('tasks', name, '.sql')
+
+    def result_path(self, name: str) -> str:
+        return self._path('results', name, '.csv')
+
+    # ---------- 协调端 ----------
+    def publish(self, sql_files: list[str], db_type: str, backend_name: str = 'subprocess') -> list[str]:
+        """清空队列目录后发布 chunk，按 worker 所用后端的预测耗时从大到小排列领取顺序；manifest 最后写入"""
+        from chunk_scheduler import AnalyzerHistory, cost_units
+        from lineage_fingerprint import fingerprint_sql
+        for kind in _SUBDIRS:
+            shutil.rmtree(os.path.join(self.queue_dir, kind), ignore_errors=True)
+            os.makedirs(os.path.join(self.queue_dir, kind))
+        for marker in ('manifest.json', 'stop'):
+            if os.path.exists(os.path.join(self.queue_dir, marker)):
+                os.remove(os.path.join(self.queue_dir, marker))
+
+        history = AnalyzerHistory(backend=backend_name)
+        plan = []
+        for order, sql_file in enumerate(sql_files):
+            name = os.path.splitext(os.path.basename(sql_file))[0]
+            with open(sql_file, 'r', encoding='utf-8') as f:
+                sql = f.read()
+            shutil.copyfile(sql_file, self.task_path(name))
+            plan.append((-history.predict(fingerprint_sql(sql), cost_units(sql)), order, name))
+        names = [name for _, _, name in sorted(plan)]
+        _write_atomic(os.path.join(self.queue_dir, 'manifest.json'),
+                      json.dumps({'run_id': uuid.uuid4().hex, 'db_type': db_type, 'order': names,
+                                  'published_at': time.strftime('%Y-%m-%dT%H:%M:%S')}, ensure_ascii=False))
+        self._manifest = None
+        logging.info(f"已发布 {len(names)} 个 chunk 到队列 {self.queue_dir}")
+        return names
+
+    def stop(self) -> None:
+        """通知本轮的 worker 退出；stop 文件记录本轮的 run_id，不影响等待下一轮的 worker"""
+        manifest = self.manifest or {}
+        _write_atomic(os.path.join(self.queue_dir, 'stop'), manifest.get('run_id', ''))
+
+    def wait_for_run(self, run_id: str | None = None, poll: float = WORK_QUEUE_POLL_SECONDS) -> dict | None:
+        """等待一个尚未结束的一轮发布（先于协调端启动的 worker 不会被上一轮的 stop 文件结束）
+
+        给定 run_id（协调端在本机启动的 worker）时只等这一轮的 manifest，即使它已结束；已被新一轮取代时返回 None。
+        """
+        while True:
+            self._manifest = None
+            manifest = self.manifest
+            if manifest is not None and run_id is not None:
+                return manifest if manifest.get('run_id') == run_id else None
+            if manifest is not None and not self.stopped:
+                return manifest
+            time.sleep(poll)
+
+    # ---------- 状态 ----------
+    @property
+    def manifest(self) -> dict | None:
+        if self._manifest is None:
+            try:
+                with open(os.path.join(self.queue_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+            except FileNotFoundError:
+                return None
+        return self._manifest
+
+    @property
+    def stopped(self) -> bool:
+        """stop 文件记录的是当前 manifest 这一轮时为 True"""
+        try:
+            with open(os.path.join(self.queue_dir, 'stop'), 'r', encoding='utf-8') as f:
+                stopped_run = f.read().strip()
+        except FileNotFoundError:
+            return False
+        manifest = self.manifest
+        return manifest is not None and stopped_run == manifest.get('run_id', '')
+
+    def resolved(self, name: str) -> bool:
+        return os.path.exists(self.result_path(name)) or os.path.exists(self._path('failed', name, '.json'))
+
+    def unresolved(self) -> list[str]:
+        manifest = self.manifest
+        if manifest is None:
+            return []
+        return [name for name in manifest['order'] if not self.resolved(name)]
+
+    def failures(self) -> dict[str, dict]:
+        failed = {}
+        for path in glob.glob(os.path.join(self.queue_dir, 'failed', '*.json')):
+            with open(path, 'r', encoding='utf-8') as f:
+                failed[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+        return failed
+
+    def active_leases(self) -> int:
+        return len(glob.glob(os.path.join(self.queue_dir, 'leases', '*.lease')))
+
+    # ---------- 租约 ----------
+    def reap(self) -> list[str]:
+        """删除超过 lease_seconds 未续约的租约，对应 chunk 重新排队"""
+        requeued = []
+        now = time.time()
+        for lease in glob.glob(os.path.join(self.queue_dir, 'leases', '*.lease')):
+            try:
+                age = now - os.stat(lease).st_mtime
+            except FileNotFoundError:
+                continue
+            if age <= self.lease_seconds:
+                continue
+            # 先改名，多个回收者同时发现时只有一个成功
+            reaped = f"{lease}.{uuid.uuid4().hex}.reaped"
+            try:
+                os.rename(lease, reaped)
+            except FileNotFoundError:
+                continue
+            owner = self._read_lease(reaped).get('worker', '?')
+            os.remove(reaped)
+            name = os.path.splitext(os.path.basename(lease))[0]
+            requeued.append(name)
+            logging.warning(f"{name} 的租约（{owner}）已 {age:.0f}s 未续约，重新排队。")
+        return requeued
+
+    @staticmethod
+    def _read_lease(path: str) -> dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def claim(self, worker_id: str) -> str | None:
+        """按 manifest 顺序领取第一个未完成、未被租用的 chunk"""
+        manifest = self.manifest
+        if manifest is None:
+            return None
+        for name in manifest['order']:
+            if self.resolved(name):
+                continue
+            lease = self._path('leases', name, '.lease')
+            try:
+                fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'worker': worker_id, 'claimed_at': time.time()}, f)
+            if self.resolved(name):
+                # 检查与领取之间被别的 worker 完成
+                self.release(name, worker_id)
+                continue
+            with open(self._path('attempts', name), 'a', encoding='utf-8') as f:
+                f.write(worker_id + '\n')
+            with open(self._path('attempts', name), 'r', encoding='utf-8') as f:
+                attempts = sum(1 for _ in f)
+            if attempts > self.max_attempts:
+                self.fail(name, worker_id, f"租约丢失 {attempts - 1} 次，放弃。")
+                continue
+            return name
+        return None
+
+    def heartbeat(self, name: str, worker_id: str) -> bool:
+        """续约；租约已被回收或已被别人领取时返回 False"""
+        lease = self._path('leases', name, '.lease')
+        if self._read_lease(lease).get('worker') != worker_id:
+            return False
+        try:
+            os.utime(lease)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, name: str, worker_id: str) -> None:
+        lease = self._path('leases', name, '.lease')
+        if self._read_lease(lease).get('worker') == worker_id:
+            try:
+                os.remove(lease)
+            except FileNotFoundError:
+                pass
+
+    def complete(self, name: str, worker_id: str, csv_text: str) -> None:
+        _write_atomic(self.result_path(name), csv_text)
+        self.release(name, worker_id)
+
+    def fail(self, name: str, worker_id: str, errors: str) -> None:
+        _write_atomic(self._path('failed', name, '.json'),
+                      json.dumps({'worker': worker_id, 'errors': errors}, ensure_ascii=False))
+        self.release(name, worker_id)
+
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, queue: ChunkQueue, name: str, worker_id: str,
+                 interval: float = WORK_QUEUE_HEARTBEAT_SECONDS):
+        super().__init__(daemon=True, name=f"heartbeat-{name}")
+        self.queue = queue
+        self.chunk = name
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lost = False
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            if not self.queue.heartbeat(self.chunk, self.worker_id):
+                self.lost = True
+                logging.warning(f"{self.chunk} 的租约已丢失，分析完成后结果照常写回。")
+                return
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+
+def run_worker(queue_dir: str, backend, worker_id: str | None = None,
+               poll: float = WORK_QUEUE_POLL_SECONDS, run_id: str | None = None) -> int:
+    """等到一轮发布后领取并分析 chunk，直到这一轮全部完成或被 stop；返回分析的 chunk 数"""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = ChunkQueue(queue_dir)
+    if queue.wait_for_run(run_id, poll) is None:
+        logging.warning(f"[{worker_id}] 第 {run_id} 轮已被新发布取代，退出。")
+        backend.close()
+        return 0
+    analysed = 0
+    while not queue.stopped:
+        queue.reap()
+        name = queue.claim(worker_id)
+        if name is None:
+            if queue.manifest is not None and not queue.unresolved():
+                break
+            time.sleep(poll)
+            continue
+        heartbeat = _Heartbeat(queue, name, worker_id)
+        heartbeat.start()
+        try:
+            result = backend.analyze_file(queue.task_path(name))
+        finally:
+            heartbeat.stop()
+        if result.ok:
+            queue.complete(name, worker_id, result.csv_text)
+            logging.info(f"[{worker_id}] 已分析：{name}（{result.timings.get('wall', 0.0):.2f}s）")
+        else:
+            queue.fail(name, worker_id, result.errors)
+            logging.error(f"[{worker_id}] dlineage 失败 ({name})：{result.errors}")
+        analysed += 1
+    backend.close()
+    logging.info(f"[{worker_id}] 退出，共分析 {analysed} 个 chunk。")
+    return analysed
+
+
+def spawn_workers(queue_dir: str, count: int, backend_name: str, db_type: str,
+                  reuse_lineage: bool = False, run_id: str | None = None) -> list[subprocess.Popen]:
+    """在本机启动 count 个 worker 进程；给定 run_id 时只处理这一轮"""
+    cmd = [sys.executable, os.path.abspath(__file__), 'worker', queue_dir, '-b', backend_name, '-t', db_type]
+    if reuse_lineage:
+        cmd.append('--reuse-lineage')
+    if run_id:
+        cmd += ['--run', run_id]
+    return [subprocess.Popen(cmd + ['--id', f"{socket.gethostname()}-local{idx}"]) for idx in range(count)]
+
+
+def worker_backend_args(backend) -> tuple[str, bool]:
+    """把协调端的后端实例换成 worker 的 (后端名, 是否指纹复用)"""
+    from analyzer_backend import SQLFLOW_ANALYZER_BACKEND
+    if backend is None:
+        return SQLFLOW_ANALYZER_BACKEND, False
+    inner = getattr(backend, 'inner', None)
+    if inner is not None:
+        return inner.name, True
+    return backend.name, False
+
+
+def run_coordinator(chunk_dir: str, queue_dir: str, db_type: str, backend=None, local_workers: int = 0,
+                    metrics=None, journal=None, poll: float = WORK_QUEUE_POLL_SECONDS) -> int:
+    """发布 chunk_dir 中待分析的 chunk，等待结果并写回 chunk_dir/*.csv；返回写回的 chunk 数"""
+    from main_to_json import pending_chunk_files
+    metrics = metrics or PipelineMetrics()
+    sql_files = sorted(glob.glob(os.path.join(chunk_dir, '*.sql')))
+    if journal is not None:
+        sql_files = pending_chunk_files(sql_files, journal)
+    queue = ChunkQueue(queue_dir)
+    backend_name, reuse_lineage = worker_backend_args(backend)
+    names = queue.publish(sql_files, db_type, backend_name)
+    workers = spawn_workers(queue_dir, local_workers, backend_name, db_type, reuse_lineage,
+                            queue.manifest['run_id']) if local_workers else []
+    if not workers:
+        logging.info(f"等待 worker：python3 chunk_queue.py worker {queue_dir} -b {backend_name} -t {db_type}")
+
+    collected: set[str] = set()
+    requeued = 0
+    last_report = time.monotonic()
+    with metrics.stage('work_queue') as st:
+        try:
+            while True:
+                requeued += len(queue.reap())
+                for name in names:
+                    if name in collected or not os.path.exists(queue.result_path(name)):
+                        continue
+                    out_csv = os.path.join(chunk_dir, f"{name}.csv")
+                    shutil.copyfile(queue.result_path(name), out_csv + '.tmp')
+                    os.replace(out_csv + '.tmp', out_csv)
+                    collected.add(name)
+                    if journal is not None:
+                        journal.analyzed(name)
+                pending = queue.unresolved()
+                if not pending:
+                    break
+                if workers and all(proc.poll() is not None for proc in workers) and not queue.active_leases():
+                    logging.warning(f"本机 worker 已全部退出，仍有 {len(pending)} 个 chunk 未完成，等待其他节点。")
+                    workers = []
+                if time.monotonic() - last_report >= 10:
+                    logging.info(f"队列进度：{len(names) - len(pending)}/{len(names)}，"
+                                 f"租用中 {queue.active_leases()}，重新排队 {requeued}。")
+                    last_report = time.monotonic()
+                time.sleep(poll)
+        finally:
+            queue.stop()
+            for proc in workers:
+                proc.wait()
+        failed = queue.failures()
+        for name, failure in sorted(failed.items()):
+            logging.error(f"dlineage 失败 ({name}，{failure.get('worker')})：{failure.get('errors')}")
+        st.add(chunks=len(names), files_out=len(collected), requeued=requeued, failed=len(failed))
+    logging.info(f"队列完成：{len(collected)} 个 chunk 写回 {chunk_dir}，失败 {len(failed)}，重新排队 {requeued}。")
+    return len(collected)
+
+
+if __name__ == '__main__':
+    import argparse
+    from analyzer_backend import SQLFLOW_ANALYZER_BACKEND, get_backend
+    parser = argparse.ArgumentParser(description='Analyse chunks published to a shared queue directory')
+    sub = parser.add_subparsers(dest='command', required=True)
+    worker = sub.add_parser('worker', help='Claim and analyse chunks until the queue is complete')
+    worker.add_argument('queue_dir')
+    worker.add_argument('-b', '--backend', default=SQLFLOW_ANALYZER_BACKEND)
+    worker.add_argument('-t', '--db-type', default=None, help='Defaults to the db type in manifest.json')
+    worker.add_argument('-n', '--processes', type=int, default=1, help='Worker processes to start on this node')
+    worker.add_argument('--id', default=None, help='Worker id recorded in leases (default host-pid)')
+    worker.add_argument('--reuse-lineage', action='store_true', help='Per-worker fingerprint cache')
+    worker.add_argument('--run', default=None, help='Only work on this run id (default the next unfinished run)')
+    status = sub.add_parser('status', help='Print queue progress')
+    status.add_argument('queue_dir')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    queue = ChunkQueue(args.queue_dir)
+    if args.command == 'status':
+        manifest = queue.manifest or {'order': []}
+        pending = queue.unresolved()
+        print(json.dumps({'chunks': len(manifest['order']), 'unresolved': len(pending),
+                          'leased': queue.active_leases(), 'failed': len(queue.failures())}, indent=2))
+        sys.exit(0)
+
+    manifest = queue.wait_for_run(args.run)
+    if manifest is None:
+        logging.warning(f"第 {args.run} 轮已被新发布取代，退出。")
+        sys.exit(0)
+    db_type = args.db_type or manifest.get('db_type', 'hive')
+    if args.processes > 1:
+        procs = spawn_workers(args.queue_dir, args.processes, args.backend, db_type, args.reuse_lineage,
+                              manifest.get('run_id'))
+        sys.exit(max(proc.wait() for proc in procs))
+    backend = get_backend(args.backend, db_type=db_type)
+    if args.reuse_lineage:
+        from lineage_fingerprint import FingerprintBackend
+        backend = FingerprintBackend(backend)
+    run_worker(args.queue_dir, backend, args.id, run_id=manifest.get('run_id'))
@@ -0,0 +1,247 @@
+"""
+Longest-processing-time-first dispatch of analyzer chunks.
+
+    scheduler = ChunkScheduler(backend, workers=8, timeout=300, metrics=metrics)
+    scheduler.run(sql_files, on_result)      # on_result(sql_file, AnalyzerResult) in the calling thread
+
+Each chunk gets a predicted cost: the observed analyzer seconds of the same
+literal-insensitive fingerprint from previous runs with the same backend
+(analyzer_history.json, one section per backend name, entries not seen for
+ANALYZER_HISTORY_MAX_AGE_DAYS or beyond ANALYZER_HISTORY_MAX_ENTRIES are
+dropped on save), otherwise a size model (length, parenthesis nesting depth, UNION and CASE
+counts) calibrated against the history. Chunks are dispatched largest first
+to `workers` threads, so the 10k-character CASE/UNION monsters start early
+instead of forming the tail.
+
+The deadline is enforced by SubprocessBackend, which kills the dlineage.py
+process when it runs over `timeout` seconds. Timed-out chunks are copied to
+ANALYZER_QUARANTINE_DIR with a quarantine.jsonl entry and remembered in the
+history. After a run the measured makespan is reported next to the makespan
+the same durations would have had in FIFO order.
+"""
+import heapq
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from lineage_fingerprint import fingerprint_sql
+from pipeline_metrics import PipelineMetrics
+
+ANALYZER_WORKERS = int(os.getenv("ANALYZER_WORKERS", "1"))
+ANALYZER_TIMEOUT = float(os.getenv("ANALYZER_TIMEOUT", "0")) or None
+ANALYZER_HISTORY = os.getenv("ANALYZER_HISTORY", "analyzer_history.json")
+ANALYZER_HISTORY_MAX_ENTRIES = int(os.getenv("ANALYZER_HISTORY_MAX_ENTRIES", "20000"))
+ANALYZER_HISTORY_MAX_AGE_DAYS = float(os.getenv("ANALYZER_HISTORY_MAX_AGE_DAYS", "30"))
+ANALYZER_QUARANTINE_DIR = os.getenv("ANALYZER_QUARANTINE_DIR", "quarantine")
+
+# 没有任何历史时每个成本单位（约等于一个字符）的预估秒数
+DEFAULT_SECONDS_PER_UNIT = 1e-4
+_HISTORY_ALPHA = 0.5
+
+_QUOTED_RE = re.compile(r"'(?:[^']|'')*'")
+_PAREN_RE = re.compile(r'[()]')
+_UNION_RE = re.compile(r'\bUNION\b', re.IGNORECASE)
+_CASE_RE = re.compile(r'\bCASE\b', re.IGNORECASE)
+
+
+def cost_units(sql: str) -> float:
+    """按长度、括号嵌套深度、UNION 与 CASE 个数估算的相对成本"""
+    masked = _QUOTED_RE.sub("''", sql)
+    depth = max_depth = 0
+    for ch in _PAREN_RE.findall(masked):
+        depth = depth + 1 if ch == '(' else max(depth - 1, 0)
+        max_depth = max(max_depth, depth)
+    unions = len(_UNION_RE.findall(masked))
+    cases = len(_CASE_RE.findall(masked))
+    return len(sql) * (1 + 0.15 * max_depth) + 400 * unions + 150 * cases
+
+
+def simulate_makespan(durations: list[float], workers: int) -> float:
+    """按给定顺序把任务交给最先空闲的 worker，返回完成时间"""
+    finish = [0.0] * max(1, workers)
+    for seconds in durations:
+        heapq.heappush(finish, heapq.heappop(finish) + seconds)
+    return max(finish)
+
+
+class AnalyzerHistory:
+    """{backend: {fingerprint: {seconds, units, runs, timeouts, last_seen}}}，seconds 为指数平均的分析耗时
+
+    不同后端的耗时差别很大（stub、jvm、subprocess），各自一节互不影响；path 为 None 时只在内存中记录。
+    """
+
+    def __init__(self, path: str | None = ANALYZER_HISTORY, backend: str = 'subprocess',
+                 max_entries: int = ANALYZER_HISTORY_MAX_ENTRIES,
+                 max_age_days: float = ANALYZER_HISTORY_MAX_AGE_DAYS):
+        self.path = path
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.sections: dict[str, dict[str, dict]] = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.sections = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"分析耗时历史无法读取，将按成本模型调度：{path}（{e}）")
+        if any('seconds' in section for section in self.sections.values()):
+            # 旧格式不区分后端，无法判断耗时来自哪个后端，丢弃后重新积累
+            logging.info(f"{path} 为旧格式（不区分后端），已忽略。")
+            self.sections = {}
+            self.dirty = True
+        self.entries = self.sections.setdefault(backend, {})
+        self.seconds_per_unit = self._calibrate()
+
+    def _calibrate(self) -> float:
+        ratios = sorted(entry['seconds'] / entry['units'] for entry in self.entries.values()
+                        if entry.get('units') and not entry.get('timeouts'))
+        return ratios[len(ratios) // 2] if ratios else DEFAULT_SECONDS_PER_UNIT
+
+    def predict(self, fingerprint: str, units: float) -> float:
+        entry = self.entries.get(fingerprint)
+        if entry:
+            return entry['seconds']
+        return units * self.seconds_per_unit
+
+    def record(self, fingerprint: str, units: float, seconds: float, timed_out: bool = False) -> None:
+        entry = self.entries.get(fingerprint)
+        if entry is None:
+            entry = self.entries[fingerprint] = {'seconds': seconds, 'units': units, 'runs': 0, 'timeouts': 0}
+        else:
+            # 超时的耗时只是下限，取较大值
+            entry['seconds'] = (max(entry['seconds'], seconds) if timed_out
+                                else _HISTORY_ALPHA * seconds + (1 - _HISTORY_ALPHA) * entry['seconds'])
+            entry['units'] = units
+        entry['runs'] += 1
+        entry['timeouts'] += int(timed_out)
+        entry['last_seen'] = int(time.time())
+        self.dirty = True
+
+    def _prune(self) -> None:
+        """丢弃超过 max_age_days 未出现的指纹，每个后端最多保留 max_entries 个最近出现的指纹"""
+        oldest = time.time() - self.max_age_days * 86400
+        for name, entries in list(self.sections.items()):
+            kept = sorted(((fingerprint, entry) for fingerprint, entry in entries.items()
+                           if entry.get('last_seen', 0) >= oldest),
+                          key=lambda item: item[1].get('last_seen', 0), reverse=True)[:self.max_entries]
+            if len(kept) < len(entries):
+                entries.clear()
+                entries.update(kept)
+            if not entries and name != self.backend:
+                del self.sections[name]
+
+    def save(self) -> None:
+        if not self.path or not self.dirty:
+            return
+        self._prune()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.sections, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+class ChunkScheduler:
+    def __init__(self, backend, workers: int = ANALYZER_WORKERS, timeout: float | None = ANALYZER_TIMEOUT,
+                 history: AnalyzerHistory | None = None, quarantine_dir: str | None = ANALYZER_QUARANTINE_DIR,
+                 metrics=None):
+        self.backend = backend
+        # 进程内后端（JvmBackend）不能多线程共用
+        self.workers = max(1, workers) if getattr(backend, 'thread_safe', False) else 1
+        self.timeout = timeout
+        if timeout and hasattr(backend, 'timeout'):
+            backend.timeout = timeout
+        elif timeout:
+            logging.warning(f"{backend.name} 后端不支持超时终止，忽略 {timeout}s 的期限。")
+        self.history = history if history is not None else AnalyzerHistory(backend=backend.name)
+        self.quarantine_dir = quarantine_dir
+        self.metrics = metrics or PipelineMetrics()
+        self.quarantined: list[str] = []
+
+    def _plan(self, sql_files: list[str]) -> list[tuple[float, int, str, str, float]]:
+        """返回 (预测秒数, 原顺序, 文件, 指纹, 成本单位)，按预测耗时从大到小排序"""
+        plan = []
+        for order, sql_file in enumerate(sql_files):
+            with open(sql_file, 'r', encoding='utf-8') as f:
+                sql = f.read()
+            units = cost_units(sql)
+            fingerprint = fingerprint_sql(sql)
+            plan.append((self.history.predict(fingerprint, units), order, sql_file, fingerprint, units))
+        plan.sort(key=lambda item: (-item[0], item[1]))
+        return plan
+
+    def _analyze(self, sql_file: str):
+        started = time.perf_counter()
+        result = self.backend.analyze_file(sql_file)
+        return result, time.perf_counter() - started
+
+    def _quarantine(self, sql_file: str, fingerprint: str, seconds: float) -> None:
+        self.quarantined.append(sql_file)
+        logging.error(f"分析超时（{seconds:.1f}s > {self.timeout}s），已终止并隔离：{sql_file}")
+        if not self.quarantine_dir:
+            return
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        shutil.copy2(sql_file, os.path.join(self.quarantine_dir, os.path.basename(sql_file)))
+        with open(os.path.join(self.quarantine_dir, 'quarantine.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'chunk': sql_file, 'fingerprint': fingerprint, 'seconds': round(seconds, 3),
+                                'timeout': self.timeout, 'at': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                               ensure_ascii=False) + '\n')
+
+    def run(self, sql_files: list[str], on_result) -> dict:
+        with self.metrics.stage('schedule_plan') as st:
+            plan = self._plan(sql_files)
+            st.add(statements_in=len(plan))
+        durations: dict[int, float] = {}
+        started = time.perf_counter()
+        pending = {}
+        max_inflight = self.workers * 2
+
+        def collect(future) -> None:
+            predicted, order, sql_file, fingerprint, units = pending.pop(future)
+            result, seconds = future.result()
+            durations[order] = seconds
+            timed_out = 'timeout' in result.timings
+            self.history.record(fingerprint, units, seconds, timed_out)
+            if timed_out:
+                self._quarantine(sql_file, fingerprint, seconds)
+            on_result(sql_file, result)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='analyzer') as pool:
+            for item in plan:
+                if len(pending) >= max_inflight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                pending[pool.submit(self._analyze, item[2])] = item
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+        makespan = time.perf_counter() - started
+        self.history.save()
+        return self._report(plan, durations, makespan)
+
+    def _report(self, plan, durations: dict[int, float], makespan: float) -> dict:
+        fifo = simulate_makespan([durations[order] for order in sorted(durations)], self.workers)
+        lpt = simulate_makespan([durations[item[1]] for item in plan], self.workers)
+        report = {
+            'chunks': len(plan),
+            'workers': self.workers,
+            'makespan_seconds': round(makespan, 3),
+            'lpt_simulated_seconds': round(lpt, 3),
+            'fifo_simulated_seconds': round(fifo, 3),
+            'busy_seconds': round(sum(durations.values()), 3),
+            'quarantined': len(self.quarantined),
+        }
+        with self.metrics.stage('schedule') as st:
+            st.add(chunks=len(plan), quarantined=len(self.quarantined), makespan_ms=int(makespan * 1000),
+                   fifo_makespan_ms=int(fifo * 1000), lpt_makespan_ms=int(lpt * 1000))
+        if plan:
+            logging.info(f"LPT 调度：{len(plan)} 个 chunk，{self.workers} 路并发，实际完成 {makespan:.2f}s，"
+                         f"同样耗时按 FIFO 约 {fifo:.2f}s、按 LPT 约 {lpt:.2f}s，隔离 {len(self.quarantined)} 个。")
+        return report
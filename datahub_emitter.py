@@ -0,0 +1,170 @@
+"""
+Emit DataHub upstreamLineage MCPs straight to the GMS REST endpoint.
+
+Replaces the two-step flow (write column_lineage.json, then
+`datahub ingest -c yml/column_lineage.yml`): MCPs produced by
+main_to_json.iter_datahub_mcps are grouped into batches and sent by a pool of
+worker threads, each holding its own keep-alive connection. Failed requests
+(connection errors, 429 and 5xx) are retried with exponential backoff.
+"""
+import http.client
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from lineage_http import HttpError, KeepAliveClient, MockLineageServer, report_throughput
+from main_to_json import build_datahub_lineage, iter_datahub_mcps
+
+DATAHUB_SERVER = os.getenv("DATAHUB_SERVER", "http://localhost:8080")
+DATAHUB_TOKEN = os.getenv("DATAHUB_TOKEN", "")
+DATAHUB_BATCH_SIZE = int(os.getenv("DATAHUB_BATCH_SIZE", "100"))
+DATAHUB_CONCURRENCY = int(os.getenv("DATAHUB_CONCURRENCY", "4"))
+DATAHUB_MAX_RETRIES = int(os.getenv("DATAHUB_MAX_RETRIES", "5"))
+DATAHUB_BACKOFF = float(os.getenv("DATAHUB_BACKOFF", "0.5"))
+
+_SINGLE_ENDPOINT = "/aspects?action=ingestProposal"
+_BATCH_ENDPOINT = "/aspects?action=ingestProposalBatch"
+
+
+class DataHubRestEmitter:
+    """线程池 + 每线程一个长连接；batch_size>1 时使用 ingestProposalBatch"""
+
+    def __init__(self, server: str = DATAHUB_SERVER,
+                 token: str = DATAHUB_TOKEN,
+                 batch_size: int = DATAHUB_BATCH_SIZE,
+                 concurrency: int = DATAHUB_CONCURRENCY,
+                 max_retries: int = DATAHUB_MAX_RETRIES,
+                 backoff: float = DATAHUB_BACKOFF,
+                 timeout: float = 30.0):
+        self.server = server
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = {'X-RestLi-Protocol-Version': '2.0.0'}
+        if token:
+            self.headers['Authorization'] = f"Bearer {token}"
+        self._local = threading.local()
+        self._clients: list[KeepAliveClient] = []
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    def _client(self) -> KeepAliveClient:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = KeepAliveClient(self.server, timeout=self.timeout, headers=self.headers)
+            self._local.client = client
+            with self._lock:
+                self._clients.append(client)
+        return client
+
+    def _send_batch(self, batch: list[dict]) -> int:
+        if len(batch) == 1:
+            path, body = _SINGLE_ENDPOINT, {"proposal": batch[0]}
+        else:
+            path, body = _BATCH_ENDPOINT, {"proposals": batch}
+        attempt = 0
+        while True:
+            try:
+                self._client().post_json(path, body)
+                return len(batch)
+            except HttpError as e:
+                retryable = e.status == 429 or e.status >= 500
+                if not retryable or attempt >= self.max_retries:
+                    raise
+            except (OSError, http.client.HTTPException):
+                if attempt >= self.max_retries:
+                    raise
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            delay = self.backoff * (2 ** (attempt - 1))
+            time.sleep(delay + random.uniform(0, delay / 2))
+
+    def _batches(self, mcps):
+        batch = []
+        for mcp in mcps:
+            batch.append(mcp)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def emit(self, mcps) -> int:
+        """流式发送 MCP；在途批次不超过 2×并发数，避免一次性堆积整个负载"""
+        started = time.perf_counter()
+        pending = {}
+        max_inflight = self.concurrency * 2
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='datahub') as pool:
+            for batch in self._batches(mcps):
+                if len(pending) >= max_inflight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._collect(future, pending.pop(future))
+                future = pool.submit(self._send_batch, batch)
+                pending[future] = len(batch)
+            for future in list(pending):
+                self._collect(future, pending.pop(future))
+        self.close()
+        report_throughput("DataHub REST 发送", self.sent, started)
+        if self.failed or self.retries:
+            logging.warning(f"DataHub 发送失败 {self.failed} 条，重试 {self.retries} 次。")
+        return self.sent
+
+    def _collect(self, future, size: int) -> None:
+        try:
+            self.sent += future.result()
+        except Exception as e:
+            self.failed += size
+            logging.error(f"DataHub 批次发送失败（{size} 条）：{e}")
+
+    def close(self) -> None:
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+        self._local = threading.local()
+
+
+def emit_datahub_lineage(chunk_dir: str, emitter: DataHubRestEmitter) -> int:
+    lineage_map, skipped_rows = build_datahub_lineage(chunk_dir)
+    logging.info(f"共 {len(lineage_map)} 个目标数据集待发送，跳过 {skipped_rows} 行。")
+    return emitter.emit(iter_datahub_mcps(lineage_map))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Send column lineage MCPs to DataHub over REST')
+    parser.add_argument('chunk_dir', nargs='?', default='chunks', help='Directory containing chunk CSV files')
+    parser.add_argument('--server', default=DATAHUB_SERVER, help='DataHub GMS url')
+    parser.add_argument('--batch-size', type=int, default=DATAHUB_BATCH_SIZE, help='MCPs per request')
+    parser.add_argument('--concurrency', type=int, default=DATAHUB_CONCURRENCY, help='Parallel connections')
+    parser.add_argument('--retries', type=int, default=DATAHUB_MAX_RETRIES, help='Max retries per batch')
+    parser.add_argument('--backoff', type=float, default=DATAHUB_BACKOFF, help='Initial backoff seconds')
+    parser.add_argument('--mock-server', action='store_true',
+                        help='Send to a local stand-in server (use --mock-fail-every to inject 503s)')
+    parser.add_argument('--mock-fail-every', type=int, default=0, help='Mock server answers 503 every N requests')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    server = None
+    if args.mock_server:
+        server = MockLineageServer(fail_every=args.mock_fail_every).start()
+        args.server = server.url
+    try:
+        emitter = DataHubRestEmitter(args.server, batch_size=args.batch_size, concurrency=args.concurrency,
+                                     max_retries=args.retries, backoff=args.backoff)
+        emit_datahub_lineage(args.chunk_dir, emitter)
+        if server:
+            logging.info(f"替身服务收到 {server.items} 个 MCP，{server.requests} 个请求。")
+    finally:
+        if server:
+            server.stop()
@@ -1,9 +1,18 @@
 # python3
+import csv as csv_module
+import io
 import os
 import webbrowser
 import jpype
 import sys
 import glob
+import shlex
+import re
+import time
+
+from table_lineage import format_table_lineage_csv, rollup_table_lineage
+
+_PROCESS_STARTED = time.perf_counter()
 
 
 def get_file_character_count(file_path):
@@ -42,37 +51,276 @@ def save_to_file(file_name, contents):
     fh.write(contents)
     fh.close()
 
-def call_dataFlowAnalyzer(args):
-     # Start the Java Virtual Machine (JVM)
-    widget_server_url = "http://localhost:8000"
-    
-    # 尝试使用Java 8，如果不可用则使用默认版本
-    try:
-        java_home = "/Users/work/Library/Java/JavaVirtualMachines/corretto-1.8.0_392/Contents/Home"
-        if os.path.exists(java_home):
-            os.environ['JAVA_HOME'] = java_home
-            jvm_path = jpype.getDefaultJVMPath()
-        else:
-            jvm_path = jpype.getDefaultJVMPath()
-    except:
-        jvm_path = jpype.getDefaultJVMPath()
+# JVM startup settings. SQLFLOW_JVM_OPTS applies to every JVM (heap, GC, ...); SQLFLOW_CLI_JVM_OPTS only to the
+# short-lived one of the dlineage.py command line, where C1-only JIT and the serial GC start fastest.
+SQLFLOW_JVM_PATH = os.getenv("SQLFLOW_JVM_PATH") or None
+SQLFLOW_JVM_OPTS = os.getenv("SQLFLOW_JVM_OPTS", "")
+SQLFLOW_CLI_JVM_OPTS = os.getenv("SQLFLOW_CLI_JVM_OPTS", "-XX:+UseSerialGC -XX:TieredStopAtLevel=1")
+SQLFLOW_JVM_ASSERTIONS = os.getenv("SQLFLOW_JVM_ASSERTIONS", "false").lower() in ("1", "true", "yes", "y")
+# AppCDS: "auto" maps the archive when it exists, "dump" writes it when the JVM exits (JDK 13+), "off" disables it
+SQLFLOW_CDS = os.getenv("SQLFLOW_CDS", "auto").lower()
+SQLFLOW_CDS_ARCHIVE = os.getenv("SQLFLOW_CDS_ARCHIVE") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "jar", "dlineage.jsa")
+
+
+def java_major_version(jvm_path):
+    """Major Java version from the `release` file of the JDK that contains jvm_path, None if unknown."""
+    directory = os.path.dirname(os.path.abspath(jvm_path))
+    for _ in range(6):
+        release = os.path.join(directory, "release")
+        if os.path.isfile(release):
+            with open(release, "r", encoding="utf-8", errors="replace") as f:
+                match = re.search(r'^JAVA_VERSION="(\d+)(?:\.(\d+))?', f.read(), re.MULTILINE)
+            if not match:
+                return None
+            major = int(match.group(1))
+            return int(match.group(2) or 0) if major == 1 else major
+        directory = os.path.dirname(directory)
+    return None
+
+
+def jvm_options(cli=False, cds=None, archive=None, java_version=None):
+    """JVM flags for start_jvm; the classpath is added separately.
+
+    An existing archive is only mapped on a JDK known to be 13 or later. Whenever a CDS flag is added, JVM
+    logging is moved to stderr: a rejected archive is reported as a warning, which unified logging would
+    otherwise print on stdout ahead of the /csv output.
+    """
+    cds = cds or SQLFLOW_CDS
+    archive = archive or SQLFLOW_CDS_ARCHIVE
+    options = ["-ea"] if SQLFLOW_JVM_ASSERTIONS else []
+    options += shlex.split(SQLFLOW_JVM_OPTS)
+    if cli:
+        options += shlex.split(SQLFLOW_CLI_JVM_OPTS)
+    cds_options = []
+    if cds == "dump":
+        cds_options = ["-XX:ArchiveClassesAtExit=" + archive]
+    elif cds == "auto" and os.path.exists(archive) and (java_version or 0) >= 13:
+        # an archive from another JDK or classpath is rejected by the JVM, which then starts without it
+        cds_options = ["-XX:SharedArchiveFile=" + archive]
+    if cds_options:
+        options += ["-XX:+IgnoreUnrecognizedVMOptions", "-Xlog:disable", "-Xlog:all=warning:stderr"] + cds_options
+    options.append("-Djava.awt.headless=true")
+    return options
+
+
+def start_jvm(cli=False):
+    """Start the JVM with the jars under jar/ once; later calls reuse the running JVM.
+
+    The JVM comes from SQLFLOW_JVM_PATH or jpype's default lookup (JAVA_HOME, then the system java).
+    """
+    if jpype.isJVMStarted():
+        return
+    jvm_path = SQLFLOW_JVM_PATH or jpype.getDefaultJVMPath()
 
     # 扫描项目 jar/ 目录下的所有 .jar
-    curdir = os.path.dirname(__file__)
+    curdir = os.path.dirname(os.path.abspath(__file__))
     jar_dir = os.path.join(curdir, 'jar')
-    project_jars = glob.glob(os.path.join(jar_dir, '*.jar'))
+    project_jars = sorted(glob.glob(os.path.join(jar_dir, '*.jar')))
 
-    # 构建 classpath 参数
+    # 构建 classpath 参数（CDS 归档要求 classpath 与生成时一致，因此排序）
     classpath = os.pathsep.join(project_jars)
     classpath_arg = "-Djava.class.path=" + classpath
 
-    # 启动 JVM（Java 8兼容的参数）
-    jvm_args = [
-        "-ea", 
-        classpath_arg,
-        "-Djava.awt.headless=true"
-    ]
-    jpype.startJVM(jvm_path, *jvm_args)
+    jpype.startJVM(jvm_path, classpath_arg, *jvm_options(cli, java_version=java_major_version(jvm_path)))
+
+
+def generate_graph_json(vendor, dataflow, er=False):
+    """Render a dataflow into the JSON consumed by the widget (lineage graph or ER diagram)."""
+    DataFlowGraphGenerator = jpype.JClass("gudusoft.gsqlparser.dlineage.graph.DataFlowGraphGenerator")
+    generator = DataFlowGraphGenerator()
+    if er:
+        return str(generator.genERGraph(vendor, dataflow))
+    return str(generator.genDlineageGraph(vendor, False, dataflow))
+
+
+SQLFLOW_CHAR_LIMIT = 10000
+LINEAGE_CSV_HEADER = [
+    'SOURCE_DB', 'SOURCE_SCHEMA', 'SOURCE_TABLE_ID', 'SOURCE_TABLE',
+    'SOURCE_COLUMN_ID', 'SOURCE_COLUMN', 'TARGET_DB', 'TARGET_SCHEMA',
+    'TARGET_TABLE_ID', 'TARGET_TABLE', 'TARGET_COLUMN_ID', 'TARGET_COLUMN',
+    'RELATION_TYPE', 'EFFECTTYPE'
+]
+# relationship types of the dataflow model -> RELATION_TYPE of the column level csv
+RELATION_TYPE_NAMES = {"fdd": "direct", "fdr": "indirect"}
+
+
+def _jstr(value, default=""):
+    return default if value is None else str(value)
+
+
+def iter_dataflow_lineage(dataflow):
+    """Walk the dataflow relationships and yield 14-field tuples in the /csv column order.
+
+    Only fdd/fdr relations between tables and views are kept, which is what /csv /traceView reports.
+    Table attributes are looked up once per table instead of once per column.
+    """
+    parents = {}
+    for group in (dataflow.getTables(), dataflow.getViews()):
+        if group is None:
+            continue
+        for table in group:
+            parents[_jstr(table.getId())] = (_jstr(table.getDatabase(), "default") or "default",
+                                             _jstr(table.getSchema(), "default") or "default",
+                                             _jstr(table.getName()))
+    for relation in dataflow.getRelationships():
+        relation_type = _jstr(relation.getType())
+        if relation_type not in RELATION_TYPE_NAMES:
+            continue
+        target = relation.getTarget()
+        if target is None:
+            continue
+        target_parent_id = _jstr(target.getParent_id())
+        target_parent = parents.get(target_parent_id)
+        if target_parent is None:
+            continue
+        target_part = (target_parent[0], target_parent[1], target_parent_id, target_parent[2],
+                       _jstr(target.getId()), _jstr(target.getColumn()))
+        tail = (RELATION_TYPE_NAMES[relation_type], _jstr(relation.getEffectType()))
+        for source in relation.getSources():
+            source_parent_id = _jstr(source.getParent_id())
+            source_parent = parents.get(source_parent_id)
+            if source_parent is None:
+                continue
+            yield (source_parent[0], source_parent[1], source_parent_id, source_parent[2],
+                   _jstr(source.getId()), _jstr(source.getColumn())) + target_part + tail
+
+
+# (metadata path, mtime_ns, vendor) -> parsed TSQLEnv, kept for the life of the JVM
+_SQLENV_CACHE = {}
+
+
+def load_sqlenv(metadata_path, vendor, use_cache=True):
+    """Parse a /env metadata json for the vendor, reusing the parsed TSQLEnv while the file is unchanged.
+
+    The cached TSQLEnv is shared by every analysis in this JVM and must be treated as read-only.
+    """
+    metadata_path = os.path.abspath(metadata_path)
+    if not os.path.exists(metadata_path):
+        return None
+    key = (metadata_path, os.stat(metadata_path).st_mtime_ns, str(vendor))
+    if use_cache and key in _SQLENV_CACHE:
+        return _SQLENV_CACHE[key]
+    File = jpype.JClass("java.io.File")
+    TJSONSQLEnvParser = jpype.JClass("gudusoft.gsqlparser.sqlenv.parser.TJSONSQLEnvParser")
+    SQLUtil = jpype.JClass("gudusoft.gsqlparser.util.SQLUtil")
+    jsonSQLEnvParser = TJSONSQLEnvParser(None, None, None)
+    envs = jsonSQLEnvParser.parseSQLEnv(vendor, SQLUtil.getFileContent(File(metadata_path)))
+    sqlenv = envs[0] if envs != None and envs.length > 0 else None
+    if use_cache:
+        # drop the entries of older versions of the same file
+        for stale in [k for k in _SQLENV_CACHE if k[0] == metadata_path and k[2] == key[2]]:
+            del _SQLENV_CACHE[stale]
+        _SQLENV_CACHE[key] = sqlenv
+    return sqlenv
+
+
+def analyze_sql_records(sql_text, db_type="oracle", sqlenv=None):
+    """Analyse SQL text in the running JVM with the /csv /traceView options.
+
+    Returns (rows, errors): rows are the tuples of iter_dataflow_lineage, errors the analyzer messages.
+    """
+    start_jvm()
+    TGSqlParser = jpype.JClass("gudusoft.gsqlparser.TGSqlParser")
+    DataFlowAnalyzer = jpype.JClass("gudusoft.gsqlparser.dlineage.DataFlowAnalyzer")
+    if len(sql_text) > SQLFLOW_CHAR_LIMIT:
+        return [], ["SQLFlow lite version only supports processing SQL statements with a maximum of 10,000 "
+                    "characters."]
+    vendor = TGSqlParser.getDBVendorByName(db_type)
+    dlineage = DataFlowAnalyzer(sql_text, vendor, True)
+    if sqlenv is not None:
+        dlineage.setSqlEnv(sqlenv)
+    dlineage.setTransform(False)
+    dlineage.setTransformCoordinate(False)
+    dlineage.setShowJoin(False)
+    dlineage.setIgnoreRecordSet(False)
+    dlineage.setLinkOrphanColumnToFirstTable(False)
+    dlineage.setIgnoreCoordinate(False)
+    dlineage.setSimpleShowTopSelectResultSet(False)
+    dlineage.setShowImplicitSchema(False)
+    dlineage.setIgnoreTemporaryTable(True)
+    dlineage.setShowCallRelation(True)
+    dlineage.setShowConstantTable(False)
+    dlineage.setShowCountTableColumn(False)
+    dlineage.setTextFormat(False)
+    dlineage.generateDataFlow()
+    rows = list(iter_dataflow_lineage(dlineage.getDataFlow()))
+    errors = [str(err.getErrorMessage()) for err in dlineage.getErrorMessages()]
+    return rows, errors
+
+
+def format_lineage_csv(rows, delimiter=","):
+    """Render lineage tuples as properly quoted csv, expressions with commas stay in one column."""
+    buffer = io.StringIO()
+    writer = csv_module.writer(buffer, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(LINEAGE_CSV_HEADER)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+# /outputs kind=path,...: every kind is rendered from the same generateDataFlow() result
+OUTPUT_KINDS = ("column_csv", "native_csv", "table_csv", "sqlflow_table_csv", "json", "table_json", "xml")
+
+
+def parse_outputs(spec):
+    """'column_csv=a.csv,table_csv=b.csv' -> {kind: path}; raises ValueError for unknown kinds."""
+    outputs = {}
+    for item in spec.split(","):
+        kind, _, path = item.partition("=")
+        kind = kind.strip()
+        if kind not in OUTPUT_KINDS or not path.strip():
+            raise ValueError("invalid /outputs item %r, expected kind=path with kind in %s"
+                             % (item, ", ".join(OUTPUT_KINDS)))
+        outputs[kind] = path.strip()
+    return outputs
+
+
+def write_outputs(dlineage, dataflow, vendor, outputs, delimiter=","):
+    """Render one analysed dataflow into every requested output file.
+
+    table_csv is rolled up in Python from the column rows; sqlflow_table_csv / table_json use the
+    analyzer's own table-level lineage of the same dataflow.
+    """
+    ProcessUtility = jpype.JClass("gudusoft.gsqlparser.dlineage.util.ProcessUtility")
+    DataFlowAnalyzer = jpype.JClass("gudusoft.gsqlparser.dlineage.DataFlowAnalyzer")
+    JSON = jpype.JClass("gudusoft.gsqlparser.util.json.JSON")
+    XML2Model = jpype.JClass("gudusoft.gsqlparser.dlineage.util.XML2Model")
+    rows = None
+    for kind, path in outputs.items():
+        if kind in ("native_csv", "table_csv") and rows is None:
+            rows = list(iter_dataflow_lineage(dataflow))
+        if kind == "column_csv":
+            result = str(ProcessUtility.generateColumnLevelLineageCsv(dlineage, dataflow, delimiter))
+        elif kind == "native_csv":
+            result = format_lineage_csv(rows, delimiter)
+        elif kind == "table_csv":
+            result = format_table_lineage_csv(rollup_table_lineage(rows), delimiter)
+        elif kind == "sqlflow_table_csv":
+            result = str(ProcessUtility.generateTableLevelLineageCsv(dlineage, dataflow, delimiter))
+        elif kind == "json":
+            result = str(JSON.toJSONString(DataFlowAnalyzer.getSqlflowJSONModel(dataflow, vendor)))
+        elif kind == "table_json":
+            tableDataflow = ProcessUtility.generateTableLevelLineage(dlineage, dataflow)
+            result = str(JSON.toJSONString(DataFlowAnalyzer.getSqlflowJSONModel(tableDataflow, vendor)))
+        else:
+            result = str(XML2Model.saveXML(dataflow))
+        save_to_file(path, result)
+
+
+def print_timings(timings):
+    """Report timings on stderr as 'SQLFLOW_TIMING key=seconds ...' so callers can split JVM time from overhead."""
+    parts = " ".join("%s=%.6f" % (key, value) for key, value in timings.items())
+    print("SQLFLOW_TIMING " + parts, file=sys.stderr)
+
+
+def call_dataFlowAnalyzer(args):
+     # Start the Java Virtual Machine (JVM)
+    widget_server_url = "http://localhost:8000"
+    openBrowser = indexOf(args, "/nobrowser") == -1
+    timings = {}
+    started = time.perf_counter()
+    start_jvm(cli=True)
+    timings["jvm_start"] = time.perf_counter() - started
 
     try:
         TGSqlParser = jpype.JClass("gudusoft.gsqlparser.TGSqlParser")
@@ -116,6 +364,14 @@ def call_dataFlowAnalyzer(args):
                       "000 characters. If you need to process SQL statements without length restrictions, "
                       "please contact support@gudusoft.com for more information.")
                 return
+        elif indexOf(args, "/stdin") != -1:
+            # SQL text is piped in, no chunk file needed on disk
+            sqlFiles = sys.stdin.read()
+            if len(sqlFiles) > 10000:
+                print("SQLFlow lite version only supports processing SQL statements with a maximum of 10,"
+                      "000 characters. If you need to process SQL statements without length restrictions, "
+                      "please contact support@gudusoft.com for more information.")
+                return
         else:
             print("Please specify a sql file path or directory path to analyze dlineage.")
             return
@@ -145,22 +401,26 @@ def call_dataFlowAnalyzer(args):
             topselectlist = True
         tableLineage = indexOf(args, "/tableLineage") != -1
         csv = indexOf(args, "/csv") != -1
+        native = indexOf(args, "/native") != -1
         delimiter = args.get(indexOf(args, "/delimiter") + 1) if indexOf(args, "/delimiter") != -1 and len(
             args) > indexOf(args, "/delimiter") + 1 else ","
         if tableLineage:
             simple = False
             ignoreResultSets = False
+        outputs = None
+        if indexOf(args, "/outputs") != -1 and len(args) > indexOf(args, "/outputs") + 1:
+            try:
+                outputs = parse_outputs(args[indexOf(args, "/outputs") + 1])
+            except ValueError as e:
+                print(str(e))
+                return
 
         sqlenv = None
         if indexOf(args, "/env") != -1 and len(args) > indexOf(args, "/env") + 1:
-            metadataFile = File(args[indexOf(args, "/env") + 1])
-            if metadataFile.exists():
-                TJSONSQLEnvParser = jpype.JClass("gudusoft.gsqlparser.sqlenv.parser.TJSONSQLEnvParser")
-                jsonSQLEnvParser = TJSONSQLEnvParser(None, None, None)
-                SQLUtil = jpype.JClass("gudusoft.gsqlparser.util.SQLUtil")
-                envs = jsonSQLEnvParser.parseSQLEnv(vendor, SQLUtil.getFileContent(metadataFile))
-                if envs != None and envs.length > 0:
-                    sqlenv = envs[0]
+            envStarted = time.perf_counter()
+            sqlenv = load_sqlenv(args[indexOf(args, "/env") + 1], vendor, use_cache=False)
+            timings["env"] = time.perf_counter() - envStarted
+        analyzeStarted = time.perf_counter()
         dlineage = DataFlowAnalyzer(sqlFiles, vendor, simple)
         if sqlenv != None:
             dlineage.setSqlEnv(sqlenv)
@@ -194,15 +454,23 @@ def call_dataFlowAnalyzer(args):
         if simple and not jsonFormat:
             dlineage.setTextFormat(textFormat)
 
-        if indexOf(args, "/er") != -1:
+        if outputs:
+            # one analysis, several renderings
+            dlineage.generateDataFlow()
+            dataflow = dlineage.getDataFlow()
+            timings["analyze"] = time.perf_counter() - analyzeStarted
+            renderStarted = time.perf_counter()
+            write_outputs(dlineage, dataflow, vendor, outputs, delimiter)
+            timings["render"] = time.perf_counter() - renderStarted
+            result = None
+        elif indexOf(args, "/er") != -1:
             dlineage.getOption().setShowERDiagram(True)
             dlineage.generateDataFlow()
             dataflow = dlineage.getDataFlow()
-            DataFlowGraphGenerator = jpype.JClass("gudusoft.gsqlparser.dlineage.graph.DataFlowGraphGenerator")
-            generator = DataFlowGraphGenerator()
-            result = generator.genERGraph(vendor, dataflow)
-            save_to_file("widget/json/erGraph.json", str(result))
-            webbrowser.open_new(widget_server_url + "/er.html")
+            result = generate_graph_json(vendor, dataflow, er=True)
+            save_to_file("widget/json/erGraph.json", result)
+            if openBrowser:
+                webbrowser.open_new(widget_server_url + "/er.html")
             return
         elif tableLineage:
             dlineage.generateDataFlow()
@@ -220,7 +488,10 @@ def call_dataFlowAnalyzer(args):
         else:
             result = dlineage.generateDataFlow()
             dataflow = dlineage.getDataFlow()
-            if csv:
+            if csv and native:
+                # walk the relationships directly, no column repair needed downstream
+                result = format_lineage_csv(iter_dataflow_lineage(dataflow), delimiter).rstrip("\n")
+            elif csv:
                 dataflow = dlineage.getDataFlow()
                 result = ProcessUtility.generateColumnLevelLineageCsv(dlineage, dataflow, delimiter)
             elif jsonFormat:
@@ -237,14 +508,14 @@ def call_dataFlowAnalyzer(args):
                 dataflow = RemoveDataflowFunction().removeFunction(dataflow, vendor)
                 result = XML2Model.saveXML(dataflow)
 
+        timings.setdefault("analyze", time.perf_counter() - analyzeStarted)
         if result != None:
             print(result)
         if dataflow != None and indexOf(args, "/graph") != -1:
-            DataFlowGraphGenerator = jpype.JClass("gudusoft.gsqlparser.dlineage.graph.DataFlowGraphGenerator")
-            generator = DataFlowGraphGenerator()
-            result = generator.genDlineageGraph(vendor, False, dataflow)
-            save_to_file("widget/json/lineageGraph.json", str(result))
-            webbrowser.open_new(widget_server_url)
+            result = generate_graph_json(vendor, dataflow)
+            save_to_file("widget/json/lineageGraph.json", result)
+            if openBrowser:
+                webbrowser.open_new(widget_server_url)
         errors = dlineage.getErrorMessages()
         if not errors.isEmpty():
             print("Error log:\n")
@@ -254,6 +525,9 @@ def call_dataFlowAnalyzer(args):
     finally:
         # Shutdown the JVM when done
         jpype.shutdownJVM()
+        if os.getenv("SQLFLOW_TIMING"):
+            timings["process"] = time.perf_counter() - _PROCESS_STARTED
+            print_timings(timings)
 
 
 if __name__ == "__main__":
@@ -264,9 +538,10 @@ if __name__ == "__main__":
               "<resultset_types>] [/ic] [/lof] [/j] [/json] [/traceView] [/t <database type>] [/o <output file path>] "
               "[/version] [/env <path_to_metadata.json>]  [/tableLineage [/csv [/delimeter <delimeter>]]] [/transform "
               "[/coor]] [/showConstant] [/treatArgumentsInCountFunctionAsDirectDataflow] [/filterRelationTypes "
-              "<relationTypes>]")
+              "<relationTypes>] [/outputs <kind=path,...>]")
         print("/f: Optional, the full path to SQL file.")
         print("/d: Optional, the full path to the directory includes the SQL files.")
+        print("/stdin: Optional, read the SQL text from standard input instead of /f or /d.")
         print("/j: Optional, return the result including the join relation.")
         print("/s: Optional, simple output, ignore the intermediate results.")
         print("/topselectlist: Optional, simple output with top select results.")
@@ -287,7 +562,11 @@ if __name__ == "__main__":
         print("/json: Optional, print the json format output.")
         print("/tableLineage [/csv /delimiter]: Optional, output tabel level lineage.")
         print("/csv: Optional, output column level lineage in csv format.")
+        print("/native: Optional, with /csv, build the csv rows from the dataflow relationships in Python, "
+              "expressions containing the delimiter are quoted.")
         print("/delimiter: Optional, the delimiter of output column level lineage in csv format.")
+        print("/outputs: Optional, kind=path[,kind=path...], analyse once and write several outputs. Kinds: "
+              + ", ".join(OUTPUT_KINDS) + "; table_csv is rolled up from the column rows in Python.")
         print("/t: Option, set the database type. "
               + "Support access,bigquery,couchbase,dax,db2,greenplum,hana,hive,impala,informix,mdx,mssql,\n"
               + "sqlserver,mysql,netezza,odbc,openedge,oracle,postgresql,postgres,redshift,snowflake,\n"
@@ -305,6 +584,8 @@ if __name__ == "__main__":
               "commas")
         print("/graph: Optional, Open a browser page to graphically display the  results")
         print("/er: Optional, Open a browser page and display the ER diagram graphically")
+        print("/nobrowser: Optional, only write the /graph or /er json under widget/json, do not open a browser. "
+              "Use widget_graph_batch.py to build graph json for many files in one JVM.")
         sys.exit(0)
 
     call_dataFlowAnalyzer(args)
@@ -0,0 +1,164 @@
+"""
+Export chunk lineage CSVs to graph-database bulk import files (neo4j-admin import layout).
+
+Nodes:  tables.csv (:Table), columns.csv (:Column)
+Edges:  has_column.csv (Table)-[:HAS_COLUMN]->(Column)
+        column_lineage.csv (Column)-[:LINEAGE {relationType, effectType}]->(Column)
+
+Ids are derived from the qualified names, so they are stable across runs and
+chunks can be processed independently; rows are streamed once and deduplicated
+through ExternalSortedSet, keeping memory bounded by FIELDS_MEMORY_BUDGET.
+"""
+import csv
+import glob
+import hashlib
+import logging
+import os
+
+from generate_fields import ExternalSortedSet, FIELDS_MEMORY_BUDGET
+from main_to_json import EXPECTED_LINEAGE_COLUMNS, _normalize_lineage_row, _strip_identifier
+
+GRAPH_EXPORT_DIR = os.getenv("GRAPH_EXPORT_DIR", "graph_import")
+
+
+def stable_id(*parts: str) -> str:
+    digest = hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+    return digest[:16]
+
+
+def _qualified_table(schema: str, table: str) -> str:
+    table_part = _strip_identifier(table)
+    schema_part = _strip_identifier(schema)
+    if not table_part:
+        return ''
+    if '.' in table_part or not schema_part or schema_part.lower() == 'default':
+        return table_part
+    return f"{schema_part}.{table_part}"
+
+
+def _table_node(db: str, name: str) -> tuple[str, str, str, str]:
+    """表节点 (id, name, db, schema)；schema 取自规范化后的 name，同一 id 只对应一行"""
+    schema = name.rsplit('.', 1)[0] if '.' in name else ''
+    return stable_id(db, name), name, db, schema
+
+
+def iter_chunk_rows(chunk_dir: str):
+    """逐行读取 chunks/*.csv，跳过表头并修正列数"""
+    for path in sorted(glob.glob(os.path.join(chunk_dir, '*.csv'))):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            for row in reader:
+                if not row or all(cell.strip() == '' for cell in row):
+                    continue
+                if row[0] == 'SOURCE_DB' or len(row) < EXPECTED_LINEAGE_COLUMNS:
+                    # 表头、错误日志等非血缘行
+                    continue
+                fixed = _normalize_lineage_row(row)
+                if fixed:
+                    yield fixed
+
+
+def export_graph_import(chunk_dir: str = 'chunks',
+                        output_dir: str = GRAPH_EXPORT_DIR,
+                        max_items: int = FIELDS_MEMORY_BUDGET) -> dict[str, int]:
+    tables = ExternalSortedSet(max_items)
+    columns = ExternalSortedSet(max_items)
+    lineage = ExternalSortedSet(max_items)
+    rows = 0
+    skipped = 0
+    try:
+        for row in iter_chunk_rows(chunk_dir):
+            rows += 1
+            items = graph_items(row)
+            if items is None:
+                skipped += 1
+                continue
+            for table in items[0]:
+                tables.add(table)
+            for column in items[1]:
+                columns.add(column)
+            lineage.add(items[2])
+        counts = write_graph_import(output_dir, tables, columns, lineage)
+    finally:
+        tables.close()
+        columns.close()
+        lineage.close()
+    logging.info(f"图数据库导入文件已生成：{output_dir}，读取 {rows} 行，跳过 {skipped} 行，"
+                 f"表 {counts['tables']}，字段 {counts['columns']}，血缘 {counts['lineage']}。")
+    return counts
+
+
+def graph_items(row) -> tuple[tuple, tuple, tuple] | None:
+    """一行血缘 → ((源表, 目标表), (源字段, 目标字段), 血缘边)；缺表名或字段名时返回 None"""
+    (src_db, src_schema, _, src_table, _, src_col,
+     tgt_db, tgt_schema, _, tgt_table, _, tgt_col,
+     relation_type, effect_type) = row[:EXPECTED_LINEAGE_COLUMNS]
+    src_name = _qualified_table(src_schema, src_table)
+    tgt_name = _qualified_table(tgt_schema, tgt_table)
+    src_col = _strip_identifier(src_col)
+    tgt_col = _strip_identifier(tgt_col)
+    if not src_name or not tgt_name or not src_col or not tgt_col:
+        return None
+    src_node = _table_node(src_db, src_name)
+    tgt_node = _table_node(tgt_db, tgt_name)
+    src_table_id, tgt_table_id = src_node[0], tgt_node[0]
+    src_col_id = stable_id(src_db, src_name, src_col)
+    tgt_col_id = stable_id(tgt_db, tgt_name, tgt_col)
+    return ((src_node, tgt_node),
+            ((src_col_id, src_col, f"{src_name}.{src_col}", src_table_id),
+             (tgt_col_id, tgt_col, f"{tgt_name}.{tgt_col}", tgt_table_id)),
+            (src_col_id, tgt_col_id, relation_type, effect_type))
+
+
+def write_graph_import(output_dir: str, tables, columns, lineage) -> dict[str, int]:
+    """按排好序的表、字段、血缘边写出导入文件，返回各自的数量"""
+    os.makedirs(output_dir, exist_ok=True)
+    counts = {}
+    counts['tables'] = _write_csv(
+        os.path.join(output_dir, 'tables.csv'),
+        ['tableId:ID(Table)', 'name', 'db', 'schema'],
+        tables)
+    column_count = 0
+    path_columns = os.path.join(output_dir, 'columns.csv')
+    path_has_column = os.path.join(output_dir, 'has_column.csv')
+    with open(path_columns, 'w', newline='', encoding='utf-8') as col_f, \
+            open(path_has_column, 'w', newline='', encoding='utf-8') as rel_f:
+        col_writer = csv.writer(col_f)
+        rel_writer = csv.writer(rel_f)
+        col_writer.writerow(['columnId:ID(Column)', 'name', 'qualifiedName'])
+        rel_writer.writerow([':START_ID(Table)', ':END_ID(Column)', ':TYPE'])
+        for col_id, name, qualified, table_id in columns:
+            col_writer.writerow([col_id, name, qualified])
+            rel_writer.writerow([table_id, col_id, 'HAS_COLUMN'])
+            column_count += 1
+    counts['columns'] = column_count
+    counts['lineage'] = _write_csv(
+        os.path.join(output_dir, 'column_lineage.csv'),
+        [':START_ID(Column)', ':END_ID(Column)', ':TYPE', 'relationType', 'effectType'],
+        ((src, tgt, 'LINEAGE', rel, eff) for src, tgt, rel, eff in lineage))
+    return counts
+
+
+def _write_csv(path: str, header: list[str], items) -> int:
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for item in items:
+            writer.writerow(item)
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Export chunk lineage CSVs as graph database import files')
+    parser.add_argument('chunk_dir', nargs='?', default='chunks', help='Directory containing chunk CSV files')
+    parser.add_argument('-o', '--output', default=GRAPH_EXPORT_DIR, help='Output directory')
+    parser.add_argument('--memory-budget', type=int, default=FIELDS_MEMORY_BUDGET,
+                        help='Max distinct items kept in memory before spilling to disk')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    export_graph_import(args.chunk_dir, args.output, max_items=args.memory_budget)
@@ -0,0 +1,204 @@
+"""
+Turn chunk lineage CSVs into OpenLineage RunEvents (eventType COMPLETE).
+
+One event per chunk: the chunk's source tables become inputs, target tables
+become outputs with a schema facet and a columnLineage facet, in the same shape
+as yml/openlineage_test.json. Events are written as NDJSON files or POSTed in
+batches (json arrays) to an HTTP endpoint over a reused connection.
+"""
+import csv
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from lineage_http import KeepAliveClient, MockLineageServer, report_throughput
+from main_to_json import EXPECTED_LINEAGE_COLUMNS, _map_transform_operation, _normalize_lineage_row, _strip_identifier
+
+OPENLINEAGE_NAMESPACE = os.getenv("OPENLINEAGE_NAMESPACE", "btars_demo")
+OPENLINEAGE_PLATFORM = os.getenv("OPENLINEAGE_PLATFORM", "oracle")
+OPENLINEAGE_PRODUCER = os.getenv("OPENLINEAGE_PRODUCER", "https://github.com/sqlparser/python_data_lineage")
+OPENLINEAGE_URL = os.getenv("OPENLINEAGE_URL", "http://localhost:5000")
+OPENLINEAGE_ENDPOINT = os.getenv("OPENLINEAGE_ENDPOINT", "/api/v1/lineage")
+OPENLINEAGE_BATCH_SIZE = int(os.getenv("OPENLINEAGE_BATCH_SIZE", "500"))
+
+_RUN_EVENT_SCHEMA = "https://openlineage.io/spec/2-0-2/OpenLineage.json#/$defs/RunEvent"
+_SCHEMA_FACET_URL = "https://openlineage.io/spec/facets/1-0-0/SchemaDatasetFacet.json"
+_COLUMN_LINEAGE_FACET_URL = "https://openlineage.io/spec/facets/1-0-0/ColumnLineageDatasetFacet.json"
+
+
+def _dataset_ref(schema: str, table: str) -> tuple[str, str] | None:
+    """返回 (namespace, name)，namespace 形如 oracle://smtmods"""
+    table_part = _strip_identifier(table)
+    schema_part = _strip_identifier(schema)
+    if not table_part:
+        return None
+    if '.' in table_part:
+        schema_part, _, table_part = table_part.rpartition('.')
+    if not schema_part or schema_part.lower() == 'default':
+        schema_part = 'default'
+    return f"{OPENLINEAGE_PLATFORM}://{schema_part.lower()}", table_part.lower()
+
+
+def _field_name(column: str) -> str:
+    cleaned = _strip_identifier(column)
+    if not cleaned or any(ch in cleaned for ch in ' ()'):
+        return ''
+    return cleaned
+
+
+def _schema_facet(fields) -> dict:
+    return {
+        "_producer": OPENLINEAGE_PRODUCER,
+        "_schemaURL": _SCHEMA_FACET_URL,
+        "fields": [{"name": name, "type": "STRING"} for name in sorted(fields)]
+    }
+
+
+def build_run_event(job_name: str, rows: list[list[str]], event_time: str | None = None) -> dict | None:
+    """由一个 chunk 的血缘行构造 OpenLineage COMPLETE 事件"""
+    inputs: dict[tuple[str, str], set] = {}
+    outputs: dict[tuple[str, str], dict[str, list]] = {}
+    for row in rows:
+        src = _dataset_ref(row[1], row[3])
+        tgt = _dataset_ref(row[7], row[9])
+        if not src or not tgt:
+            continue
+        src_field = _field_name(row[5])
+        tgt_field = _field_name(row[11])
+        input_fields = inputs.setdefault(src, set())
+        output_fields = outputs.setdefault(tgt, {})
+        if not src_field or not tgt_field:
+            continue
+        input_fields.add(src_field)
+        entry = {"namespace": src[0], "name": src[1], "field": src_field}
+        lineage = output_fields.setdefault(tgt_field, [])
+        if all(existing != entry for existing, _ in lineage):
+            lineage.append((entry, _map_transform_operation(row[12])))
+    if not outputs:
+        return None
+
+    output_datasets = []
+    for (namespace, name), fields in sorted(outputs.items()):
+        column_lineage = {}
+        for field, sources in sorted(fields.items()):
+            column_lineage[field] = {
+                "inputFields": [entry for entry, _ in sources],
+                "transformationDescription": ', '.join(
+                    f"{op.upper()} {entry['field']}" for entry, op in sources),
+                "transformationType": "IDENTITY" if all(op == 'copy' for _, op in sources) else "TRANSFORMATION"
+            }
+        facets = {"schema": _schema_facet(fields.keys())}
+        if column_lineage:
+            facets["columnLineage"] = {
+                "_producer": OPENLINEAGE_PRODUCER,
+                "_schemaURL": _COLUMN_LINEAGE_FACET_URL,
+                "fields": column_lineage
+            }
+        output_datasets.append({"namespace": namespace, "name": name, "facets": facets})
+
+    input_datasets = []
+    for (namespace, name), fields in sorted(inputs.items()):
+        dataset = {"namespace": namespace, "name": name}
+        if fields:
+            dataset["facets"] = {"schema": _schema_facet(fields)}
+        input_datasets.append(dataset)
+
+    return {
+        "eventType": "COMPLETE",
+        "eventTime": event_time or datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+        "run": {"runId": str(uuid.uuid4())},
+        "job": {"namespace": OPENLINEAGE_NAMESPACE, "name": job_name},
+        "inputs": input_datasets,
+        "outputs": output_datasets,
+        "producer": OPENLINEAGE_PRODUCER,
+        "schemaURL": _RUN_EVENT_SCHEMA
+    }
+
+
+def iter_run_events(chunk_dir: str):
+    """逐个 chunk CSV 生成事件，内存中只保留当前 chunk 的行"""
+    event_time = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+    for path in sorted(glob.glob(os.path.join(chunk_dir, '*.csv'))):
+        rows = []
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.reader(f):
+                if not row or row[0] == 'SOURCE_DB' or len(row) < EXPECTED_LINEAGE_COLUMNS:
+                    continue
+                fixed = _normalize_lineage_row(row)
+                if fixed:
+                    rows.append(fixed)
+        job_name = os.path.splitext(os.path.basename(path))[0]
+        event = build_run_event(job_name, rows, event_time=event_time)
+        if event:
+            yield event
+
+
+def _batched(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_ndjson(events, output_dir: str, batch_size: int = OPENLINEAGE_BATCH_SIZE) -> int:
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    total = 0
+    for idx, batch in enumerate(_batched(events, batch_size), start=1):
+        path = os.path.join(output_dir, f"events-{idx:05d}.ndjson")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in batch))
+        total += len(batch)
+    report_throughput("OpenLineage NDJSON 输出", total, started)
+    return total
+
+
+def post_events(events, base_url: str = OPENLINEAGE_URL, endpoint: str = OPENLINEAGE_ENDPOINT,
+                batch_size: int = OPENLINEAGE_BATCH_SIZE) -> int:
+    client = KeepAliveClient(base_url)
+    started = time.perf_counter()
+    total = 0
+    try:
+        for batch in _batched(events, batch_size):
+            client.post_json(endpoint, batch)
+            total += len(batch)
+    finally:
+        client.close()
+    logging.info(f"HTTP 请求 {client.requests} 次，建立连接 {client.connects} 次。")
+    report_throughput("OpenLineage HTTP 发送", total, started)
+    return total
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Export chunk lineage as OpenLineage COMPLETE events')
+    parser.add_argument('chunk_dir', nargs='?', default='chunks', help='Directory containing chunk CSV files')
+    parser.add_argument('-o', '--output', default='openlineage', help='Directory for NDJSON files')
+    parser.add_argument('--url', help='POST events to this base url instead of writing NDJSON')
+    parser.add_argument('--endpoint', default=OPENLINEAGE_ENDPOINT, help='Endpoint path for --url')
+    parser.add_argument('--batch-size', type=int, default=OPENLINEAGE_BATCH_SIZE, help='Events per file / request')
+    parser.add_argument('--mock-server', action='store_true', help='POST to a local stand-in server')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    events = iter_run_events(args.chunk_dir)
+    if args.mock_server:
+        server = MockLineageServer().start()
+        try:
+            post_events(events, server.url, args.endpoint, args.batch_size)
+            logging.info(f"替身服务收到 {server.items} 个事件，{server.requests} 个请求。")
+        finally:
+            server.stop()
+    elif args.url:
+        post_events(events, args.url, args.endpoint, args.batch_size)
+    else:
+        write_ndjson(events, args.output, args.batch_size)
@@ -1,23 +1,151 @@
-import json, csv, glob
+import json, csv, glob, heapq, os, tempfile
+from multiprocessing import Pool
+try:
+    import ijson
+except ModuleNotFoundError:  # pragma: no cover - optional dependency
+    ijson = None
 
-# 1. 读取所有 JSON，收集所有节点名称
-nodes = set()
-for fn in glob.glob("./chunks/*.json"):
-    data = json.load(open(fn, encoding='utf-8'))
-    for r in data["relationships"]:
+# 超过该数量的节点/边会落盘做外部排序去重
+FIELDS_MEMORY_BUDGET = int(os.getenv("FIELDS_MEMORY_BUDGET", "1000000"))
+FIELDS_WORKERS = int(os.getenv("FIELDS_WORKERS", str(os.cpu_count() or 1)))
+
+
+class ExternalSortedSet:
+    """有序去重集合：内存中超过 max_items 时把有序段写入临时文件，迭代时多路归并。"""
+
+    def __init__(self, max_items: int = FIELDS_MEMORY_BUDGET, tmp_dir: str | None = None):
+        self.max_items = max(1, max_items)
+        self.tmp_dir = tmp_dir
+        self._items = set()
+        self._runs: list[str] = []
+
+    def add(self, item) -> None:
+        self._items.add(item)
+        if len(self._items) >= self.max_items:
+            self._spill()
+
+    def update(self, items) -> None:
+        for item in items:
+            self.add(item)
+
+    def _spill(self) -> None:
+        fd, path = tempfile.mkstemp(prefix='fields_run_', suffix='.jsonl', dir=self.tmp_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for item in sorted(self._items):
+                f.write(json.dumps(item, ensure_ascii=False))
+                f.write('\n')
+        self._runs.append(path)
+        self._items = set()
+
+    @staticmethod
+    def _read_run(path: str):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                value = json.loads(line)
+                yield tuple(value) if isinstance(value, list) else value
+
+    def __iter__(self):
+        if not self._runs:
+            yield from sorted(self._items)
+            return
+        if self._items:
+            self._spill()
+        last = object()
+        for item in heapq.merge(*(self._read_run(path) for path in self._runs)):
+            if item != last:
+                yield item
+                last = item
+
+    def close(self) -> None:
+        for path in self._runs:
+            if os.path.exists(path):
+                os.remove(path)
+        self._runs = []
+        self._items = set()
+
+
+def _iter_relationships(fn: str):
+    with open(fn, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.items(f, 'relationships.item')
+        else:
+            yield from json.load(f).get("relationships", [])
+
+
+def extract_chunk(fn: str) -> tuple[list[str], list[tuple[str, str, str, str]]]:
+    """读取单个 chunk JSON，返回 (节点列表, 边列表)，文件读取后立即关闭"""
+    nodes = set()
+    edges = set()
+    for r in _iter_relationships(fn):
         # 目标字段
         tgt = f"{r['target']['parentName']}.{r['target']['column']}"
         nodes.add(tgt)
         # 源字段
-        for src in r["sources"]:
+        for src in r.get("sources", []):
             s = f"{src['parentName']}.{src['column']}"
             nodes.add(s)
+            edges.add((s, tgt, r.get('type') or '', r.get('effectType') or ''))
+    return list(nodes), list(edges)
+
+
+def generate_fields(chunk_glob: str = "./chunks/*.json",
+                    fields_path: str = "fields.csv",
+                    edges_path: str | None = "edges.csv",
+                    workers: int = FIELDS_WORKERS,
+                    max_items: int = FIELDS_MEMORY_BUDGET) -> tuple[int, int]:
+    files = sorted(glob.glob(chunk_glob))
+    nodes = ExternalSortedSet(max_items)
+    edges = ExternalSortedSet(max_items)
+    try:
+        # 1. 并行读取所有 JSON，收集节点与边
+        if workers > 1 and len(files) > 1:
+            with Pool(workers) as pool:
+                for chunk_nodes, chunk_edges in pool.imap_unordered(extract_chunk, files, chunksize=16):
+                    nodes.update(chunk_nodes)
+                    edges.update(chunk_edges)
+        else:
+            for fn in files:
+                chunk_nodes, chunk_edges = extract_chunk(fn)
+                nodes.update(chunk_nodes)
+                edges.update(chunk_edges)
+
+        # 2. 写入 fields.csv
+        node_count = 0
+        with open(fields_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name"])         # 必需的列头
+            for name in nodes:
+                writer.writerow([name])
+                node_count += 1
+
+        # 3. 写入边列表（图数据库导入用）
+        edge_count = 0
+        if edges_path:
+            with open(edges_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["source", "target", "type", "effectType"])
+                for edge in edges:
+                    writer.writerow(edge)
+                    edge_count += 1
+    finally:
+        nodes.close()
+        edges.close()
+    return node_count, edge_count
+
 
-# 2. 写入 fields.csv
-with open("fields.csv", "w", newline="", encoding="utf-8") as f:
-    writer = csv.writer(f)
-    writer.writerow(["name"])         # 必需的列头
-    for name in sorted(nodes):
-        writer.writerow([name])
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Extract field nodes (and edges) from lineage JSON chunks')
+    parser.add_argument('--chunks', default='./chunks/*.json', help='Glob of chunk JSON files')
+    parser.add_argument('-o', '--output', default='fields.csv', help='Output fields csv')
+    parser.add_argument('--edges', default='edges.csv', help='Output edge list csv, empty to disable')
+    parser.add_argument('-j', '--workers', type=int, default=FIELDS_WORKERS, help='Parallel reader processes')
+    parser.add_argument('--memory-budget', type=int, default=FIELDS_MEMORY_BUDGET,
+                        help='Max distinct items kept in memory before spilling to disk')
+    args = parser.parse_args()
 
-print(f"Generated fields.csv with {len(nodes)} rows.")
+    node_count, edge_count = generate_fields(args.chunks, args.output, args.edges or None,
+                                             workers=args.workers, max_items=args.memory_budget)
+    print(f"Generated {args.output} with {node_count} rows.")
+    if args.edges:
+        print(f"Generated {args.edges} with {edge_count} rows.")
@@ -0,0 +1,132 @@
+"""
+Literal-insensitive statement fingerprints and lineage reuse.
+
+    backend = FingerprintBackend(get_backend('subprocess', db_type='oracle'), metrics=metrics)
+    result = backend.analyze_text(chunk_sql)
+
+Generated procedures repeat the same INSERT ... SELECT shapes with different
+dates and org codes. fingerprint_sql() hashes the token stream with string
+and numeric literals replaced by '?', comments and whitespace dropped and
+unquoted identifiers upper-cased, so those copies share one fingerprint.
+
+FingerprintBackend wraps any analyzer backend. Every chunk holds one statement
+(or one piece of a split statement) and is looked up by fingerprint; only
+chunks never seen before are sent to the analyzer, and the rows of the others
+are reused. The /csv rows carry no coordinates or SQL text, so SQL_TEXT
+follows the chunk that reused them. Hits, misses and avoided analyzer calls
+are counted in the 'fingerprint' stage.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from analyzer_backend import AnalyzerBackend, AnalyzerResult
+from lineage_sinks import decode_lineage_csv
+from pipeline_metrics import PipelineMetrics
+
+LINEAGE_FINGERPRINT_CACHE_SIZE = int(os.getenv("LINEAGE_FINGERPRINT_CACHE_SIZE", "100000"))
+
+_TOKEN_RE = re.compile(r"""
+    (?P<comment>--[^\n]*)
+  | (?P<string>[NnEe]?'(?:[^']|'')*')
+  | (?P<number>(?<![\w$#.])(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?(?![\w$#]))
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<word>[^\W\d][\w$#]*)
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def fingerprint_tokens(sql: str) -> list[str]:
+    """字面量替换为 '?'，去掉注释与空白，未加引号的标识符转大写"""
+    tokens = []
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind in ('comment', 'space'):
+            continue
+        if kind in ('string', 'number'):
+            tokens.append('?')
+        elif kind == 'word':
+            tokens.append(m.group(0).upper())
+        else:
+            tokens.append(m.group(0))
+    return tokens
+
+
+def fingerprint_sql(sql: str) -> str:
+    return hashlib.blake2b('\x1f'.join(fingerprint_tokens(sql)).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class FingerprintBackend(AnalyzerBackend):
+    """按语句指纹复用血缘，只把未见过的语句交给内层后端"""
+
+    name = 'fingerprint'
+
+    def __init__(self, inner: AnalyzerBackend, metrics=None, max_entries: int = LINEAGE_FINGERPRINT_CACHE_SIZE):
+        super().__init__(inner.db_type)
+        self.inner = inner
+        self.thread_safe = inner.thread_safe
+        self._lock = threading.Lock()
+        self.metrics = metrics or PipelineMetrics()
+        self.max_entries = max_entries
+        self.cache: dict[str, list[tuple]] = {}
+        self.statements = 0
+        self.hits = 0
+        self.calls = 0
+        self.calls_avoided = 0
+
+    def _fresh_rows(self, sql_text: str, name: str | None) -> tuple[AnalyzerResult, list[tuple]]:
+        result = self.inner.analyze_text(sql_text, name=name)
+        if not result.ok or result.records is not None:
+            return result, list(result.records or [])
+        _, records, rejected = decode_lineage_csv(result.csv_text)
+        if rejected:
+            logging.warning(f"{name} 有 {rejected} 行无法纠正列数，已跳过。")
+        return result, [tuple(record) for record in records]
+
+    def analyze_text(self, sql_text: str, name: str | None = None) -> AnalyzerResult:
+        started = time.perf_counter()
+        with self.metrics.stage('fingerprint') as st:
+            fingerprint = fingerprint_sql(sql_text)
+            cached = self.cache.get(fingerprint)
+        with self._lock:
+            hit = cached is not None
+            st.add(statements_in=1, hits=int(hit), misses=int(not hit))
+            self.statements += 1
+            self.hits += int(hit)
+            if hit:
+                self.calls_avoided += 1
+                st.add(analyzer_calls_avoided=1)
+            else:
+                self.calls += 1
+                st.add(analyzer_calls=1)
+        if hit:
+            return AnalyzerResult(True, timings={'wall': time.perf_counter() - started}, records=list(cached))
+
+        result, fresh = self._fresh_rows(sql_text, name)
+        if not result.ok:
+            return result
+        if len(self.cache) < self.max_entries:
+            self.cache.setdefault(fingerprint, fresh)
+        timings = dict(result.timings)
+        timings['wall'] = time.perf_counter() - started
+        return AnalyzerResult(True, errors=result.errors, timings=timings, records=fresh)
+
+    @property
+    def timeout(self):
+        return getattr(self.inner, 'timeout', None)
+
+    @timeout.setter
+    def timeout(self, value) -> None:
+        self.inner.timeout = value
+
+    def hit_rate(self) -> float:
+        return self.hits / self.statements if self.statements else 0.0
+
+    def close(self) -> None:
+        self.inner.close()
+        logging.info(f"指纹复用：{self.hits}/{self.statements} 条语句命中（{self.hit_rate():.1%}），"
+                     f"{len(self.cache)} 个指纹，分析器调用 {self.calls} 次，省去 {self.calls_avoided} 次。")
@@ -0,0 +1,147 @@
+"""
+Small HTTP helpers shared by the lineage emitters.
+
+KeepAliveClient keeps one persistent HTTP/1.1 connection and reuses it for every
+POST; MockLineageServer is a local stand-in endpoint that accepts json payloads
+and counts them, so emitters can be exercised without DataHub / Marquez.
+"""
+import http.client
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, body: str):
+        super().__init__(f"HTTP {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+
+
+class KeepAliveClient:
+    """单连接复用的 HTTP 客户端，连接断开时自动重连"""
+
+    def __init__(self, base_url: str, timeout: float = 30.0, headers: dict | None = None):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or 'http'
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        if headers:
+            self.headers.update(headers)
+        self._conn = None
+        self.requests = 0
+        self.connects = 0
+
+    def _connection(self):
+        if self._conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            self._conn = cls(self.host, self.port, timeout=self.timeout)
+            self.connects += 1
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def post_json(self, path: str, payload) -> str:
+        body = payload if isinstance(payload, (bytes, str)) else json.dumps(payload, ensure_ascii=False)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        url = f"{self.base_path}{path}"
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request('POST', url, body=body, headers=self.headers)
+                resp = conn.getresponse()
+                text = resp.read().decode('utf-8', errors='replace')
+            except (http.client.HTTPException, ConnectionError, OSError):
+                # 服务端关闭了空闲连接：重连后重试一次
+                self.close()
+                if attempt == 2:
+                    raise
+                continue
+            self.requests += 1
+            if resp.will_close:
+                self.close()
+            if resp.status >= 300:
+                raise HttpError(resp.status, text)
+            return text
+        return ''
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        server = self.server
+        status = 200
+        with server.lock:
+            server.requests += 1
+            if server.fail_every and server.requests % server.fail_every == 0:
+                status = 503
+        if status == 200:
+            try:
+                data = json.loads(raw.decode('utf-8'))
+            except ValueError:
+                status = 400
+            else:
+                if isinstance(data, dict) and isinstance(data.get('proposals'), list):
+                    data = data['proposals']
+                count = len(data) if isinstance(data, list) else 1
+                with server.lock:
+                    server.items += count
+                    server.paths[self.path] = server.paths.get(self.path, 0) + count
+        body = json.dumps({'status': status}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("mock server: " + format, *args)
+
+
+class MockLineageServer(ThreadingHTTPServer):
+    """本地替身服务：接收 POST 的 json（单条、数组或 {"proposals": [...]}）并计数；fail_every>0 时每 N 个请求返回 503"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, fail_every: int = 0):
+        super().__init__((host, port), _MockHandler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.items = 0
+        self.paths: dict[str, int] = {}
+        self.fail_every = fail_every
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockLineageServer':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def report_throughput(label: str, count: int, started: float) -> float:
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    rate = count / elapsed
+    logging.info(f"{label}：{count} 条，耗时 {elapsed:.2f}s，吞吐 {rate:.1f} 条/s。")
+    return rate
@@ -0,0 +1,72 @@
+"""
+In-memory chunk pipeline.
+
+sql/*.sql -> preprocess / extract / split -> analyzer (chunk text over stdin,
+          or the in-process JvmBackend) -> decode_lineage_csv (once, skipped when the
+          backend returns structured records) -> every registered sink
+
+No chunks/*.sql or *.csv are written unless a chunk_dir is given for debugging
+(ChunkArtifactSink); each chunk's analyzer output is decoded once and handed to
+all sinks while it is still in memory.
+"""
+import logging
+import os
+
+from analyzer_backend import LINEAGE_CSV_HEADER, SubprocessBackend
+from lineage_sinks import DecodedChunk, LineageRecord, decode_lineage_csv, default_sinks, fan_out
+from main_to_json import DATAHUB_OUTPUT, SPLIT_WORKERS, iter_split_sources
+from pipeline_metrics import PipelineMetrics
+from sql_encoding import EncodingManifest
+
+
+def iter_source_chunks(sql_files: list[str], metrics=None, workers: int = SPLIT_WORKERS):
+    """逐个源文件产出 (name, source, index, sql)，name 为 <base>_<idx>"""
+    metrics = metrics or PipelineMetrics()
+    manifest = EncodingManifest()
+    for src_sql, chunks in iter_split_sources(sql_files, manifest, metrics, workers):
+        base_name = os.path.splitext(os.path.basename(src_sql))[0]
+        for idx, seg in enumerate(chunks, start=1):
+            yield f"{base_name}_{idx}", base_name, idx, seg
+    manifest.save()
+
+
+def analyze_chunks(chunks, backend, metrics=None):
+    """逐个分析 chunk 并解析一次 CSV，产出 DecodedChunk"""
+    metrics = metrics or PipelineMetrics()
+    for name, source, index, sql in chunks:
+        with metrics.stage('analyze') as st:
+            result = backend.analyze_text(sql, name=name)
+            st.add(statements_in=1, chars_in=len(sql),
+                   chars_out=0 if result.records is not None else len(result.csv_text))
+        metrics.histogram('analyzer.wall_seconds').record(result.timings.get('wall', 0.0))
+        if 'analyze' in result.timings:
+            metrics.histogram('analyzer.jvm_parse_seconds').record(result.timings['analyze'])
+        if not result.ok:
+            logging.error(f"dlineage 失败 ({name})，stderr: {result.errors}")
+            header, records, rejected = [], [], 0
+        elif result.records is not None:
+            # 后端直接给出结构化血缘（JvmBackend），无需解析与纠正
+            header, records, rejected = LINEAGE_CSV_HEADER, [LineageRecord._make(row) for row in result.records], 0
+        else:
+            with metrics.stage('decode') as st:
+                header, records, rejected = decode_lineage_csv(result.csv_text)
+                st.add(chars_in=len(result.csv_text), rows_out=len(records))
+            if rejected:
+                logging.warning(f"{name} 有 {rejected} 行无法纠正列数，已跳过。")
+        yield DecodedChunk(name, source, index, sql, header, records, rejected)
+
+
+def run_in_memory_pipeline(sql_files: list[str], db_type: str = 'hive', backend=None,
+                           chunk_dir: str | None = None, result_dir: str | None = 'result',
+                           datahub_output: str | None = DATAHUB_OUTPUT, merged_csv: str | None = None,
+                           mysql: bool = False, metrics=None, extra_sinks: list | None = None,
+                           workers: int = SPLIT_WORKERS, table_csv: str | None = None) -> int:
+    metrics = metrics or PipelineMetrics()
+    if backend is None:
+        backend = SubprocessBackend(db_type, timing=True)
+    sinks = default_sinks(result_dir, datahub_output, merged_csv, chunk_dir, mysql, table_csv)
+    sinks += list(extra_sinks or [])
+    count = fan_out(analyze_chunks(iter_source_chunks(sql_files, metrics, workers), backend, metrics), sinks, metrics)
+    backend.close()
+    logging.info(f"内存流水线完成：{count} 个 chunk，sink：{', '.join(sink.name for sink in sinks)}。")
+    return count
@@ -0,0 +1,477 @@
+"""
+Shared decoding of analyzer CSV and the sinks that consume it.
+
+Every chunk CSV is parsed and normalised exactly once into LineageRecord
+tuples (decode_lineage_csv); the decoded chunk is then handed to any number of
+sinks:
+
+    sink.open()
+    sink.consume(chunk)    # DecodedChunk: name, source, index, sql, header, records, rejected
+    sink.close()
+
+The sinks write the same outputs as the original per-consumer readers
+(result/<base>.csv, the merged CSV, the DataHub JSON, the MySQL import), so
+both the disk flow (fan_out_chunk_dir over chunks/*.csv) and the in-memory
+flow share one decode stage no matter how many sinks are registered.
+"""
+import csv
+import glob
+import io
+import logging
+import os
+from collections import namedtuple
+
+from main_to_json import (DATAHUB_OUTPUT, EXPECTED_LINEAGE_COLUMNS, LINEAGE_TABLE_FIELDS, LINEAGE_TABLE_INSERT,
+                          _normalize_lineage_row, add_datahub_row, connect_mysql, pymysql, write_datahub_json)
+from pipeline_metrics import PipelineMetrics
+from table_lineage import TableLineageRollup, format_table_lineage_csv
+
+LINEAGE_COLUMNS = LINEAGE_TABLE_FIELDS[:EXPECTED_LINEAGE_COLUMNS]
+_COLUMN_INDEX = {name: idx for idx, name in enumerate(LINEAGE_COLUMNS)}
+LINEAGE_TABLE_DELETE = "DELETE FROM lineage_table WHERE FILE_NAME = %s"
+# 只有数据本身的问题（超长、类型不符、约束冲突）才跳过该行；连接、锁等待超时等错误重试也许就会成功，不能丢行
+MYSQL_ROW_ERRORS = (pymysql.err.DataError, pymysql.err.IntegrityError) if pymysql is not None else ()
+
+
+class LineageRecord(namedtuple('LineageRecord', [name.lower() for name in LINEAGE_COLUMNS])):
+    """一行已纠正列数的血缘；按位置即 14 列 CSV，get() 兼容按列名取值"""
+
+    __slots__ = ()
+
+    def get(self, column: str, default=None):
+        idx = _COLUMN_INDEX.get(column)
+        return self[idx] if idx is not None else default
+
+
+class DecodedChunk:
+    __slots__ = ('name', 'source', 'index', 'sql', 'header', 'records', 'rejected')
+
+    def __init__(self, name: str, source: str, index: int, sql: str,
+                 header: list[str], records: list[LineageRecord], rejected: int = 0):
+        self.name = name
+        self.source = source
+        self.index = index
+        self.sql = sql
+        self.header = header
+        self.records = records
+        self.rejected = rejected
+
+
+def decode_lineage_csv(csv_source) -> tuple[list[str], list[LineageRecord], int]:
+    """解析分析器 CSV（文本或文件对象），返回 (表头, 记录列表, 无法纠正的行数)
+
+    空行跳过；SOURCE_DB 为 "Error log:" 之后都是错误日志，不再解析。
+    """
+    if isinstance(csv_source, str):
+        if not csv_source:
+            return [], [], 0
+        csv_source = io.StringIO(csv_source)
+    reader = csv.reader(csv_source)
+    try:
+        header = next(reader)
+    except StopIteration:
+        return [], [], 0
+    records = []
+    rejected = 0
+    for row in reader:
+        if not row or all(cell.strip() == '' for cell in row):
+            continue
+        if row[0].strip().lower() == 'error log:':
+            break
+        normalized_row = _normalize_lineage_row(row)
+        if normalized_row is None:
+            rejected += 1
+            continue
+        records.append(LineageRecord._make(normalized_row))
+    return header, records, rejected
+
+
+def _chunk_key(name: str) -> tuple[str, int]:
+    """<base>_<idx> → (base, idx)，与 result/ 的分组规则一致"""
+    prefix, _, suffix = name.rpartition('_')
+    if suffix.isdigit():
+        return prefix, int(suffix)
+    return name, 0
+
+
+def iter_chunk_dir(chunk_dir: str):
+    """按 (源文件, 段号) 顺序逐个读取 chunks/*.csv 与对应 .sql，各解析一次"""
+    entries = []
+    for path in glob.glob(os.path.join(chunk_dir, '*.csv')):
+        name = os.path.splitext(os.path.basename(path))[0]
+        entries.append((_chunk_key(name), name, path))
+    entries.sort()
+    for (source, index), name, path in entries:
+        sql_path = os.path.join(chunk_dir, f"{name}.sql")
+        sql_text = ''
+        if os.path.exists(sql_path):
+            with open(sql_path, 'r', encoding='utf-8') as f:
+                sql_text = f.read()
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            header, records, rejected = decode_lineage_csv(f)
+        yield DecodedChunk(name, source, index, sql_text, header, records, rejected)
+
+
+def fan_out(chunks, sinks: list, metrics=None) -> int:
+    """把每个已解析的 chunk 依次交给所有 sink，返回 chunk 数"""
+    metrics = metrics or PipelineMetrics()
+    for sink in sinks:
+        sink.open()
+    count = 0
+    try:
+        for chunk in chunks:
+            with metrics.stage('sinks') as st:
+                for sink in sinks:
+                    sink.consume(chunk)
+                st.add(rows_in=len(chunk.records))
+            count += 1
+    finally:
+        for sink in sinks:
+            sink.close()
+    return count
+
+
+def fan_out_chunk_dir(chunk_dir: str, sinks: list, metrics=None, journal=None) -> int:
+    """journal 为 RunJournal 时跳过已完成的 sink，其余 sink 按日志续写，全部成功后记为完成"""
+    metrics = metrics or PipelineMetrics()
+    if journal is not None:
+        done = [sink.name for sink in sinks if sink.name in journal.sinks_done]
+        if done:
+            logging.info(f"续跑：跳过已完成的 sink：{', '.join(done)}")
+        sinks = [sink for sink in sinks if sink.name not in journal.sinks_done]
+        if not sinks:
+            return 0
+        for sink in sinks:
+            sink.resume(journal)
+
+    def decoded():
+        source = iter_chunk_dir(chunk_dir)
+        while True:
+            with metrics.stage('decode') as st:
+                chunk = next(source, None)
+                if chunk is None:
+                    return
+                st.add(files_in=1, rows_out=len(chunk.records))
+            if chunk.rejected:
+                logging.warning(f"{chunk.name}.csv 有 {chunk.rejected} 行无法纠正列数，已跳过。")
+            yield chunk
+
+    count = fan_out(decoded(), sinks, metrics)
+    if journal is not None:
+        for sink in sinks:
+            journal.sink_done(sink.name)
+    return count
+
+
+class LineageSink:
+    name = 'sink'
+
+    def resume(self, journal) -> None:
+        """续跑前调用；文件类 sink 每次整体重写，不需要日志"""
+
+    def open(self) -> None:
+        pass
+
+    def consume(self, chunk: DecodedChunk) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class ChunkArtifactSink(LineageSink):
+    """调试用：仍把 chunk 的 .sql 与 .csv 写入 chunk_dir"""
+
+    name = 'chunk_artifacts'
+
+    def __init__(self, chunk_dir: str):
+        self.chunk_dir = chunk_dir
+
+    def open(self) -> None:
+        os.makedirs(self.chunk_dir, exist_ok=True)
+
+    def consume(self, chunk: DecodedChunk) -> None:
+        base = os.path.join(self.chunk_dir, chunk.name)
+        with open(base + '.sql', 'w', encoding='utf-8') as f:
+            f.write(chunk.sql)
+        with open(base + '.csv', 'w', newline='', encoding='utf-8') as f:
+            if chunk.header:
+                writer = csv.writer(f)
+                writer.writerow(chunk.header)
+                writer.writerows(chunk.records)
+
+
+class ResultCsvSink(LineageSink):
+    """每个源文件一个 result/<base>.csv，附加 SQL_TEXT 列"""
+
+    name = 'result_csvs'
+
+    def __init__(self, result_dir: str = 'result'):
+        self.result_dir = result_dir
+        self._key = None
+        self._file = None
+        self._writer = None
+        self._started: set[str] = set()
+
+    def open(self) -> None:
+        os.makedirs(self.result_dir, exist_ok=True)
+
+    def _switch(self, key: str, header: list[str]) -> None:
+        self._close_current()
+        out_path = os.path.join(self.result_dir, f"{key}.csv")
+        if key in self._started:
+            self._file = open(out_path, 'a', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+        else:
+            self._file = open(out_path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(header + ['SQL_TEXT'])
+            self._started.add(key)
+        self._key = key
+
+    def consume(self, chunk: DecodedChunk) -> None:
+        if not chunk.header:
+            return
+        if chunk.source != self._key:
+            self._switch(chunk.source, chunk.header)
+        sql_text = chunk.sql.strip()
+        self._writer.writerows(record + (sql_text,) for record in chunk.records)
+
+    def _close_current(self) -> None:
+        if self._file:
+            self._file.close()
+            logging.info(f"已生成合并 CSV：{os.path.join(self.result_dir, self._key + '.csv')}")
+        self._file = None
+        self._writer = None
+        self._key = None
+
+    def close(self) -> None:
+        self._close_current()
+        if not self._started:
+            logging.warning("无可导出的 CSV。")
+
+
+class MergedCsvSink(LineageSink):
+    """所有 chunk 合并为一个 CSV（global_lineage.csv）"""
+
+    name = 'merged_csv'
+
+    def __init__(self, output_csv: str = 'global_lineage.csv'):
+        self.output_csv = output_csv
+        self._file = None
+        self._writer = None
+
+    def consume(self, chunk: DecodedChunk) -> None:
+        if not chunk.header:
+            return
+        if self._writer is None:
+            self._file = open(self.output_csv, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(chunk.header)
+        self._writer.writerows(chunk.records)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            logging.info(f"合并 CSV 完成：{self.output_csv}")
+        else:
+            logging.warning("无可合并的 CSV 文件。")
+
+
+class TableLineageCsvSink(LineageSink):
+    """由列级血缘汇总出表级血缘，close 时写出一个 CSV，不需要再次调用分析器"""
+
+    name = 'table_csv'
+
+    def __init__(self, output_csv: str = 'table_lineage.csv'):
+        self.output_csv = output_csv
+        self.rollup = TableLineageRollup()
+
+    def consume(self, chunk: DecodedChunk) -> None:
+        for record in chunk.records:
+            self.rollup.add(record)
+
+    def close(self) -> None:
+        rows = self.rollup.rows()
+        with open(self.output_csv, 'w', newline='', encoding='utf-8') as f:
+            f.write(format_table_lineage_csv(rows))
+        logging.info(f"已生成表级血缘 CSV：{self.output_csv}，{len(rows)} 行。")
+
+
+class DataHubSink(LineageSink):
+    """累积列级血缘，close 时写出 DataHub MCP JSON；output_path 为 None 时只累积"""
+
+    name = 'datahub'
+
+    def __init__(self, output_path: str | None = DATAHUB_OUTPUT):
+        self.output_path = output_path
+        self.lineage_map: dict[str, dict] = {}
+        self.skipped_rows = 0
+        self.seen = False
+
+    def consume(self, chunk: DecodedChunk) -> None:
+        if not chunk.header:
+            return
+        self.seen = True
+        self.skipped_rows += chunk.rejected
+        for record in chunk.records:
+            if not add_datahub_row(self.lineage_map, record):
+                self.skipped_rows += 1
+
+    def close(self) -> None:
+        if not self.output_path:
+            return
+        if not self.seen:
+            logging.warning("无 CSV 可用于生成 DataHub JSON。")
+            return
+        write_datahub_json(self.lineage_map, self.output_path, self.skipped_rows)
+
+
+class MySQLSink(LineageSink):
+    """开始时清空 lineage_table，每个 chunk 批量插入并提交；批量因数据错误失败时逐行插入，只跳过数据有误的行"""
+
+    name = 'mysql'
+
+    def __init__(self, truncate: bool = True):
+        self.truncate = truncate
+        self.conn = None
+        self.cursor = None
+        self.rows = 0
+        self.journal = None
+        self.committed: set[str] = set()
+        self._resumed = False
+
+    def resume(self, journal) -> None:
+        """已有 chunk 提交过时不再清空表，跳过已提交的 chunk
+
+        日志中未记为已提交的 chunk 仍可能已经提交（提交后、写日志前中断，且续跑时 chunk 的顺序可能与上次不同），
+        因此续跑中的每个 chunk 都先按 FILE_NAME 删除再插入。
+        """
+        self.journal = journal
+        self.committed = journal.committed_chunks.get(self.name, set())
+        if self.committed:
+            self.truncate = False
+            self._resumed = True
+            logging.info(f"续跑：lineage_table 已提交 {len(self.committed)} 个 chunk，不再清空。")
+
+    def open(self) -> None:
+        self.conn = connect_mysql()
+        self.cursor = self.conn.cursor()
+        if self.truncate:
+            # 插入前清空表
+            self.cursor.execute("TRUNCATE TABLE lineage_table;")
+            self.conn.commit()
+            logging.info("lineage_table 已清空，开始批量导入...")
+
+    def _write_rows(self, deleted_files: list[str], batch: list[tuple], label: str) -> int | None:
+        """同一事务中删除 deleted_files 的行并插入 batch，返回插入行数
+
+        批量插入因数据错误失败时逐行重试，只跳过数据有误的行；其他错误回滚后抛出，chunk 保持未提交。
+        逐行重试时删除失败则回滚并返回 None。
+        """
+        try:
+            if deleted_files:
+                self.cursor.executemany(LINEAGE_TABLE_DELETE, [(name,) for name in deleted_files])
+            if batch:
+                self.cursor.executemany(LINEAGE_TABLE_INSERT, batch)
+            self.conn.commit()
+            return len(batch)
+        except MYSQL_ROW_ERRORS as e:
+            logging.warning(f"批量插入出错（{label}）：{e}，改为逐行插入。")
+            self.conn.rollback()
+        except Exception:
+            self.conn.rollback()
+            raise
+        try:
+            if deleted_files:
+                self.cursor.executemany(LINEAGE_TABLE_DELETE, [(name,) for name in deleted_files])
+        except Exception as e:
+            logging.error(f"删除旧血缘出错（{label}）：{e}")
+            self.conn.rollback()
+            return None
+        inserted = 0
+        for row in batch:
+            try:
+                self.cursor.execute(LINEAGE_TABLE_INSERT, row)
+                inserted += 1
+            except MYSQL_ROW_ERRORS as e:
+                logging.error(f"插入出错（{label}）：{e}\n数据: {row}")
+            except Exception:
+                self.conn.rollback()
+                raise
+        self.conn.commit()
+        return inserted
+
+    def consume(self, chunk: DecodedChunk) -> None:
+        if not chunk.records or chunk.name in self.committed:
+            return
+        file_name = f"{chunk.name}.sql"
+        batch = [record + (chunk.sql, file_name) for record in chunk.records]
+        # 续跑时先删除可能已提交的行，与插入在同一事务中，保证不会重复
+        inserted = self._write_rows([file_name] if self._resumed else [], batch, file_name)
+        if inserted is None:
+            return
+        self.rows += inserted
+        if self.journal is not None:
+            self.journal.committed(self.name, chunk.name)
+
+    def replace_chunks(self, old_names, chunks: list[DecodedChunk]) -> None:
+        """监听模式：同一事务中删除源文件旧 chunk 的行并插入新 chunk 的行，失败时抛出异常由监听下一轮重试"""
+        self.conn.ping(reconnect=True)
+        batch = [record + (chunk.sql, f"{chunk.name}.sql") for chunk in chunks for record in chunk.records]
+        inserted = self._write_rows([f"{name}.sql" for name in old_names], batch, 'lineage_table 更新')
+        if inserted is None:
+            # 旧行未删除，由调用方（监听模式）下一轮重试
+            raise RuntimeError(f"删除 {len(old_names)} 个旧 chunk 的血缘失败，lineage_table 未更新")
+        self.rows += inserted
+
+    def close(self) -> None:
+        if self.cursor:
+            self.cursor.close()
+        if self.conn:
+            self.conn.close()
+            logging.info(f"MySQL 导入完成，共 {self.rows} 行。")
+
+
+_SINKS = {
+    ChunkArtifactSink.name: ChunkArtifactSink,
+    ResultCsvSink.name: ResultCsvSink,
+    MergedCsvSink.name: MergedCsvSink,
+    TableLineageCsvSink.name: TableLineageCsvSink,
+    DataHubSink.name: DataHubSink,
+    MySQLSink.name: MySQLSink,
+}
+
+
+def register_sink(cls) -> None:
+    _SINKS[cls.name] = cls
+
+
+def get_sink(name: str, **kwargs) -> LineageSink:
+    try:
+        cls = _SINKS[name]
+    except KeyError:
+        raise ValueError(f"unknown lineage sink {name!r}, available: {', '.join(sorted(_SINKS))}")
+    return cls(**kwargs)
+
+
+def default_sinks(result_dir: str | None = 'result',
+                  datahub_output: str | None = DATAHUB_OUTPUT,
+                  merged_csv: str | None = None,
+                  chunk_dir: str | None = None,
+                  mysql: bool = False,
+                  table_csv: str | None = None) -> list[LineageSink]:
+    sinks = []
+    if chunk_dir:
+        sinks.append(ChunkArtifactSink(chunk_dir))
+    if result_dir:
+        sinks.append(ResultCsvSink(result_dir))
+    if merged_csv:
+        sinks.append(MergedCsvSink(merged_csv))
+    if table_csv:
+        sinks.append(TableLineageCsvSink(table_csv))
+    if datahub_output:
+        sinks.append(DataHubSink(datahub_output))
+    if mysql:
+        sinks.append(MySQLSink())
+    return sinks
@@ -0,0 +1,277 @@
+"""
+Watch mode: keep lineage up to date while SQL files are edited.
+
+    python3 lineage_watch.py sql -t oracle -b jvm
+    python3 main_to_json.py --watch -t oracle --backend jvm
+
+sql/*.sql is polled every WATCH_POLL_SECONDS (size and mtime; no inotify
+dependency, and it works on network mounts). A changed file is re-split as
+in the batch run and its chunks go through one long-lived analyzer wrapped
+in FingerprintBackend, so statements that did not change are answered from
+the cache and only edited statements reach the (warm, with -b jvm) analyzer.
+
+Outputs are patched per source file instead of rebuilt: result/<base>.csv is
+rewritten for that file only, lineage_table rows of its old chunks are
+replaced in one transaction, and the DataHub JSON and graph import files are
+regenerated from per-file contributions kept in memory. The time from the
+file's mtime (the save) to the updated outputs is logged and recorded in the
+watch.save_to_update_seconds histogram.
+"""
+import glob
+import logging
+import os
+import time
+from collections import Counter
+
+from export_graph import GRAPH_EXPORT_DIR, graph_items, write_graph_import
+from lineage_pipeline import analyze_chunks
+from lineage_sinks import MySQLSink, ResultCsvSink
+from main_to_json import DATAHUB_OUTPUT, add_datahub_row, source_file_chunks, write_datahub_json
+from pipeline_metrics import PipelineMetrics
+from sql_encoding import EncodingManifest
+
+WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", "0.5"))
+
+
+class GraphIndex:
+    """表、字段、血缘边按来源文件计数，删除或替换一个文件只影响它自己的贡献"""
+
+    def __init__(self):
+        self.tables: Counter = Counter()
+        self.columns: Counter = Counter()
+        self.lineage: Counter = Counter()
+        self._by_source: dict[str, tuple[set, set, set]] = {}
+
+    def replace(self, source: str, records) -> None:
+        self.remove(source)
+        tables, columns, lineage = set(), set(), set()
+        for record in records:
+            items = graph_items(record)
+            if items is None:
+                continue
+            tables.update(items[0])
+            columns.update(items[1])
+            lineage.add(items[2])
+        self.tables.update(tables)
+        self.columns.update(columns)
+        self.lineage.update(lineage)
+        self._by_source[source] = (tables, columns, lineage)
+
+    def remove(self, source: str) -> None:
+        old = self._by_source.pop(source, None)
+        if old is None:
+            return
+        for counter, items in zip((self.tables, self.columns, self.lineage), old):
+            counter.subtract(items)
+            for item in items:
+                if counter[item] <= 0:
+                    del counter[item]
+
+    def write(self, output_dir: str) -> dict[str, int]:
+        return write_graph_import(output_dir, sorted(self.tables), sorted(self.columns), sorted(self.lineage))
+
+
+class LineageWatcher:
+    def __init__(self, sql_dir: str, backend, result_dir: str | None = 'result',
+                 datahub_output: str | None = DATAHUB_OUTPUT, graph_dir: str | None = GRAPH_EXPORT_DIR,
+                 mysql: bool = False, metrics=None, interval: float = WATCH_POLL_SECONDS):
+        from lineage_fingerprint import FingerprintBackend
+        self.sql_dir = sql_dir
+        self.metrics = metrics or PipelineMetrics()
+        # 未变化的语句直接命中指纹缓存，只有改动的语句交给分析器
+        self.backend = backend if isinstance(backend, FingerprintBackend) else FingerprintBackend(
+            backend, metrics=self.metrics)
+        self.result_dir = result_dir
+        self.datahub_output = datahub_output
+        self.graph_dir = graph_dir
+        self.interval = interval
+        self.manifest = EncodingManifest()
+        self.mysql = MySQLSink() if mysql else None
+        self.stats: dict[str, tuple[int, int]] = {}
+        self.chunk_names: dict[str, list[str]] = {}
+        self.datahub: dict[str, tuple[dict, int]] = {}
+        self.graph = GraphIndex()
+        self._publish_pending = False
+
+    def scan(self) -> dict[str, tuple[int, int]]:
+        stats = {}
+        for path in sorted(glob.glob(os.path.join(self.sql_dir, '*.sql'))):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats[path] = (stat.st_size, stat.st_mtime_ns)
+        return stats
+
+    def _update_source(self, path: str) -> int:
+        """重新拆分、分析一个源文件并替换它在各输出中的内容，返回 chunk 数"""
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        items = [(f"{base_name}_{idx}", base_name, idx, seg)
+                 for idx, seg in enumerate(source_file_chunks(path, self.manifest, self.metrics), start=1)]
+        chunks = list(analyze_chunks(items, self.backend, self.metrics))
+        records = [record for chunk in chunks for record in chunk.records]
+
+        if self.result_dir:
+            self._write_result(base_name, chunks)
+        if self.mysql is not None:
+            self.mysql.replace_chunks(self.chunk_names.get(path, []), chunks)
+        self.chunk_names[path] = [chunk.name for chunk in chunks]
+        lineage_map, skipped = {}, sum(chunk.rejected for chunk in chunks)
+        for record in records:
+            if not add_datahub_row(lineage_map, record):
+                skipped += 1
+        self.datahub[path] = (lineage_map, skipped)
+        self.graph.replace(path, records)
+        return len(chunks)
+
+    def _write_result(self, base_name: str, chunks) -> None:
+        out_path = os.path.join(self.result_dir, f"{base_name}.csv")
+        if not any(chunk.header for chunk in chunks):
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            return
+        sink = ResultCsvSink(self.result_dir)
+        sink.open()
+        for chunk in chunks:
+            sink.consume(chunk)
+        sink.close()
+
+    def _remove_source(self, path: str) -> None:
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        if self.result_dir and os.path.exists(os.path.join(self.result_dir, f"{base_name}.csv")):
+            os.remove(os.path.join(self.result_dir, f"{base_name}.csv"))
+        if self.mysql is not None:
+            self.mysql.replace_chunks(self.chunk_names.get(path, []), [])
+        self.chunk_names.pop(path, None)
+        self.datahub.pop(path, None)
+        self.graph.remove(path)
+        logging.info(f"{path} 已删除，已移除其血缘。")
+
+    def _publish(self) -> None:
+        if self.datahub_output:
+            merged: dict[str, dict] = {}
+            for lineage_map, _ in self.datahub.values():
+                for target, entry in lineage_map.items():
+                    into = merged.setdefault(target, {'dataset_urn': entry['dataset_urn'],
+                                                      'upstreams': set(), 'fine_grained': set()})
+                    into['upstreams'] |= entry['upstreams']
+                    into['fine_grained'] |= entry['fine_grained']
+            write_datahub_json(merged, self.datahub_output, sum(skipped for _, skipped in self.datahub.values()))
+        if self.graph_dir:
+            self.graph.write(self.graph_dir)
+
+    def poll(self) -> list[str]:
+        """处理自上次以来新增、修改、删除的文件，返回这些文件
+
+        单个文件处理失败（扫描后被删除、分析器异常等）只记录日志，它的状态保持不变，下一轮重试。
+        """
+        stats = self.scan()
+        changed = [path for path, stat in stats.items() if self.stats.get(path) != stat]
+        removed = [path for path in self.stats if path not in stats]
+        if not changed and not removed and not self._publish_pending:
+            return []
+        failed = []
+        with self.metrics.stage('watch_update') as st:
+            statements, hits = self.backend.statements, self.backend.hits
+            chunk_count = 0
+            for path in removed:
+                try:
+                    self._remove_source(path)
+                except Exception as e:
+                    logging.exception(f"移除 {path} 的血缘失败，下一轮重试：{e}")
+                    failed.append(path)
+            for path in changed:
+                try:
+                    chunk_count += self._update_source(path)
+                except Exception as e:
+                    logging.exception(f"更新 {path} 的血缘失败，下一轮重试：{e}")
+                    failed.append(path)
+            try:
+                self._publish()
+                self._publish_pending = False
+            except Exception as e:
+                logging.exception(f"写出 DataHub / 图导入文件失败，下一轮重试：{e}")
+                self._publish_pending = True
+            self.manifest.save()
+            analysed = (self.backend.statements - statements) - (self.backend.hits - hits)
+            st.add(files_in=len(changed) + len(removed), chunks=chunk_count, statements_analysed=analysed,
+                   failed=len(failed))
+        updated = time.time()
+        initial = not self.stats
+        for path in failed:
+            # 保留上一轮的状态，下一轮仍视为变化
+            if path in self.stats:
+                stats[path] = self.stats[path]
+            else:
+                stats.pop(path, None)
+        self.stats = stats
+        changed = [path for path in changed if path not in failed]
+        removed = [path for path in removed if path not in failed]
+        if initial:
+            return changed
+        latencies = []
+        for path in changed:
+            # 以文件 mtime 作为保存时间
+            latencies.append(max(updated - stats[path][1] / 1e9, 0.0))
+            self.metrics.histogram('watch.save_to_update_seconds').record(latencies[-1])
+        if latencies:
+            logging.info(f"已更新 {', '.join(changed)}：分析 {analysed} 条语句（其余命中缓存），"
+                         f"从保存到血缘更新 {max(latencies):.2f}s。")
+        return changed + removed
+
+    def run(self, max_updates: int | None = None) -> None:
+        """首次全量构建后持续监听；max_updates 为更新轮数上限（测试用）"""
+        if self.mysql is not None:
+            self.mysql.open()
+        started = time.perf_counter()
+        self.poll()
+        logging.info(f"初始血缘构建完成（{time.perf_counter() - started:.2f}s），开始监听 {self.sql_dir}。")
+        updates = 0
+        try:
+            while max_updates is None or updates < max_updates:
+                time.sleep(self.interval)
+                if self.poll():
+                    updates += 1
+        except KeyboardInterrupt:
+            logging.info("停止监听。")
+        finally:
+            self.backend.close()
+            if self.mysql is not None:
+                self.mysql.close()
+
+
+def run_watch(sql_dir: str = 'sql', db_type: str = 'hive', backend=None, mysql: bool = False,
+              metrics=None, interval: float = WATCH_POLL_SECONDS, max_updates: int | None = None,
+              result_dir: str | None = 'result', datahub_output: str | None = DATAHUB_OUTPUT,
+              graph_dir: str | None = GRAPH_EXPORT_DIR) -> None:
+    if backend is None:
+        from analyzer_backend import get_backend
+        backend = get_backend(db_type=db_type)
+    watcher = LineageWatcher(sql_dir, backend, result_dir, datahub_output, graph_dir, mysql, metrics, interval)
+    watcher.run(max_updates)
+
+
+if __name__ == '__main__':
+    import argparse
+    from analyzer_backend import SQLFLOW_ANALYZER_BACKEND, get_backend
+    from main_to_json import pymysql
+    from pipeline_metrics import PIPELINE_METRICS_REPORT
+    parser = argparse.ArgumentParser(description='Watch a SQL directory and keep lineage outputs up to date')
+    parser.add_argument('sql_dir', nargs='?', default='sql')
+    parser.add_argument('-t', '--db-type', default='hive')
+    parser.add_argument('-b', '--backend', default=SQLFLOW_ANALYZER_BACKEND,
+                        help='Analyzer kept warm between updates (jvm avoids a JVM start per change)')
+    parser.add_argument('--interval', type=float, default=WATCH_POLL_SECONDS, help='Polling interval in seconds')
+    parser.add_argument('--graph-dir', default=GRAPH_EXPORT_DIR, help='Graph import files to keep updated')
+    parser.add_argument('--max-updates', type=int, default=None, help='Exit after this many updates')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    metrics = PipelineMetrics()
+    try:
+        run_watch(args.sql_dir, args.db_type, get_backend(args.backend, db_type=args.db_type),
+                  mysql=pymysql is not None, metrics=metrics, interval=args.interval,
+                  max_updates=args.max_updates, graph_dir=args.graph_dir)
+    finally:
+        metrics.write_report(PIPELINE_METRICS_REPORT)
@@ -1,18 +1,25 @@
 from __future__ import annotations
 import re
+import sys
 import logging
 import os
-import subprocess
 import glob
 import shutil
-import csv
+from collections import deque
+from multiprocessing import get_context
 import json
 try:
     import pymysql
 except ModuleNotFoundError:  # pragma: no cover - optional dependency
     pymysql = None
 
+from pipeline_metrics import PipelineMetrics, PIPELINE_METRICS_REPORT
+from sql_encoding import EncodingManifest, read_text
+
 SQLFLOW_CHAR_LIMIT = int(os.getenv("SQLFLOW_CHAR_LIMIT", "10000"))
+SQL_STREAM_THRESHOLD_BYTES = int(os.getenv("SQL_STREAM_THRESHOLD_BYTES", str(256 * 1024 * 1024)))
+SPLIT_WORKERS = int(os.getenv("SPLIT_WORKERS", str(os.cpu_count() or 1)))
+SQL_CONSTANT_FAST_PATH = os.getenv("SQL_CONSTANT_FAST_PATH", "true").lower() in ('1', 'true', 'yes', 'y')
 EXPECTED_LINEAGE_COLUMNS = 14
 DATAHUB_PLATFORM = os.getenv("DATAHUB_PLATFORM", "oracle")
 DATAHUB_ENV = os.getenv("DATAHUB_ENV", "PROD")
@@ -57,22 +64,28 @@ def _strip_inline_comment(line: str) -> str:
     return line
 
 # ---------- 1. 预处理 SQL ----------
+NOLOGGING_RE = re.compile(r'\bNOLOGGING\b', re.IGNORECASE)
+
+
+def _clean_line(raw: str) -> str:
+    """单行清理：去 NOLOGGING、# 注释行与行内 -- 注释，返回空串表示丢弃该行"""
+    raw = NOLOGGING_RE.sub('', raw)
+    stripped = raw.strip()
+    if not stripped or stripped.startswith('#'):
+        return ''
+    return _strip_inline_comment(raw).strip()
+
+
 def preprocess_sql(sql_content: str) -> str:
     """去注释、全角转半角、规范标点"""
     if not sql_content:
         return ""
     sql_content = sql_content.translate(_FULLWIDTH_TRANS)
     sql_content = re.sub(r'/\*.*?\*/', '', sql_content, flags=re.DOTALL)
-    sql_content = re.sub(r'\bNOLOGGING\b', '', sql_content, flags=re.IGNORECASE)
 
     lines = []
     for raw in sql_content.splitlines():
-        stripped = raw.strip()
-        if not stripped:
-            continue
-        if stripped.startswith('#'):
-            continue
-        cleaned = _strip_inline_comment(raw).strip()
+        cleaned = _clean_line(raw)
         if cleaned:
             lines.append(cleaned)
     return "\n".join(lines)
@@ -90,25 +103,7 @@ def extract_table_name_from_create(stmt: str) -> str:
     )
     return m.group(1) if m else None
 
-def extract_insert_statements(sql: str) -> list[dict]:
-    """返回 [{'table_name':..., 'sql':..., 'line_number':...}, ...]"""
-    pat = re.compile(r"INSERT\s+INTO\s+(?:[^']|'[^']*')*?;", re.IGNORECASE | re.DOTALL)
-    results = []
-    for m in pat.finditer(sql):
-        match = m.group(0)
-        tbl = extract_table_name_from_insert(match)
-        if not tbl:
-            continue
-        lineno = sql[:m.start()].count('\n') + 1
-        results.append({
-            'table_name': tbl,
-            'sql': match.strip(),
-            'line_number': lineno,
-            'statement_type': 'insert'
-        })
-    logging.info(f"提取到 {len(results)} 条 INSERT 语句。")
-    return results
-
+INSERT_STMT_RE = re.compile(r"INSERT\s+INTO\s+(?:[^']|'[^']*')*?;", re.IGNORECASE | re.DOTALL)
 CREATE_TABLE_AS_RE = re.compile(
     r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?:TEMPORARY\s+|TEMP\s+|EXTERNAL\s+)?"
     r"(?:[^;']|'[^']*')*?\bAS\s+(?:WITH\b(?:[^;']|'[^']*')*?SELECT|SELECT)"
@@ -116,21 +111,39 @@ CREATE_TABLE_AS_RE = re.compile(
     re.IGNORECASE | re.DOTALL
 )
 
-def extract_create_table_as_statements(sql: str) -> list[dict]:
-    """返回 CREATE TABLE ... AS 语句列表"""
+
+def _find_statements(sql: str, pattern: re.Pattern, table_name_fn, statement_type: str,
+                     first_line: int = 1) -> list[dict]:
     results = []
-    for m in CREATE_TABLE_AS_RE.finditer(sql):
+    line = first_line
+    last = 0
+    for m in pattern.finditer(sql):
         match = m.group(0)
-        tbl = extract_table_name_from_create(match)
+        tbl = table_name_fn(match)
         if not tbl:
             continue
-        lineno = sql[:m.start()].count('\n') + 1
+        # 行号增量计算，避免每条语句都从头数换行
+        line += sql.count('\n', last, m.start())
+        last = m.start()
         results.append({
             'table_name': tbl,
             'sql': match.strip(),
-            'line_number': lineno,
-            'statement_type': 'create_table_as'
+            'line_number': line,
+            'statement_type': statement_type
         })
+    return results
+
+
+def extract_insert_statements(sql: str) -> list[dict]:
+    """返回 [{'table_name':..., 'sql':..., 'line_number':...}, ...]"""
+    results = _find_statements(sql, INSERT_STMT_RE, extract_table_name_from_insert, 'insert')
+    logging.info(f"提取到 {len(results)} 条 INSERT 语句。")
+    return results
+
+
+def extract_create_table_as_statements(sql: str) -> list[dict]:
+    """返回 CREATE TABLE ... AS 语句列表"""
+    results = _find_statements(sql, CREATE_TABLE_AS_RE, extract_table_name_from_create, 'create_table_as')
     logging.info(f"提取到 {len(results)} 条 CREATE TABLE ... AS 语句。")
     return results
 
@@ -604,148 +617,144 @@ def split_insert_statement(insert_sql: str, max_len: int) -> list[str]:
     return output
 
 # ---------- 3. 拆分 SQL 片段 ----------
+def _split_statement(item: dict, max_len: int = SQLFLOW_CHAR_LIMIT) -> list[str]:
+    stmt_type = item.get('statement_type', 'insert')
+    raw_sql = item['sql']
+    if stmt_type == 'insert':
+        pieces = split_insert_statement(raw_sql, max_len=max_len)
+        if not pieces:
+            logging.error(f"INSERT 语句拆分失败（行 {item.get('line_number')}）。")
+            return []
+    else:
+        normalized = raw_sql.strip()
+        if not normalized.endswith(';'):
+            normalized = normalized.rstrip(';').strip() + ';'
+        if len(normalized) > max_len:
+            logging.warning(
+                f"语句长度 {len(normalized)} 超过 {max_len} 字符（行 {item.get('line_number')}，类型 {stmt_type}）。保留原语句。"
+            )
+        pieces = [normalized]
+    return [stmt if stmt.endswith('\n') else f"{stmt}\n" for stmt in pieces]
+
+
 def split_sql_chunks(statements: list[dict], max_len: int = SQLFLOW_CHAR_LIMIT) -> list[str]:
     chunks: list[str] = []
     for item in statements:
-        stmt_type = item.get('statement_type', 'insert')
-        raw_sql = item['sql']
-        if stmt_type == 'insert':
-            pieces = split_insert_statement(raw_sql, max_len=max_len)
-            if not pieces:
-                logging.error(f"INSERT 语句拆分失败（行 {item.get('line_number')}）。")
-                continue
-        else:
-            normalized = raw_sql.strip()
-            if not normalized.endswith(';'):
-                normalized = normalized.rstrip(';').strip() + ';'
-            if len(normalized) > max_len:
-                logging.warning(
-                    f"语句长度 {len(normalized)} 超过 {max_len} 字符（行 {item.get('line_number')}，类型 {stmt_type}）。保留原语句。"
-                )
-            pieces = [normalized]
-        for stmt in pieces:
-            stmt_text = stmt if stmt.endswith('\n') else f"{stmt}\n"
-            chunks.append(stmt_text)
+        chunks.extend(_split_statement(item, max_len))
     logging.info(f"拆分为 {len(chunks)} 段，每段≤{max_len} 字符。")
     return chunks
 
+
+_QUOTED_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+_TABLE_SOURCE_RE = re.compile(r'\b(FROM|JOIN)\s+([^\s,;()]+|\()', re.IGNORECASE)
+_CONSTANT_SOURCES = {'DUAL', 'SYS.DUAL'}
+# 常量来源后只能紧跟子句结束；别名、逗号连接等一律按普通语句分析
+_CONSTANT_SOURCE_END_RE = re.compile(
+    r'\s*(?:$|[;)]|(?:WHERE|UNION|INTERSECT|MINUS|EXCEPT|GROUP|ORDER|HAVING|CONNECT|START|LIMIT|FETCH)\b)',
+    re.IGNORECASE)
+
+
+def is_constant_statement(sql: str) -> bool:
+    """不引用任何表的语句（纯字面量 VALUES、SELECT ... FROM DUAL 常量），没有列级血缘"""
+    masked = _QUOTED_RE.sub("''", sql)
+    for m in _TABLE_SOURCE_RE.finditer(masked):
+        if m.group(1).upper() == 'JOIN' or m.group(2).upper() not in _CONSTANT_SOURCES:
+            return False
+        if not _CONSTANT_SOURCE_END_RE.match(masked, m.end()):
+            return False
+    return True
+
+
+def constant_statement_calls(item: dict, max_len: int = SQLFLOW_CHAR_LIMIT) -> int:
+    """常量语句返回拆分后本会产生的分析器调用次数，其余语句返回 0"""
+    if not SQL_CONSTANT_FAST_PATH or not is_constant_statement(item['sql']):
+        return 0
+    if len(item['sql']) <= max_len:
+        return 1
+    m = VALUES_RE.match(item['sql'].strip().rstrip(';'))
+    # 超长的 VALUES 会按行组逐个拆成独立的 chunk
+    return max(len(_split_values_groups(m.group('body'))), 1) if m else 1
+
 # ---------- 4. 调用 dlineage.py 生成单段 CSV ----------
 def generate_chunk_csvs(chunk_dir: str,
                         db_type: str = 'mysql',
-                        dlineage_script: str = 'dlineage.py') -> None:
+                        dlineage_script: str = 'dlineage.py',
+                        metrics=None,
+                        backend=None,
+                        workers: int | None = None,
+                        timeout: float | None = None,
+                        journal=None,
+                        history=None) -> None:
+    """backend 为 None 时使用 SubprocessBackend（每段调用一次 dlineage.py）
+
+    chunk 按预测耗时从大到小分发给 workers 个线程（ChunkScheduler），超过 timeout 秒的分析被终止并隔离。
+    journal 中已记录分析完成的 chunk 不再重复分析。history 为 None 时读写 ANALYZER_HISTORY 中该后端的一节。
+    """
+    from analyzer_backend import SubprocessBackend
+    from chunk_scheduler import ANALYZER_TIMEOUT, ANALYZER_WORKERS, ChunkScheduler
+
     sql_files = sorted(glob.glob(os.path.join(chunk_dir, '*.sql')))
     if not sql_files:
         logging.warning(f"{chunk_dir} 下未找到任何 .sql 文件。")
         return
+    if journal is not None:
+        sql_files = pending_chunk_files(sql_files, journal)
 
-    for sql_file in sql_files:
+    if backend is None:
+        backend = SubprocessBackend(db_type, dlineage_script, timing=metrics is not None)
+
+    def on_result(sql_file: str, result) -> None:
         base = os.path.splitext(os.path.basename(sql_file))[0]
         out_csv = os.path.join(chunk_dir, f"{base}.csv")
+        logging.info(f"分析（{backend.name}）：{sql_file}")
+        if metrics is not None:
+            timings = result.timings
+            metrics.histogram('analyzer.wall_seconds').record(timings.get('wall', 0.0))
+            if 'analyze' in timings:
+                # JVM 内解析分析耗时 vs 其余开销（解释器/JVM 启动、进程创建、输出）
+                metrics.histogram('analyzer.jvm_parse_seconds').record(timings['analyze'])
+                metrics.histogram('analyzer.jvm_start_seconds').record(timings.get('jvm_start', 0.0))
+                metrics.histogram('analyzer.python_overhead_seconds').record(
+                    max(timings.get('wall', 0.0) - timings['analyze'], 0.0))
+
+        if not result.ok:
+            logging.error(f"dlineage 失败 ({sql_file})，stderr: {result.errors}")
+            return
+
+        # 先写临时文件再改名，中断时不会留下半个 CSV
+        with open(out_csv + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(result.csv_text)
+        os.replace(out_csv + '.tmp', out_csv)
+        if journal is not None:
+            journal.analyzed(base)
+        logging.info(f"已生成 CSV：{out_csv}")
 
-        cmd = ['python3', dlineage_script,
-               '/t', db_type,
-               '/f', sql_file,
-               '/csv','/traceView']  # 直接请求 CSV 输出
-        logging.info(f"运行：{' '.join(cmd)}")
-        proc = subprocess.run(cmd, capture_output=True, text=True)
+    scheduler = ChunkScheduler(backend, ANALYZER_WORKERS if workers is None else workers,
+                               ANALYZER_TIMEOUT if timeout is None else timeout, history=history, metrics=metrics)
+    scheduler.run(sql_files, on_result)
 
-        if proc.returncode != 0:
-            logging.error(f"dlineage 失败 ({sql_file})，stderr: {proc.stderr.strip()}")
+def pending_chunk_files(sql_files: list[str], journal) -> list[str]:
+    """去掉日志中已分析完成且 CSV 仍在的 chunk"""
+    pending = []
+    for sql_file in sql_files:
+        base = os.path.splitext(sql_file)[0]
+        if os.path.basename(base) in journal.analyzed_chunks and os.path.exists(base + '.csv'):
             continue
-
-        stdout = proc.stdout
-        marker = 'Error log:'
-        idx = stdout.find(marker)
-        if idx != -1:
-            # dlineage 会在 CSV 结果后追加错误日志，这里截断掉日志部分
-            stdout = stdout[:idx].rstrip('\r\n')
-            if stdout:
-                stdout += '\n'
-
-        with open(out_csv, 'w', encoding='utf-8') as f:
-            f.write(stdout)
-        logging.info(f"已生成 CSV：{out_csv}")
+        pending.append(sql_file)
+    if len(pending) < len(sql_files):
+        logging.info(f"续跑：{len(sql_files) - len(pending)} 个 chunk 已分析，剩余 {len(pending)} 个。")
+    return pending
 
 # ---------- 5. 合并所有段 CSV 为 global_lineage.csv ----------
 def merge_csvs(chunk_dir: str, output_csv: str) -> None:
-    csv_files = sorted(glob.glob(os.path.join(chunk_dir, '*.csv')))
-    if not csv_files:
-        logging.warning("无可合并的 CSV 文件。")
-        return
-    header_written = False
-    with open(output_csv, 'w', newline='', encoding='utf-8') as out_f:
-        writer = None
-        for csv_file in csv_files:
-            with open(csv_file, 'r', encoding='utf-8') as in_f:
-                reader = csv.reader(in_f)
-                try:
-                    header = next(reader)
-                except StopIteration:
-                    continue
-                if not header_written:
-                    writer = csv.writer(out_f)
-                    writer.writerow(header)
-                    header_written = True
-                for row in reader:
-                    writer.writerow(row)
-    logging.info(f"合并 CSV 完成：{output_csv}")
+    from lineage_sinks import MergedCsvSink, fan_out_chunk_dir
+    fan_out_chunk_dir(chunk_dir, [MergedCsvSink(output_csv)])
 
 
 def export_result_csvs(chunk_dir: str, result_dir: str = 'result') -> None:
-    csv_files = sorted(glob.glob(os.path.join(chunk_dir, '*.csv')))
-    if not csv_files:
-        logging.warning("无可导出的 CSV。")
-        return
-
-    os.makedirs(result_dir, exist_ok=True)
-    groups: dict[str, list[tuple[int, str]]] = {}
-    for path in csv_files:
-        base = os.path.splitext(os.path.basename(path))[0]
-        prefix, _, suffix = base.rpartition('_')
-        if suffix.isdigit():
-            key = prefix
-            order = int(suffix)
-        else:
-            key = base
-            order = 0
-        groups.setdefault(key, []).append((order, path))
-
-    for key, entries in groups.items():
-        entries.sort(key=lambda item: item[0])
-        out_path = os.path.join(result_dir, f"{key}.csv")
-        if os.path.exists(out_path):
-            os.remove(out_path)
-
-        writer = None
-        out_f = None
-        try:
-            for _, src_path in entries:
-                base_name = os.path.splitext(os.path.basename(src_path))[0]
-                sql_path = os.path.join(chunk_dir, f"{base_name}.sql")
-                sql_text = ''
-                if os.path.exists(sql_path):
-                    with open(sql_path, 'r', encoding='utf-8') as sql_f:
-                        sql_text = sql_f.read().strip()
-
-                with open(src_path, 'r', encoding='utf-8') as src_f:
-                    reader = csv.reader(src_f)
-                    try:
-                        header = next(reader)
-                    except StopIteration:
-                        continue
-                    if writer is None:
-                        out_f = open(out_path, 'w', newline='', encoding='utf-8')
-                        writer = csv.writer(out_f)
-                        writer.writerow(header + ['SQL_TEXT'])
-                    for row in reader:
-                        if not row or all(cell.strip() == '' for cell in row):
-                            continue
-                        writer.writerow(row + [sql_text])
-        finally:
-            if out_f:
-                out_f.close()
-        if writer:
-            logging.info(f"已生成合并 CSV：{out_path}")
+    """每个源文件的各段 CSV 汇总为 result/<base>.csv（附 SQL_TEXT）"""
+    from lineage_sinks import ResultCsvSink, fan_out_chunk_dir
+    fan_out_chunk_dir(chunk_dir, [ResultCsvSink(result_dir)])
 
 
 def _normalize_lineage_row(row: list[str]) -> list[str] | None:
@@ -822,51 +831,45 @@ def _map_transform_operation(relation_type: str | None) -> str:
     return 'transform'
 
 
-def export_datahub_lineage(chunk_dir: str, output_path: str = DATAHUB_OUTPUT) -> None:
-    csv_files = sorted(glob.glob(os.path.join(chunk_dir, '*.csv')))
-    if not csv_files:
-        logging.warning("无 CSV 可用于生成 DataHub JSON。")
-        return
+def add_datahub_row(lineage_map: dict[str, dict], row: dict) -> bool:
+    """把一行血缘（列名→值）并入 lineage_map，无法使用时返回 False"""
+    source_dataset_name = _compose_dataset_name(row.get('SOURCE_SCHEMA'), row.get('SOURCE_TABLE'))
+    target_dataset_name = _compose_dataset_name(row.get('TARGET_SCHEMA'), row.get('TARGET_TABLE'))
+    if not source_dataset_name or not target_dataset_name:
+        return False
+
+    source_dataset_urn = _build_dataset_urn(source_dataset_name)
+    lineage_entry = lineage_map.setdefault(
+        target_dataset_name,
+        {
+            'dataset_urn': _build_dataset_urn(target_dataset_name),
+            'upstreams': set(),
+            'fine_grained': set()
+        }
+    )
+    lineage_entry['upstreams'].add(source_dataset_urn)
 
-    lineage_map: dict[str, dict] = {}
-    skipped_rows = 0
-    for path in csv_files:
-        with open(path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if not row:
-                    continue
-                source_db = (row.get('SOURCE_DB') or '').strip()
-                if source_db.lower() == 'error log:':
-                    continue
-                source_dataset_name = _compose_dataset_name(row.get('SOURCE_SCHEMA'), row.get('SOURCE_TABLE'))
-                target_dataset_name = _compose_dataset_name(row.get('TARGET_SCHEMA'), row.get('TARGET_TABLE'))
-                if not source_dataset_name or not target_dataset_name:
-                    skipped_rows += 1
-                    continue
-
-                source_dataset_urn = _build_dataset_urn(source_dataset_name)
-                lineage_entry = lineage_map.setdefault(
-                    target_dataset_name,
-                    {
-                        'dataset_urn': _build_dataset_urn(target_dataset_name),
-                        'upstreams': set(),
-                        'fine_grained': set()
-                    }
-                )
-                lineage_entry['upstreams'].add(source_dataset_urn)
-
-                src_col = _prepare_column_name(row.get('SOURCE_COLUMN'))
-                tgt_col = _prepare_column_name(row.get('TARGET_COLUMN'))
-                if src_col and tgt_col:
-                    src_field_urn = _build_field_urn(source_dataset_urn, src_col)
-                    tgt_field_urn = _build_field_urn(lineage_entry['dataset_urn'], tgt_col)
-                    op = _map_transform_operation(row.get('RELATION_TYPE'))
-                    lineage_entry['fine_grained'].add((src_field_urn, tgt_field_urn, op))
-                else:
-                    skipped_rows += 1
+    src_col = _prepare_column_name(row.get('SOURCE_COLUMN'))
+    tgt_col = _prepare_column_name(row.get('TARGET_COLUMN'))
+    if src_col and tgt_col:
+        src_field_urn = _build_field_urn(source_dataset_urn, src_col)
+        tgt_field_urn = _build_field_urn(lineage_entry['dataset_urn'], tgt_col)
+        op = _map_transform_operation(row.get('RELATION_TYPE'))
+        lineage_entry['fine_grained'].add((src_field_urn, tgt_field_urn, op))
+        return True
+    return False
+
+
+def build_datahub_lineage(chunk_dir: str) -> tuple[dict[str, dict], int]:
+    """汇总所有 CSV 为 {目标数据集: {dataset_urn, upstreams, fine_grained}}，返回 (lineage_map, 跳过行数)"""
+    from lineage_sinks import DataHubSink, fan_out_chunk_dir
+    sink = DataHubSink(output_path=None)
+    fan_out_chunk_dir(chunk_dir, [sink])
+    return sink.lineage_map, sink.skipped_rows
 
-    payload = []
+
+def iter_datahub_mcps(lineage_map: dict[str, dict]):
+    """按目标数据集逐个生成 upstreamLineage MCP"""
     for target_name in sorted(lineage_map.keys()):
         info = lineage_map[target_name]
         upstreams = [
@@ -886,7 +889,7 @@ def export_datahub_lineage(chunk_dir: str, output_path: str = DATAHUB_OUTPUT) ->
         aspect_value = {"upstreams": upstreams}
         if fine_grained:
             aspect_value["fineGrainedLineages"] = fine_grained
-        payload.append({
+        yield {
             "entityType": "dataset",
             "entityUrn": info['dataset_urn'],
             "changeType": "UPSERT",
@@ -895,8 +898,11 @@ def export_datahub_lineage(chunk_dir: str, output_path: str = DATAHUB_OUTPUT) ->
                 "value": json.dumps(aspect_value, ensure_ascii=False),
                 "contentType": "application/json"
             }
-        })
+        }
+
 
+def write_datahub_json(lineage_map: dict[str, dict], output_path: str, skipped_rows: int = 0) -> None:
+    payload = list(iter_datahub_mcps(lineage_map))
     output_dir = os.path.dirname(output_path)
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
@@ -904,123 +910,351 @@ def export_datahub_lineage(chunk_dir: str, output_path: str = DATAHUB_OUTPUT) ->
         json.dump(payload, f, ensure_ascii=False, indent=2)
     logging.info(f"已生成 DataHub JSON：{output_path}，包含 {len(payload)} 个数据集。跳过 {skipped_rows} 行。")
 
-# ---------- 主流程 ----------
-if __name__ == '__main__':
-    logging.basicConfig(level=logging.INFO,
-                        format="%(asctime)s - %(levelname)s - %(message)s")
-    logging.info(f"单条 SQL 长度限制：{SQLFLOW_CHAR_LIMIT} 字符。")
 
-    sql_dir = 'sql'
-    chunk_dir = 'chunks'
-    if os.path.exists(chunk_dir):
-        shutil.rmtree(chunk_dir)
-    os.makedirs(chunk_dir, exist_ok=True)
+def export_datahub_lineage(chunk_dir: str, output_path: str = DATAHUB_OUTPUT) -> None:
+    from lineage_sinks import DataHubSink, fan_out_chunk_dir
+    fan_out_chunk_dir(chunk_dir, [DataHubSink(output_path)])
+
+
+# ---------- 6. 导入 MySQL ----------
+# 明确插入顺序为表的所有字段顺序
+LINEAGE_TABLE_FIELDS = [
+    'SOURCE_DB', 'SOURCE_SCHEMA', 'SOURCE_TABLE_ID', 'SOURCE_TABLE',
+    'SOURCE_COLUMN_ID', 'SOURCE_COLUMN', 'TARGET_DB', 'TARGET_SCHEMA',
+    'TARGET_TABLE_ID', 'TARGET_TABLE', 'TARGET_COLUMN_ID', 'TARGET_COLUMN',
+    'RELATION_TYPE', 'EFFECTTYPE', 'SQL_TEXT', 'FILE_NAME'
+]
+LINEAGE_TABLE_INSERT = (f"INSERT INTO lineage_table ({','.join(LINEAGE_TABLE_FIELDS)}) "
+                        f"VALUES ({','.join(['%s'] * len(LINEAGE_TABLE_FIELDS))})")
+
+
+def connect_mysql():
+    # MySQL 连接配置
+    return pymysql.connect(
+        host=os.getenv('MYSQL_HOST', '127.0.0.1'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD', 'a8548879'),
+        database=os.getenv('MYSQL_DATABASE', 'lineage'),
+        charset='utf8mb4'
+    )
 
-    sql_files = sorted(glob.glob(os.path.join(sql_dir, '*.sql')))
-    for src_sql in sql_files:
-        try:
-            # 尝试GB18030编码（中文国标编码）
-            raw = open(src_sql, encoding='gb18030').read()
-        except UnicodeDecodeError:
-            try:
-                # 如果GB18030失败，尝试GBK
-                raw = open(src_sql, encoding='gbk').read()
-            except UnicodeDecodeError:
-                # 最后尝试UTF-8
-                raw = open(src_sql, encoding='utf-8').read()
-        
+
+def import_lineage_to_mysql(chunk_dir: str) -> None:
+    """清空 lineage_table 后按 chunk 批量导入"""
+    from lineage_sinks import MySQLSink, fan_out_chunk_dir
+    fan_out_chunk_dir(chunk_dir, [MySQLSink()])
+
+
+# ---------- 读取与拆分单个 SQL 文件 ----------
+def read_sql_file(path: str, manifest=None) -> str:
+    """嗅探编码（BOM + 首段非 ASCII 字节）后内存映射解码一次；manifest 缓存每个文件的检测结果"""
+    return read_text(path, manifest)
+
+
+def split_source_sql(raw: str, metrics=None, src_sql: str = '') -> list[str]:
+    """预处理 → 提取 INSERT / CTAS → 跳过常量语句 → 拆分，返回 chunk 列表"""
+    metrics = metrics or PipelineMetrics()
+    with metrics.stage('preprocess') as st:
         cleaned = preprocess_sql(raw)
+        st.add(chars_in=len(raw), chars_out=len(cleaned))
+    with metrics.stage('extract') as st:
         insert_statements = extract_insert_statements(cleaned)
         create_statements = extract_create_table_as_statements(cleaned)
         statements = sorted(
             insert_statements + create_statements,
             key=lambda item: item.get('line_number', 0)
         )
-        if not statements:
-            logging.info(f"{src_sql} 未提取到 INSERT 或 CREATE TABLE ... AS 语句，跳过。")
-            continue
+        st.add(chars_in=len(cleaned), statements_out=len(statements))
+    if not statements:
+        logging.info(f"{src_sql} 未提取到 INSERT 或 CREATE TABLE ... AS 语句，跳过。")
+        return []
+    with metrics.stage('constant_fast_path') as st:
+        calls = [constant_statement_calls(item) for item in statements]
+        skipped = sum(1 for n in calls if n)
+        if skipped:
+            statements = [item for item, n in zip(statements, calls) if not n]
+            logging.info(f"{src_sql} 跳过 {skipped} 条仅含常量的语句，省去 {sum(calls)} 次分析器调用。")
+        st.add(statements_in=len(calls), constant_statements=skipped, analyzer_calls_avoided=sum(calls))
+    if not statements:
+        return []
+    with metrics.stage('split') as st:
         chunks = split_sql_chunks(statements)
-        if not chunks:
-            logging.warning(f"{src_sql} 的语句拆分结果为空，跳过。")
-            continue
+        st.add(statements_in=len(statements), statements_out=len(chunks),
+               chars_out=sum(len(seg) for seg in chunks))
+    if not chunks:
+        logging.warning(f"{src_sql} 的语句拆分结果为空，跳过。")
+    return chunks
 
-        base_name = os.path.splitext(os.path.basename(src_sql))[0]
-        for idx, seg in enumerate(chunks, start=1):
-            path = os.path.join(chunk_dir, f"{base_name}_{idx}.sql")
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(seg)
-            logging.info(f"已保存：{path}")
 
-    # 生成每段 CSV
-    generate_chunk_csvs(chunk_dir,
-                        db_type='hive',
-                        dlineage_script='dlineage.py')
+def source_file_chunks(src_sql: str, manifest=None, metrics=None):
+    """返回单个源文件的 chunk；超过 SQL_STREAM_THRESHOLD_BYTES 的文件改为流式处理（返回生成器）"""
+    metrics = metrics or PipelineMetrics()
+    size = os.path.getsize(src_sql)
+    if size > SQL_STREAM_THRESHOLD_BYTES:
+        from sql_stream import iter_file_chunks
+        logging.info(f"{src_sql} 大小 {size} 字节，使用流式预处理。")
+        return iter_file_chunks(src_sql, manifest, metrics=metrics)
+    with metrics.stage('read') as st:
+        raw = read_sql_file(src_sql, manifest)
+        st.add(files=1, bytes_in=size, chars_out=len(raw))
+    return split_source_sql(raw, metrics, src_sql)
+
+
+class _LogCapture(logging.Handler):
+    """子进程内暂存日志，交回主进程按源文件顺序输出"""
+
+    def __init__(self):
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _split_worker(task: tuple[str, str | None]):
+    """进程池任务：读取 + 预处理 + 提取 + 拆分单个文件，返回 (chunks, 编码, 日志, 阶段指标)"""
+    src_sql, cached_encoding = task
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    capture = _LogCapture()
+    root.handlers = [capture]
+    root.setLevel(logging.INFO)
+    metrics = PipelineMetrics(profile_stages=(), trace_memory=False)
+    manifest = EncodingManifest(None)
+    stat = os.stat(src_sql)
+    if cached_encoding:
+        manifest.set(src_sql, stat, cached_encoding)
+    try:
+        chunks = source_file_chunks(src_sql, manifest, metrics)
+    finally:
+        root.handlers, root.level = saved_handlers, saved_level
+    return chunks, manifest.get(src_sql, stat), capture.records, metrics.stages
+
+
+def iter_split_sources(sql_files: list[str], manifest=None, metrics=None, workers: int = SPLIT_WORKERS):
+    """按 sql_files 顺序产出 (src_sql, chunks)；小文件在进程池中并行拆分，超大文件在主进程流式处理
+
+    子进程的日志在主进程按文件顺序回放，已提交未取走的文件数不超过 2 * workers。
+    """
+    metrics = metrics or PipelineMetrics()
+    manifest = manifest if manifest is not None else EncodingManifest(None)
+    if workers <= 1 or len(sql_files) <= 1:
+        for src_sql in sql_files:
+            yield src_sql, source_file_chunks(src_sql, manifest, metrics)
+        return
 
-    # 将每个存储过程的 CSV 汇总到 result 目录
-    export_result_csvs(chunk_dir, result_dir='result')
+    def cached(path: str) -> str | None:
+        return manifest.get(path, os.stat(path))
+
+    # 本进程已启动 JVM（JvmBackend）时不能 fork，改用 spawn
+    jpype = sys.modules.get('jpype')
+    context = get_context('spawn') if jpype is not None and jpype.isJVMStarted() else get_context()
+    with context.Pool(workers) as pool:
+        pending: deque = deque()
+        files = iter(sql_files)
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < 2 * workers:
+                src_sql = next(files, None)
+                if src_sql is None:
+                    exhausted = True
+                elif os.path.getsize(src_sql) > SQL_STREAM_THRESHOLD_BYTES:
+                    pending.append((src_sql, None))
+                else:
+                    pending.append((src_sql, pool.apply_async(_split_worker, ((src_sql, cached(src_sql)),))))
+            if not pending:
+                break
+            src_sql, job = pending.popleft()
+            if job is None:
+                yield src_sql, source_file_chunks(src_sql, manifest, metrics)
+                continue
+            with metrics.stage('split_wait'):
+                chunks, encoding, records, stages = job.get()
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            metrics.merge_stages(stages)
+            if encoding:
+                manifest.set(src_sql, os.stat(src_sql), encoding)
+            yield src_sql, chunks
+
+
+def run_chunk_pipeline(sql_files: list[str], chunk_dir: str = 'chunks', db_type: str = 'hive',
+                       backend=None, metrics=None, result_dir: str = 'result',
+                       datahub_output: str = DATAHUB_OUTPUT, workers: int = SPLIT_WORKERS,
+                       analyzer_workers: int | None = None, timeout: float | None = None,
+                       use_async: bool = False, journal=None, queue_dir: str | None = None,
+                       local_workers: int = 0, table_csv: str | None = None) -> None:
+    """落盘流程：chunks/*.sql → chunks/*.csv → result/、DataHub JSON、MySQL
+
+    传入 journal（run_journal.RunJournal）时记录进度；日志中已完成的拆分、分析与 sink 不再重复。
+    传入 queue_dir 时 chunk 发布到共享队列由各节点的 worker 分析（chunk_queue），本进程只负责拆分与合并。
+    """
+    metrics = metrics or PipelineMetrics()
+    state = None
+    if journal is not None:
+        from run_journal import source_state
+        state = source_state(sql_files)
+    if journal is not None and journal.split == state:
+        logging.info("续跑：源文件未变化，沿用已拆分的 chunks。")
+    else:
+        manifest = EncodingManifest()
+        for src_sql, chunks in iter_split_sources(sql_files, manifest, metrics, workers):
+            base_name = os.path.splitext(os.path.basename(src_sql))[0]
+            with metrics.stage('write_chunks') as st:
+                for idx, seg in enumerate(chunks, start=1):
+                    path = os.path.join(chunk_dir, f"{base_name}_{idx}.sql")
+                    with open(path, 'w', encoding='utf-8') as f:
+                        f.write(seg)
+                    logging.info(f"已保存：{path}")
+                    st.add(files_out=1, bytes_out=len(seg.encode('utf-8')))
+        manifest.save()
+        if journal is not None:
+            journal.split_done(state)
 
-    # 输出 DataHub JSON（列级血缘）
-    export_datahub_lineage(chunk_dir, output_path=DATAHUB_OUTPUT)
-    
-    
+    # 生成每段 CSV
+    with metrics.stage('generate_chunk_csvs') as st:
+        if queue_dir:
+            from chunk_queue import run_coordinator
+            run_coordinator(chunk_dir, queue_dir, db_type, backend=backend, local_workers=local_workers,
+                            metrics=metrics, journal=journal)
+        elif use_async:
+            from async_analyzer import ASYNC_ANALYZER_CONCURRENCY, generate_chunk_csvs_async
+            generate_chunk_csvs_async(chunk_dir, db_type=db_type, dlineage_script='dlineage.py',
+                                      concurrency=analyzer_workers or ASYNC_ANALYZER_CONCURRENCY,
+                                      timeout=timeout, metrics=metrics, journal=journal)
+        else:
+            generate_chunk_csvs(chunk_dir,
+                                db_type=db_type,
+                                dlineage_script='dlineage.py',
+                                metrics=metrics,
+                                backend=backend,
+                                workers=analyzer_workers,
+                                timeout=timeout,
+                                journal=journal)
+        if backend is not None:
+            backend.close()
+        chunk_csvs = glob.glob(os.path.join(chunk_dir, '*.csv'))
+        st.add(statements_in=len(glob.glob(os.path.join(chunk_dir, '*.sql'))), files_out=len(chunk_csvs),
+               bytes_out=sum(os.path.getsize(path) for path in chunk_csvs))
+
+    # 每段 CSV 只解析一次，同时写 result/、DataHub JSON 与 MySQL
+    from lineage_sinks import default_sinks, fan_out_chunk_dir
     if pymysql is None:
         logging.warning("未安装 PyMySQL，跳过 MySQL 导入步骤。可执行 `pip install pymysql` 启用该功能。")
+    sinks = default_sinks(result_dir, datahub_output, mysql=pymysql is not None, table_csv=table_csv)
+    with metrics.stage('fan_out_sinks') as st:
+        st.add(files_in=fan_out_chunk_dir(chunk_dir, sinks, metrics, journal))
+    if journal is not None:
+        journal.finish()
+
+
+# ---------- 主流程 ----------
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Split sql/*.sql into chunks, analyse them and export lineage')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='Hand chunks to the analyzer without writing chunks/*.sql and *.csv')
+    parser.add_argument('--keep-chunks', action='store_true',
+                        help='With --in-memory, still write chunk artifacts to chunks/ for debugging')
+    parser.add_argument('--backend', default=None, help='Analyzer backend (subprocess, jvm, stub)')
+    parser.add_argument('-t', '--db-type', default='hive', help='Database vendor passed to dlineage.py /t')
+    parser.add_argument('-j', '--workers', type=int, default=SPLIT_WORKERS,
+                        help='Processes that preprocess and split the source files')
+    parser.add_argument('--analyzer-workers', type=int, default=None,
+                        help='Concurrent analyzer processes, largest predicted chunk first (default ANALYZER_WORKERS, 1)')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Kill and quarantine analyzer runs longer than this many seconds')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Drive concurrent dlineage.py processes from asyncio, parsing stdout as it streams')
+    parser.add_argument('--reuse-lineage', action='store_true',
+                        help='Reuse the lineage of statements that differ only in literals (fingerprint cache)')
+    parser.add_argument('--queue', default=None, metavar='DIR',
+                        help='Publish chunks to this shared directory and let chunk_queue.py workers analyse them')
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='With --queue, also start this many worker processes on this host')
+    parser.add_argument('--table-lineage', default=None, metavar='CSV',
+                        help='Also write table-level lineage rolled up from the column rows (no extra analysis)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and update lineage outputs whenever sql/*.sql changes')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from chunks/run_journal.jsonl instead of starting over')
+    args = parser.parse_args()
+    if args.resume and args.in_memory:
+        parser.error('--resume only applies to the chunks/ flow, not --in-memory')
+    if args.watch and (args.resume or args.queue or args.use_async):
+        parser.error('--watch cannot be combined with --resume, --queue or --async')
+    if args.queue and (args.in_memory or args.use_async):
+        parser.error('--queue only applies to the chunks/ flow, not --in-memory or --async')
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    logging.info(f"单条 SQL 长度限制：{SQLFLOW_CHAR_LIMIT} 字符。")
+    metrics = PipelineMetrics()
+
+    sql_dir = 'sql'
+    chunk_dir = 'chunks'
+    sql_files = sorted(glob.glob(os.path.join(sql_dir, '*.sql')))
+    journal = None
+    if not args.in_memory and not args.watch:
+        from run_journal import RUN_JOURNAL_NAME, RunJournal, source_state
+        journal = RunJournal(os.path.join(chunk_dir, RUN_JOURNAL_NAME))
+        if args.resume and journal.resumable(source_state(sql_files)):
+            logging.info(f"从 {journal.path} 续跑：已分析 {len(journal.analyzed_chunks)} 个 chunk，"
+                         f"已完成 sink：{', '.join(sorted(journal.sinks_done)) or '无'}。")
+        else:
+            if args.resume:
+                logging.warning(f"{journal.path} 不存在、已完成或已过期，从头开始。")
+            journal = None
+    if journal is None and not args.watch:
+        if os.path.exists(chunk_dir):
+            shutil.rmtree(chunk_dir)
+        os.makedirs(chunk_dir, exist_ok=True)
+        if not args.in_memory:
+            journal = RunJournal(os.path.join(chunk_dir, RUN_JOURNAL_NAME))
+
+    backend = None
+    if args.backend:
+        from analyzer_backend import get_backend
+        backend = get_backend(args.backend, db_type=args.db_type)
+    if args.reuse_lineage:
+        from analyzer_backend import SubprocessBackend
+        from lineage_fingerprint import FingerprintBackend
+        backend = FingerprintBackend(backend or SubprocessBackend(args.db_type, timing=True), metrics=metrics)
+
+    if args.watch:
+        from lineage_watch import run_watch
+        run_watch(sql_dir, db_type=args.db_type, backend=backend, mysql=pymysql is not None, metrics=metrics)
+    elif args.use_async:
+        if backend is not None:
+            logging.warning("--async 固定使用 dlineage.py 子进程，忽略 --backend / --reuse-lineage。")
+        from async_analyzer import ASYNC_ANALYZER_CONCURRENCY, run_async_pipeline
+        concurrency = args.analyzer_workers or ASYNC_ANALYZER_CONCURRENCY
+        if args.in_memory:
+            run_async_pipeline(sql_files, db_type=args.db_type, concurrency=concurrency, timeout=args.timeout,
+                               mysql=pymysql is not None, metrics=metrics, workers=args.workers,
+                               table_csv=args.table_lineage)
+        else:
+            run_chunk_pipeline(sql_files, chunk_dir, db_type=args.db_type, metrics=metrics, workers=args.workers,
+                               analyzer_workers=concurrency, timeout=args.timeout, use_async=True,
+                               journal=journal, table_csv=args.table_lineage)
+    elif args.in_memory:
+        from lineage_pipeline import run_in_memory_pipeline
+        run_in_memory_pipeline(sql_files, db_type=args.db_type, backend=backend,
+                               chunk_dir=chunk_dir if args.keep_chunks else None,
+                               result_dir='result', datahub_output=DATAHUB_OUTPUT,
+                               mysql=pymysql is not None, metrics=metrics, workers=args.workers,
+                               table_csv=args.table_lineage)
+        if pymysql is None:
+            logging.warning("未安装 PyMySQL，跳过 MySQL 导入步骤。可执行 `pip install pymysql` 启用该功能。")
     else:
-        # MySQL 连接配置
-        conn = pymysql.connect(
-            host='127.0.0.1',
-            user='root',
-            password='a8548879',
-            database='lineage',
-            charset='utf8mb4'
-        )
-        cursor = conn.cursor()
-
-        csv_files = glob.glob('chunks/*.csv')
-        # 插入前清空表
-        cursor.execute("TRUNCATE TABLE lineage_table;")
-        conn.commit()
-        print("lineage_table 已清空，开始批量导入...")
-        csv_files = glob.glob('chunks/*.csv')
-        for csv_file in csv_files:
-            base = os.path.splitext(os.path.basename(csv_file))[0]
-            sql_file = os.path.join('chunks', base + '.sql')
-            with open(sql_file, 'r', encoding='utf-8') as f_sql:
-                sql_content = f_sql.read()
-            with open(csv_file, 'r', encoding='utf-8') as f_csv:
-                reader = csv.reader(f_csv)
-                header = next(reader)
-                # 明确插入顺序为表的所有字段顺序
-                fields = [
-                    'SOURCE_DB', 'SOURCE_SCHEMA', 'SOURCE_TABLE_ID', 'SOURCE_TABLE',
-                    'SOURCE_COLUMN_ID', 'SOURCE_COLUMN', 'TARGET_DB', 'TARGET_SCHEMA',
-                    'TARGET_TABLE_ID', 'TARGET_TABLE', 'TARGET_COLUMN_ID', 'TARGET_COLUMN',
-                    'RELATION_TYPE', 'EFFECTTYPE', 'SQL_TEXT', 'FILE_NAME'
-                ]
-                placeholders = ','.join(['%s'] * len(fields))
-                insert_sql = f"INSERT INTO lineage_table ({','.join(fields)}) VALUES ({placeholders})"
-                for row in reader:
-                    # row和字段严格对齐
-                    # 如果遇到空行（或者全字段为空），跳出当前文件的插入循环
-                    if not row or all(cell.strip() == '' for cell in row):
-                        print(f"遇到空行，跳过整个文件：{csv_file}")
-                        break   # 跳出本文件循环，继续下一个csv文件
-                    normalized_row = _normalize_lineage_row(row)
-                    if not normalized_row:
-                        print(f"无法解析列，跳过: {csv_file} 行内容: {row}")
-                        continue
-                    row = normalized_row
-                    ext_row = row + [sql_content, os.path.basename(sql_file)]
-                    if len(ext_row) != len(fields):
-                        print(f"字段数量不一致，跳过: {csv_file} 行内容: {ext_row}")
-                        continue
-                    try:
-                        cursor.execute(insert_sql, ext_row)
-                    except Exception as e:
-                        print(f"插入出错: {e}\nSQL: {insert_sql}\n数据: {ext_row}")
-                        continue
-            print(f"{os.path.basename(csv_file)} 导入完成")
-
-            conn.commit()
-        cursor.close()
-        conn.close()   
+        run_chunk_pipeline(sql_files, chunk_dir, db_type=args.db_type, backend=backend, metrics=metrics,
+                           workers=args.workers, analyzer_workers=args.analyzer_workers, timeout=args.timeout,
+                           journal=journal, queue_dir=args.queue, local_workers=args.local_workers,
+                           table_csv=args.table_lineage)
+
+    metrics.write_report(PIPELINE_METRICS_REPORT)
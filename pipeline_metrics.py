@@ -0,0 +1,210 @@
+"""
+Stage-level metrics for the lineage pipeline.
+
+    metrics = PipelineMetrics()
+    with metrics.stage('preprocess') as st:
+        st.add(bytes_in=len(raw), statements_out=len(statements))
+    metrics.histogram('analyzer.wall').record(seconds)
+    metrics.write_report('pipeline_metrics.json')
+
+A stage entered several times (e.g. once per source file) accumulates into the
+same record. Wall time, CPU time of this process and CPU time of finished child
+processes (the dlineage.py subprocesses) are recorded separately. Stages listed
+in PIPELINE_PROFILE get a cProfile dump, PIPELINE_TRACEMALLOC records peak
+Python memory per stage.
+"""
+import cProfile
+import json
+import logging
+import math
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PIPELINE_METRICS_REPORT = os.getenv("PIPELINE_METRICS_REPORT", "pipeline_metrics.json")
+PIPELINE_PROFILE = [name for name in os.getenv("PIPELINE_PROFILE", "").split(',') if name]
+PIPELINE_PROFILE_DIR = os.getenv("PIPELINE_PROFILE_DIR", "profiles")
+PIPELINE_TRACEMALLOC = os.getenv("PIPELINE_TRACEMALLOC", "").lower() in ('1', 'true', 'yes', 'y')
+
+
+class Histogram:
+    """对数分桶直方图（每个 2 倍区间 4 个桶），内存固定，可估算分位数"""
+
+    _BUCKETS_PER_OCTAVE = 4
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._buckets: dict[int, int] = {}
+
+    def record(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        index = math.floor(math.log2(value) * self._BUCKETS_PER_OCTAVE) if value > 0 else -10 ** 6
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    def _bucket_upper(self, index: int) -> float:
+        if index == -10 ** 6:
+            return 0.0
+        return 2 ** ((index + 1) / self._BUCKETS_PER_OCTAVE)
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(self._bucket_upper(index), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.total, 6),
+            'mean': round(self.total / self.count, 6) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': {f"{self._bucket_upper(i):.6g}": n for i, n in sorted(self._buckets.items())}
+        }
+
+
+class StageRecord:
+    __slots__ = ('name', 'calls', 'wall', 'cpu', 'cpu_children', 'peak_memory', 'counters')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.cpu_children = 0.0
+        self.peak_memory = 0
+        self.counters: dict[str, int] = {}
+
+    def add(self, **counters: int) -> None:
+        """累加计数，如 bytes_in / bytes_out / statements_in / statements_out"""
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        data = {
+            'calls': self.calls,
+            'wall_seconds': round(self.wall, 6),
+            'cpu_seconds': round(self.cpu, 6),
+            'child_cpu_seconds': round(self.cpu_children, 6),
+        }
+        if self.peak_memory:
+            data['peak_memory_bytes'] = self.peak_memory
+        data.update(self.counters)
+        return data
+
+
+class PipelineMetrics:
+    def __init__(self, profile_stages=PIPELINE_PROFILE, profile_dir: str = PIPELINE_PROFILE_DIR,
+                 trace_memory: bool = PIPELINE_TRACEMALLOC):
+        self.stages: dict[str, StageRecord] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.profile_stages = set(profile_stages or ())
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self._started = time.perf_counter()
+        self._profilers: dict[str, cProfile.Profile] = {}
+        # 每个线程当前嵌套的阶段：各层至今的内存峰值、是否已有 profiler 在运行
+        self._local = threading.local()
+
+    def histogram(self, name: str) -> Histogram:
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram()
+        return hist
+
+    @contextmanager
+    def stage(self, name: str):
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = StageRecord(name)
+        local = self._local
+        peaks = local.__dict__.setdefault('peaks', [])
+        profiler = None
+        if name in self.profile_stages and not getattr(local, 'profiling', False):
+            # cProfile 不能嵌套，外层阶段在采样时内层不再单独采样
+            profiler = self._profilers.setdefault(name, cProfile.Profile())
+            local.profiling = True
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            if peaks:
+                # reset_peak 会清掉外层阶段的峰值，先记下
+                peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        if self.trace_memory:
+            peaks.append(0)
+        times_before = os.times()
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+                local.profiling = False
+            record.wall += time.perf_counter() - wall_before
+            record.cpu += time.process_time() - cpu_before
+            times_after = os.times()
+            record.cpu_children += (times_after.children_user - times_before.children_user
+                                    + times_after.children_system - times_before.children_system)
+            if self.trace_memory:
+                peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+                record.peak_memory = max(record.peak_memory, peak)
+                if peaks:
+                    peaks[-1] = max(peaks[-1], peak)
+                if tracing:
+                    tracemalloc.stop()
+            record.calls += 1
+
+    def merge_stages(self, stages: dict[str, StageRecord]) -> None:
+        """并入子进程的阶段记录（墙钟时间按各进程累加）"""
+        for name, other in stages.items():
+            record = self.stages.get(name)
+            if record is None:
+                record = self.stages[name] = StageRecord(name)
+            record.calls += other.calls
+            record.wall += other.wall
+            record.cpu += other.cpu
+            record.cpu_children += other.cpu_children
+            record.peak_memory = max(record.peak_memory, other.peak_memory)
+            record.add(**other.counters)
+
+    def to_dict(self) -> dict:
+        return {
+            'total_wall_seconds': round(time.perf_counter() - self._started, 6),
+            'stages': {name: record.to_dict() for name, record in self.stages.items()},
+            'histograms': {name: hist.to_dict() for name, hist in self.histograms.items()},
+        }
+
+    def write_report(self, path: str = PIPELINE_METRICS_REPORT) -> None:
+        report_dir = os.path.dirname(path)
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        for name, profiler in self._profilers.items():
+            os.makedirs(self.profile_dir, exist_ok=True)
+            prof_path = os.path.join(self.profile_dir, f"{name}.prof")
+            profiler.dump_stats(prof_path)
+            logging.info(f"已写入 cProfile：{prof_path}")
+        summary = ', '.join(f"{name} {record.wall:.2f}s" for name, record in self.stages.items())
+        logging.info(f"阶段耗时：{summary}。指标报告：{path}")
@@ -0,0 +1,126 @@
+"""
+Durable progress journal for resuming the disk flow.
+
+    journal = RunJournal(os.path.join('chunks', RUN_JOURNAL_NAME))
+    journal.split_done(source_state(sql_files))     # chunks/*.sql written
+    journal.analyzed('p_load_17')                   # chunks/p_load_17.csv written
+    journal.committed('mysql', 'p_load_17')         # rows committed to lineage_table
+    journal.sink_done('result_csvs')
+    journal.finish()
+
+One json object per line, appended and fsync'ed (analysis entries are synced
+at most every RUN_JOURNAL_SYNC_SECONDS; a lost one only means the chunk is
+analysed again). A run can be resumed when its journal is unfinished and the
+source files and split settings are unchanged: the split is skipped, chunks
+already analysed are not sent to the analyzer again, finished sinks are
+skipped and MySQLSink neither truncates lineage_table nor inserts a chunk
+twice (see MySQLSink.resume).
+"""
+import json
+import logging
+import os
+import time
+
+RUN_JOURNAL_NAME = os.getenv("RUN_JOURNAL_NAME", "run_journal.jsonl")
+RUN_JOURNAL_SYNC_SECONDS = float(os.getenv("RUN_JOURNAL_SYNC_SECONDS", "1.0"))
+
+
+def source_state(sql_files: list[str]) -> dict:
+    """源文件的 (大小, mtime) 与影响拆分结果的设置；二者不变时 chunks/*.sql 不变"""
+    from main_to_json import SQL_CONSTANT_FAST_PATH, SQLFLOW_CHAR_LIMIT
+    files = {}
+    for path in sql_files:
+        stat = os.stat(path)
+        files[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns]
+    return {
+        'files': files,
+        'settings': {'char_limit': SQLFLOW_CHAR_LIMIT, 'constant_fast_path': SQL_CONSTANT_FAST_PATH},
+    }
+
+
+class RunJournal:
+    def __init__(self, path: str):
+        self.path = path
+        self.split: dict | None = None
+        self.analyzed_chunks: set[str] = set()
+        self.committed_chunks: dict[str, set[str]] = {}
+        self.sinks_done: set[str] = set()
+        self.finished = False
+        self._file = None
+        self._last_sync = 0.0
+        self._torn = False
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._torn = not line.endswith('\n')
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 崩溃时最后一行可能只写了一半
+                    logging.warning(f"忽略日志中不完整的记录：{self.path}")
+                    continue
+                event = entry.get('event')
+                if event == 'split':
+                    self.split = entry['state']
+                elif event == 'analyzed':
+                    self.analyzed_chunks.add(entry['chunk'])
+                elif event == 'committed':
+                    self.committed_chunks.setdefault(entry['sink'], set()).add(entry['chunk'])
+                elif event == 'sink_done':
+                    self.sinks_done.add(entry['sink'])
+                elif event == 'finished':
+                    self.finished = True
+
+    def resumable(self, state: dict) -> bool:
+        """日志未完成且源文件、拆分设置与上次相同时才能续跑"""
+        if self.split is None or self.finished:
+            return False
+        if self.split != state:
+            logging.warning("源文件或拆分设置已变化，无法续跑，将重新开始。")
+            return False
+        return True
+
+    def _append(self, entry: dict, durable: bool = True) -> None:
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            if self._torn:
+                # 上次写到一半的行单独成行，不与新记录粘连
+                self._file.write('\n')
+                self._torn = False
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        now = time.monotonic()
+        if durable or now - self._last_sync >= RUN_JOURNAL_SYNC_SECONDS:
+            os.fsync(self._file.fileno())
+            self._last_sync = now
+
+    def split_done(self, state: dict) -> None:
+        self.split = state
+        self._append({'event': 'split', 'state': state})
+
+    def analyzed(self, chunk: str) -> None:
+        self.analyzed_chunks.add(chunk)
+        self._append({'event': 'analyzed', 'chunk': chunk}, durable=False)
+
+    def committed(self, sink: str, chunk: str) -> None:
+        self.committed_chunks.setdefault(sink, set()).add(chunk)
+        self._append({'event': 'committed', 'sink': sink, 'chunk': chunk})
+
+    def sink_done(self, sink: str) -> None:
+        self.sinks_done.add(sink)
+        self._append({'event': 'sink_done', 'sink': sink})
+
+    def finish(self) -> None:
+        self.finished = True
+        self._append({'event': 'finished', 'at': time.strftime('%Y-%m-%dT%H:%M:%S')})
+        self.close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
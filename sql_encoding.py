@@ -0,0 +1,121 @@
+"""
+Encoding detection and single-pass decoding of source SQL files.
+
+    encoding = sniff_encoding(data)          # BOM, then a bounded window of bytes
+    text = read_text(path, manifest)         # mmap + one decode, result cached per file
+
+The sniffer looks at the BOM and at a bounded window starting at the first
+non-ASCII byte: valid UTF-8 there means utf-8, anything else is treated as
+gb18030 (a superset of gbk). Detected encodings are kept in a small json
+manifest keyed by path, size and mtime, so unchanged files are never sniffed
+again.
+"""
+import codecs
+import json
+import logging
+import mmap
+import os
+import re
+
+SQL_ENCODING_MANIFEST = os.getenv("SQL_ENCODING_MANIFEST", "sql_encoding_manifest.json")
+SNIFF_WINDOW_BYTES = int(os.getenv("SQL_SNIFF_WINDOW_BYTES", str(64 * 1024)))
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+    (b'\x84\x31\x95\x33', 'gb18030'),
+)
+_NON_ASCII_RE = re.compile(rb'[\x80-\xff]')
+FALLBACK_ENCODING = 'gb18030'
+
+
+def sniff_encoding(data, window: int = SNIFF_WINDOW_BYTES) -> str:
+    """data 为 bytes / mmap 等缓冲区，只检查 BOM 与首个非 ASCII 字节起的 window 字节"""
+    head = bytes(data[:4])
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    match = _NON_ASCII_RE.search(data)
+    if match is None:
+        # 纯 ASCII，utf-8 解码结果相同
+        return 'utf-8'
+    # 首个非 ASCII 字节之前都是 ASCII，窗口从一个完整字符开始
+    sample = bytes(data[match.start():match.start() + window])
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        # final=False：窗口末尾被截断的多字节序列不算错误
+        decoder.decode(sample, final=False)
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+    return 'utf-8'
+
+
+class EncodingManifest:
+    """{path: {size, mtime_ns, encoding}}，文件未变化时复用上次的检测结果"""
+
+    def __init__(self, path: str | None = SQL_ENCODING_MANIFEST):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"编码清单无法读取，将重新检测：{path}（{e}）")
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def get(self, path: str, stat: os.stat_result) -> str | None:
+        entry = self.entries.get(self._key(path))
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return entry.get('encoding')
+        return None
+
+    def set(self, path: str, stat: os.stat_result, encoding: str) -> None:
+        self.entries[self._key(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'encoding': encoding}
+        self.dirty = True
+
+    def save(self) -> None:
+        if not self.path or not self.dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def _decode(buffer, encoding: str) -> tuple[str, str]:
+    """按检测结果解码一次；失败时再试另一候选，最后以 gb18030 替换非法字节"""
+    candidates = [encoding] + [enc for enc in ('utf-8', FALLBACK_ENCODING) if enc != encoding]
+    for candidate in candidates:
+        try:
+            return codecs.decode(buffer, candidate), candidate
+        except UnicodeDecodeError:
+            continue
+    logging.warning(f"无法按 {'/'.join(candidates)} 严格解码，使用 {FALLBACK_ENCODING} 并替换非法字节。")
+    return codecs.decode(buffer, FALLBACK_ENCODING, errors='replace'), FALLBACK_ENCODING
+
+
+def read_text(path: str, manifest: EncodingManifest | None = None) -> str:
+    """内存映射读取并只解码一次"""
+    stat = os.stat(path)
+    if stat.st_size == 0:
+        return ''
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        encoding = manifest.get(path, stat) if manifest is not None else None
+        if encoding is None:
+            encoding = sniff_encoding(mm)
+        text, used = _decode(mm, encoding)
+    if manifest is not None and manifest.get(path, stat) != used:
+        manifest.set(path, stat, used)
+    if '\r' in text:
+        # 与文本模式 open() 一致的换行归一
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
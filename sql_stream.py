@@ -0,0 +1,251 @@
+"""
+Streaming preprocessing for SQL files larger than memory.
+
+    for chunk in iter_file_chunks('sql/huge_dump.sql'):
+        ...
+
+The file is decoded in fixed-size text buffers and pushed through the same
+steps as preprocess_sql / extract_* / split_sql_chunks:
+
+    buffers -> full-width translation -> /* */ removal (state kept across buffers)
+            -> complete lines -> _clean_line (NOLOGGING, '#' lines, quote-aware --)
+            -> segments ending at ';' outside '...' -> INSERT / CTAS regexes
+            -> constant statements dropped -> chunks
+
+Only the current buffer, the current line and the current statement are held
+in memory. Lines are the unit of cleaning, so memory is bounded by the
+longest line rather than the largest statement: a dump written as a single
+line is held whole, though it is still split and segmented in linear time.
+For files whose single quotes are balanced the chunks, statements and line
+numbers are the same as the in-memory path produces.
+
+A stray quote is where the two paths part: the streaming split tracks quote
+parity from the start of the file, while the INSERT / CTAS regexes restart it
+at every statement they match. When the file ends inside a quote, the rest
+after the last ';' is handed to the regexes as one segment (and held in
+memory until then), which recovers the statements the regexes would find
+there; statements around a stray quote that is closed later in the file can
+still be split differently.
+"""
+import logging
+import mmap
+import os
+import re
+
+from main_to_json import (_FULLWIDTH_TRANS, CREATE_TABLE_AS_RE, INSERT_STMT_RE, SQLFLOW_CHAR_LIMIT, _clean_line,
+                          _find_statements, _split_statement, constant_statement_calls,
+                          extract_table_name_from_create, extract_table_name_from_insert)
+from pipeline_metrics import PipelineMetrics
+from sql_encoding import sniff_encoding
+
+SQL_STREAM_BUFFER_CHARS = int(os.getenv("SQL_STREAM_BUFFER_CHARS", str(1024 * 1024)))
+
+_QUOTE_OR_SEMI_RE = re.compile(r"[';]")
+
+
+def iter_text_buffers(path: str, manifest=None, buffer_chars: int = SQL_STREAM_BUFFER_CHARS):
+    """按检测到的编码逐块解码文件（文本模式，换行已归一）"""
+    stat = os.stat(path)
+    if stat.st_size == 0:
+        return
+    encoding = manifest.get(path, stat) if manifest is not None else None
+    if encoding is None:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            encoding = sniff_encoding(mm)
+        if manifest is not None:
+            manifest.set(path, stat, encoding)
+    replaced = False
+    with open(path, 'r', encoding=encoding, errors='replace') as f:
+        while True:
+            buf = f.read(buffer_chars)
+            if not buf:
+                break
+            if not replaced and '\ufffd' in buf:
+                replaced = True
+                logging.warning(f"{path} 含有无法按 {encoding} 解码的字节，已替换。")
+            yield buf
+
+
+def strip_block_comments(buffers):
+    """去除 /* ... */（与 re.sub(r'/\\*.*?\\*/', '', ..., DOTALL) 一致），注释可跨缓冲区
+
+    未闭合的注释在文件结尾原样输出，与正则不匹配时保留原文相同。
+    """
+    carry = ''
+    comment: list[str] | None = None
+    for buf in buffers:
+        text = carry + buf
+        carry = ''
+        pos = 0
+        while True:
+            if comment is not None:
+                end = text.find('*/', pos)
+                if end == -1:
+                    # 末尾的 '*' 可能与下一块的 '/' 组成结束符
+                    keep = 1 if text.endswith('*') and len(text) - 1 >= pos else 0
+                    comment.append(text[pos:len(text) - keep])
+                    carry = text[len(text) - keep:]
+                    break
+                comment = None
+                pos = end + 2
+            else:
+                start = text.find('/*', pos)
+                if start == -1:
+                    keep = 1 if text.endswith('/') and len(text) - 1 >= pos else 0
+                    if len(text) - keep > pos:
+                        yield text[pos:len(text) - keep]
+                    carry = text[len(text) - keep:]
+                    break
+                if start > pos:
+                    yield text[pos:start]
+                # 结束符必须在 '/*' 之后，'/*/' 不算闭合
+                comment = ['/*']
+                pos = start + 2
+    if comment is not None:
+        yield ''.join(comment) + carry
+    elif carry:
+        yield carry
+
+
+def _line_text(parts: list[str]) -> str:
+    text = ''.join(parts)
+    return text.splitlines()[0] if text else text
+
+
+def iter_lines(pieces):
+    """把任意切分的文本重新组装成行（与 str.splitlines 的断行规则一致）
+
+    每块只切分一次，未结束的行以片段列表暂存，长行不会被反复切分。
+    """
+    parts: list[str] = []
+    for piece in pieces:
+        if not piece:
+            continue
+        if parts and parts[-1].endswith('\r'):
+            # 上一块末尾的 '\r' 可能与这一块开头的 '\n' 组成一个换行
+            if piece.startswith('\n'):
+                parts.append('\n')
+                piece = piece[1:]
+            yield _line_text(parts)
+            parts = []
+            if not piece:
+                continue
+        lines = piece.splitlines(keepends=True)
+        for line in lines[:-1]:
+            parts.append(line)
+            yield _line_text(parts)
+            parts = []
+        last = lines[-1]
+        parts.append(last)
+        if last.splitlines() != [last] and not last.endswith('\r'):
+            yield _line_text(parts)
+            parts = []
+    if parts:
+        yield _line_text(parts)
+
+
+def iter_preprocessed_lines(buffers):
+    """流式版 preprocess_sql：产出清理后的非空行"""
+    translated = (buf.translate(_FULLWIDTH_TRANS) for buf in buffers)
+    for raw in iter_lines(strip_block_comments(translated)):
+        cleaned = _clean_line(raw)
+        if cleaned:
+            yield cleaned
+
+
+def iter_segments(lines):
+    """按单引号外的 ';' 切分，产出 (起始行号, 以 ';' 结尾的片段)；行号为清理后文本中的行号
+
+    引号从文件开头起计数；文件在引号内结束时，最后一个 ';' 之后的全部内容作为一个片段产出。
+    """
+    parts: list[str] = []
+    start_line = 1
+    in_quote = False
+    for line_no, line in enumerate(lines, start=1):
+        if not parts:
+            start_line = line_no
+        pos = 0
+        for m in _QUOTE_OR_SEMI_RE.finditer(line):
+            if m.group(0) == "'":
+                in_quote = not in_quote
+            elif not in_quote:
+                parts.append(line[pos:m.end()])
+                yield start_line, ''.join(parts)
+                parts = []
+                start_line = line_no
+                pos = m.end()
+        parts.append(line[pos:] + '\n')
+    if in_quote:
+        # 落单的单引号使其后的 ';' 都算在引号内；正则在这段文本上从下一个 INSERT / CREATE 重新开始匹配，
+        # 因此把剩余内容整体作为最后一个片段交给正则
+        logging.warning(f"第 {start_line} 行起的单引号未闭合，之后的内容按整段重新匹配。")
+        yield start_line, ''.join(parts)
+    # 否则末尾没有 ';' 的内容不会被 INSERT / CTAS 正则匹配，直接丢弃
+
+
+_TYPE_ORDER = {'insert': 0, 'create_table_as': 1}
+
+
+def _in_line_order(items: list[dict]) -> list[dict]:
+    """与 sorted(inserts + creates, key=行号) 一致：同一行内 INSERT 在前，其余保持出现顺序"""
+    return sorted(items, key=lambda item: (item['line_number'], _TYPE_ORDER[item['statement_type']]))
+
+
+def iter_statements(lines):
+    """流式版 extract_insert_statements + extract_create_table_as_statements（按行号排序）
+
+    后续片段从当前片段的最后一行或更靠后的行开始，因此片段结束时，行号更小的语句以及最后一行上的
+    INSERT 都可以输出；只有最后一行上的 CTAS 要等到这一行结束（之后同一行的 INSERT 排在它前面）。
+    """
+    held: list[dict] = []
+    held_line = 0
+    for start_line, segment in iter_segments(lines):
+        end_line = start_line + segment.count('\n')
+        upper = segment.upper()
+        found = []
+        if 'INSERT' in upper or 'CREATE' in upper:
+            found = (_find_statements(segment, INSERT_STMT_RE, extract_table_name_from_insert, 'insert',
+                                      start_line)
+                     + _find_statements(segment, CREATE_TABLE_AS_RE, extract_table_name_from_create,
+                                        'create_table_as', start_line))
+        if end_line == held_line:
+            # 仍在同一行：新语句都在这一行上，INSERT 直接输出，CTAS 继续等待
+            yield from (item for item in found if item['statement_type'] == 'insert')
+            held += [item for item in found if item['statement_type'] != 'insert']
+            continue
+        items = held + found
+        yield from _in_line_order([item for item in items if item['line_number'] < end_line
+                                   or item['statement_type'] == 'insert'])
+        held = [item for item in items if item['line_number'] >= end_line and item['statement_type'] != 'insert']
+        held_line = end_line
+    yield from held
+
+
+def iter_file_chunks(path: str, manifest=None, max_len: int = SQLFLOW_CHAR_LIMIT, metrics=None,
+                     buffer_chars: int = SQL_STREAM_BUFFER_CHARS):
+    """整条流水线的流式入口：逐个产出与 split_source_sql 相同的 chunk"""
+    metrics = metrics or PipelineMetrics()
+    statements = iter_statements(iter_preprocessed_lines(iter_text_buffers(path, manifest, buffer_chars)))
+    count = 0
+    total = 0
+    skipped = 0
+    avoided = 0
+    while True:
+        with metrics.stage('stream_split') as st:
+            item = next(statements, None)
+            if item is None:
+                break
+            calls = constant_statement_calls(item, max_len)
+            if calls:
+                st.add(constant_statements=1, analyzer_calls_avoided=calls)
+                skipped += 1
+                avoided += calls
+                continue
+            pieces = _split_statement(item, max_len)
+            st.add(statements_out=1, chars_out=sum(len(piece) for piece in pieces))
+        count += 1
+        total += len(pieces)
+        yield from pieces
+    if skipped:
+        logging.info(f"{path} 跳过 {skipped} 条仅含常量的语句，省去 {avoided} 次分析器调用。")
+    logging.info(f"{path} 流式拆分：{count} 条语句，{total} 段，每段≤{max_len} 字符。")
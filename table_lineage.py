@@ -0,0 +1,51 @@
+"""
+Table-level lineage rolled up from column-level rows.
+
+    rows = rollup_table_lineage(column_rows)       # 14-column /csv rows or LineageRecord
+    text = format_table_lineage_csv(rows)
+
+One row per (source table, target table, relation type) with the number of
+distinct column pairs behind it. Tables are keyed by db/schema/name, not by
+the per-analysis table ids, so rows of many chunks roll up together. No
+analyzer or JVM is needed, which makes the table CSV free once the column
+rows exist (dlineage.py /outputs, TableLineageCsvSink).
+"""
+import csv
+import io
+
+TABLE_LINEAGE_CSV_HEADER = [
+    'SOURCE_DB', 'SOURCE_SCHEMA', 'SOURCE_TABLE',
+    'TARGET_DB', 'TARGET_SCHEMA', 'TARGET_TABLE',
+    'RELATION_TYPE', 'COLUMN_PAIRS'
+]
+
+
+class TableLineageRollup:
+    def __init__(self):
+        self.pairs: dict[tuple, set] = {}
+
+    def add(self, row) -> None:
+        (src_db, src_schema, _, src_table, _, src_col,
+         tgt_db, tgt_schema, _, tgt_table, _, tgt_col, relation_type) = row[:13]
+        if not src_table or not tgt_table:
+            return
+        key = (src_db, src_schema, src_table, tgt_db, tgt_schema, tgt_table, relation_type)
+        self.pairs.setdefault(key, set()).add((src_col, tgt_col))
+
+    def rows(self) -> list[tuple]:
+        return [key + (len(columns),) for key, columns in sorted(self.pairs.items())]
+
+
+def rollup_table_lineage(rows) -> list[tuple]:
+    rollup = TableLineageRollup()
+    for row in rows:
+        rollup.add(row)
+    return rollup.rows()
+
+
+def format_table_lineage_csv(rows, delimiter: str = ",") -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(TABLE_LINEAGE_CSV_HEADER)
+    writer.writerows(rows)
+    return buffer.getvalue()
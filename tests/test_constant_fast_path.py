@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main_to_json import constant_statement_calls, is_constant_statement
+
+
+def test_bare_dual_and_values_are_constant():
+    assert is_constant_statement("INSERT INTO t SELECT 1, 'a' FROM DUAL;")
+    assert is_constant_statement("INSERT INTO t SELECT 1 FROM DUAL UNION ALL SELECT 2 FROM SYS.DUAL")
+    assert is_constant_statement("INSERT INTO t (a, b) VALUES (1, 'FROM src')")
+
+
+def test_comma_join_after_dual_is_not_constant():
+    assert not is_constant_statement("INSERT INTO t SELECT 1 FROM DUAL, real_tab")
+    assert constant_statement_calls({'sql': "INSERT INTO t SELECT 1 FROM DUAL, real_tab"}) == 0
+
+
+def test_aliased_dual_is_not_constant():
+    sql = "INSERT INTO t SELECT s.a FROM DUAL d, src s WHERE s.id = 1"
+    assert not is_constant_statement(sql)
+    assert constant_statement_calls({'sql': sql}) == 0
+    assert not is_constant_statement("INSERT INTO t SELECT 1 FROM DUAL d")
+
+
+def test_dual_subquery_does_not_hide_real_source():
+    assert not is_constant_statement("INSERT INTO t SELECT (SELECT 1 FROM DUAL) FROM src")
@@ -0,0 +1,173 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lineage_sinks
+from lineage_sinks import DecodedChunk, LineageRecord, MySQLSink
+from run_journal import RunJournal
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if sql.startswith('TRUNCATE'):
+            self.conn.pending.append(('truncate', None))
+        elif sql.startswith('DELETE'):
+            error = self.conn.delete_errors.pop(0) if self.conn.delete_errors else None
+            if error is not None:
+                raise error
+            self.conn.pending.append(('delete', params[0]))
+        else:
+            error = self.conn.errors.get(params[-1])
+            if error is not None:
+                raise error
+            self.conn.pending.append(('insert', params))
+
+    def executemany(self, sql, rows):
+        for params in rows:
+            self.execute(sql, params)
+
+    def close(self):
+        pass
+
+
+class FakeDataError(Exception):
+    pass
+
+
+class FakeOperationalError(Exception):
+    pass
+
+
+class FakeConnection:
+    """事务语义：commit 前的操作只在 pending 中，rollback 丢弃"""
+
+    def __init__(self, rows=None):
+        self.rows = list(rows or [])
+        self.pending = []
+        self.errors = {}
+        self.delete_errors = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        for op, arg in self.pending:
+            if op == 'truncate':
+                self.rows = []
+            elif op == 'delete':
+                self.rows = [row for row in self.rows if row[-1] != arg]
+            else:
+                self.rows.append(arg)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_chunk(name):
+    sql = f"INSERT INTO {name} SELECT a FROM src;\n"
+    record = LineageRecord('', '', '', 'src', '', 'a', '', '', '', name, '', 'a', 'fdd', '')
+    return DecodedChunk(name, 'p', int(name.rsplit('_', 1)[1]), sql, ['SOURCE_DB'], [record], 0)
+
+
+def file_names(conn):
+    return sorted(row[-1] for row in conn.rows)
+
+
+def test_resume_does_not_duplicate_chunks_committed_after_the_journal(tmp_path, monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(lineage_sinks, 'connect_mysql', lambda: conn)
+
+    # 第一次运行：p_1 提交并记入日志，p_2 分析失败，p_3 已提交但日志未写入就中断
+    journal = RunJournal(str(tmp_path / 'run.jsonl'))
+    sink = MySQLSink()
+    sink.resume(journal)
+    sink.open()
+    sink.consume(make_chunk('p_1'))
+    sink.journal = None
+    sink.consume(make_chunk('p_3'))
+    journal.close()
+    assert file_names(conn) == ['p_1.sql', 'p_3.sql']
+
+    # 续跑：重新分析的 p_2 先到，之后才是 p_3
+    journal = RunJournal(str(tmp_path / 'run.jsonl'))
+    sink = MySQLSink()
+    sink.resume(journal)
+    sink.open()
+    for name in ('p_1', 'p_2', 'p_3'):
+        sink.consume(make_chunk(name))
+    journal.close()
+    assert file_names(conn) == ['p_1.sql', 'p_2.sql', 'p_3.sql']
+    assert journal.committed_chunks['mysql'] == {'p_1', 'p_2', 'p_3'}
+
+
+def test_data_error_skips_only_the_bad_row(monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(lineage_sinks, 'connect_mysql', lambda: conn)
+    monkeypatch.setattr(lineage_sinks, 'MYSQL_ROW_ERRORS', (FakeDataError,))
+    sink = MySQLSink()
+    sink.open()
+    conn.errors['p_2.sql'] = FakeDataError('Data too long')
+    for name in ('p_1', 'p_2', 'p_3'):
+        sink.consume(make_chunk(name))
+    assert file_names(conn) == ['p_1.sql', 'p_3.sql']
+
+
+def test_operational_error_leaves_the_chunk_uncommitted(tmp_path, monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(lineage_sinks, 'connect_mysql', lambda: conn)
+    monkeypatch.setattr(lineage_sinks, 'MYSQL_ROW_ERRORS', (FakeDataError,))
+    journal = RunJournal(str(tmp_path / 'run.jsonl'))
+    sink = MySQLSink()
+    sink.resume(journal)
+    sink.open()
+    sink.consume(make_chunk('p_1'))
+    conn.errors['p_2.sql'] = FakeOperationalError('Lock wait timeout exceeded')
+    with pytest.raises(FakeOperationalError):
+        sink.consume(make_chunk('p_2'))
+    journal.close()
+    assert file_names(conn) == ['p_1.sql']
+    assert RunJournal(str(tmp_path / 'run.jsonl')).committed_chunks['mysql'] == {'p_1'}
+
+
+def test_watch_retries_a_file_whose_old_rows_could_not_be_deleted(tmp_path, monkeypatch):
+    from analyzer_backend import StubBackend
+    from lineage_watch import LineageWatcher
+
+    conn = FakeConnection()
+    monkeypatch.setattr(lineage_sinks, 'connect_mysql', lambda: conn)
+    monkeypatch.setattr(lineage_sinks, 'MYSQL_ROW_ERRORS', (FakeDataError,))
+    sql_dir = tmp_path / 'sql'
+    sql_dir.mkdir()
+    source = sql_dir / 'p.sql'
+    source.write_text("INSERT INTO t SELECT a FROM src;\n", encoding='utf-8')
+    watcher = LineageWatcher(str(sql_dir), StubBackend('hive'), result_dir=None, datahub_output=None,
+                             graph_dir=None)
+    watcher.mysql = MySQLSink(truncate=False)
+    watcher.mysql.open()
+    watcher.poll()
+    assert [row[-2] for row in conn.rows] == ["INSERT INTO t SELECT a FROM src;\n"]
+
+    source.write_text("INSERT INTO t SELECT b FROM src;\n", encoding='utf-8')
+    os.utime(source, ns=(1, 1))
+    # 批量插入遇到数据错误，逐行重试前重做的删除失败：整个更新回滚，文件留到下一轮
+    conn.errors['p_1.sql'] = FakeDataError('bad row')
+    conn.delete_errors = [None, FakeOperationalError('gone away')]
+    assert watcher.poll() == []
+    assert [row[-2] for row in conn.rows] == ["INSERT INTO t SELECT a FROM src;\n"]
+
+    conn.errors = {}
+    assert watcher.poll() == [str(source)]
+    assert [row[-2] for row in conn.rows] == ["INSERT INTO t SELECT b FROM src;\n"]
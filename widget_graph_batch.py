@@ -0,0 +1,131 @@
+"""
+Headless batch generation of widget graph json.
+
+All SQL files are analysed inside one warm JVM, the graph json of every input is
+written gzip-compressed into a cache directory keyed by the SQL content, so a
+reload of the widget (or a rerun on unchanged files) reuses the cached result.
+No browser is opened, this can run on servers.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+import dlineage
+
+SQLFLOW_CHAR_LIMIT = int(os.getenv("SQLFLOW_CHAR_LIMIT", "10000"))
+GRAPH_CACHE_DIR = os.getenv("GRAPH_CACHE_DIR", os.path.join("widget", "json", "cache"))
+CACHE_INDEX = "index.json"
+
+
+def _cache_key(sql_text: str, db_type: str, er: bool) -> str:
+    digest = hashlib.sha1()
+    digest.update(f"{db_type}|{'er' if er else 'lineage'}|".encode('utf-8'))
+    digest.update(sql_text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_path_for(sql_file: str, sql_text: str, db_type: str, er: bool = False,
+                   cache_dir: str = GRAPH_CACHE_DIR) -> str:
+    base = os.path.splitext(os.path.basename(sql_file))[0]
+    suffix = 'er' if er else 'graph'
+    key = _cache_key(sql_text, db_type, er)[:16]
+    return os.path.join(cache_dir, f"{base}.{suffix}.{key}.json.gz")
+
+
+def load_cached_graph(path: str):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _analyze_graph(sql_file: str, vendor, er: bool) -> str:
+    DataFlowAnalyzer = dlineage.jpype.JClass("gudusoft.gsqlparser.dlineage.DataFlowAnalyzer")
+    File = dlineage.jpype.JClass("java.io.File")
+    analyzer = DataFlowAnalyzer(File(sql_file), vendor, False)
+    analyzer.setIgnoreTemporaryTable(True)
+    if er:
+        analyzer.getOption().setShowERDiagram(True)
+    analyzer.generateDataFlow()
+    return dlineage.generate_graph_json(vendor, analyzer.getDataFlow(), er=er)
+
+
+def generate_widget_graphs(sql_files: list[str],
+                           db_type: str = 'oracle',
+                           er: bool = False,
+                           cache_dir: str = GRAPH_CACHE_DIR,
+                           force: bool = False) -> dict[str, str]:
+    """为每个 SQL 文件生成 widget 图 json（gzip），返回 {sql_file: cache_file}"""
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, CACHE_INDEX)
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+
+    outputs: dict[str, str] = {}
+    vendor = None
+    reused = 0
+    for sql_file in sql_files:
+        with open(sql_file, 'r', encoding='utf-8', errors='replace') as f:
+            sql_text = f.read()
+        if len(sql_text) > SQLFLOW_CHAR_LIMIT:
+            logging.warning(f"{sql_file} 长度 {len(sql_text)} 超过 {SQLFLOW_CHAR_LIMIT} 字符，跳过。")
+            continue
+        out_path = cache_path_for(sql_file, sql_text, db_type, er=er, cache_dir=cache_dir)
+        if not force and os.path.exists(out_path):
+            reused += 1
+            outputs[sql_file] = out_path
+            continue
+
+        if vendor is None:
+            # JVM 只启动一次，所有文件共用
+            dlineage.start_jvm()
+            TGSqlParser = dlineage.jpype.JClass("gudusoft.gsqlparser.TGSqlParser")
+            vendor = TGSqlParser.getDBVendorByName(db_type)
+        try:
+            graph_json = _analyze_graph(sql_file, vendor, er)
+        except Exception as e:
+            logging.error(f"生成图失败 ({sql_file})：{e}")
+            continue
+
+        tmp_path = out_path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            f.write(graph_json)
+        os.replace(tmp_path, out_path)
+        outputs[sql_file] = out_path
+        logging.info(f"已生成图 json：{out_path}")
+
+    for sql_file, out_path in outputs.items():
+        index[os.path.abspath(sql_file)] = os.path.relpath(out_path, cache_dir)
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    logging.info(f"共处理 {len(outputs)} 个文件，其中 {reused} 个命中缓存。")
+    return outputs
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate widget graph json for many SQL files in one JVM')
+    parser.add_argument('inputs', nargs='+', help='SQL files or directories containing *.sql')
+    parser.add_argument('-t', '--db-type', default='oracle', help='Database vendor, same as dlineage.py /t')
+    parser.add_argument('--er', action='store_true', help='Generate ER diagram json instead of lineage graph')
+    parser.add_argument('-o', '--cache-dir', default=GRAPH_CACHE_DIR, help='Directory for the compressed json')
+    parser.add_argument('--force', action='store_true', help='Regenerate even if a cached result exists')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    files = []
+    for item in args.inputs:
+        if os.path.isdir(item):
+            files.extend(sorted(glob.glob(os.path.join(item, '*.sql'))))
+        else:
+            files.append(item)
+    try:
+        generate_widget_graphs(files, db_type=args.db_type, er=args.er,
+                               cache_dir=args.cache_dir, force=args.force)
+    finally:
+        if dlineage.jpype.isJVMStarted():
+            dlineage.jpype.shutdownJVM()